@@ -0,0 +1,322 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+"""Benchmarks of the WebAPIClient throughput and latency
+
+The benchmarks run against a local stand-in archive server
+(`swh.web.client.tests.server.ArchiveServer`), so they measure the client
+(and the local HTTP stack) rather than the network. Run them with::
+
+   python benchmarks/bench_client.py --output results.json
+
+and compare two runs (e.g. two releases) with::
+
+   python benchmarks/bench_client.py --output new.json --baseline old.json
+
+``--quick`` shrinks every benchmark to a smoke test, ``--only`` selects
+benchmarks by name. The results are a JSON document mapping each benchmark
+to its metrics, along with information about the environment.
+"""
+
+import argparse
+import concurrent.futures
+import datetime
+import importlib.metadata
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from swh.web.client.client import (
+    CONTENT,
+    DIRECTORY,
+    ORIGIN_VISIT,
+    RELEASE,
+    REVISION,
+    SNAPSHOT,
+    WebAPIClient,
+    typify_json,
+)
+from swh.web.client.tests.api_data import API_DATA
+from swh.web.client.tests.api_data_static import KNOWN_SWHIDS
+from swh.web.client.tests.server import ArchiveServer
+
+CONTENT_SWHID = "swh:1:cnt:fe95a46679d128ff167b7c55df5d02356c5a1ae1"
+
+Metrics = Dict[str, Any]
+
+Benchmark = Callable[[bool], Metrics]
+
+# name -> (function, description)
+BENCHMARKS: Dict[str, Tuple[Benchmark, str]] = {}
+
+
+def benchmark(
+    name: str, registry: Dict[str, Tuple[Benchmark, str]] = BENCHMARKS
+) -> Callable[[Benchmark], Benchmark]:
+    """register a benchmark, called with the `quick` flag"""
+
+    def register(func: Benchmark) -> Benchmark:
+        registry[name] = (func, (func.__doc__ or "").strip())
+        return func
+
+    return register
+
+
+def _percentile(values: List[float], ratio: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * ratio), len(values) - 1)]
+
+
+def _hammer(
+    func: Callable[[], Any], count: int, concurrency: int
+) -> Tuple[float, List[float]]:
+    """call `func` `count` times from `concurrency` threads
+
+    return the total duration, and the duration of each call.
+    """
+
+    def timed(i: int) -> float:
+        start = time.perf_counter()
+        func()
+        return time.perf_counter() - start
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        durations = list(executor.map(timed, range(count)))
+        total = time.perf_counter() - start
+    return total, durations
+
+
+def _throughput(
+    func: Callable[[], Any], count: int, concurrencies: List[int]
+) -> Metrics:
+    metrics: Metrics = {}
+    for concurrency in concurrencies:
+        total, durations = _hammer(func, count, concurrency)
+        metrics[f"c{concurrency}"] = {
+            "requests_per_second": count / total,
+            "latency_p50_ms": _percentile(durations, 0.5) * 1000,
+            "latency_p95_ms": _percentile(durations, 0.95) * 1000,
+        }
+    return metrics
+
+
+def _concurrencies(quick: bool) -> List[int]:
+    return [1, 4] if quick else [1, 4, 16, 64]
+
+
+@benchmark("get")
+def bench_get(quick: bool) -> Metrics:
+    """requests/second of `content()` at various concurrencies"""
+    with ArchiveServer() as server:
+        client = WebAPIClient(server.api_url)
+        return _throughput(
+            lambda: client.content(CONTENT_SWHID),
+            count=100 if quick else 2000,
+            concurrencies=_concurrencies(quick),
+        )
+
+
+@benchmark("known")
+def bench_known(quick: bool) -> Metrics:
+    """requests/second of `known()` with 1000 SWHIDs, at various concurrencies"""
+    swhids = sorted(KNOWN_SWHIDS)[:1000]
+    with ArchiveServer() as server:
+        client = WebAPIClient(server.api_url)
+        metrics = _throughput(
+            lambda: client.known(swhids),
+            count=20 if quick else 500,
+            concurrencies=_concurrencies(quick),
+        )
+    for values in metrics.values():
+        values["swhids_per_second"] = values["requests_per_second"] * len(swhids)
+    return metrics
+
+
+@benchmark("typify")
+def bench_typify(quick: bool) -> Metrics:
+    """cost of `typify_json` per object type, in microseconds"""
+    samples = {
+        CONTENT: "content/sha1_git:fe95a46679d128ff167b7c55df5d02356c5a1ae1/",
+        DIRECTORY: "directory/977fc4b98c0e85816348cebd3b12026407c368b6/",
+        REVISION: "revision/aafb16d69fd30ff58afdd69036a26047f3aebdc6/",
+        RELEASE: "release/b9db10d00835e9a43e2eebef2db1d04d4ae82342/",
+        SNAPSHOT: "snapshot/6a3a2cf0b2b90ce7ae1cf0a221ed68035b686f5a/",
+        ORIGIN_VISIT: "origin/https://github.com/NixOS/nixpkgs/visit/latest/",
+    }
+    iterations = 100 if quick else 2000
+    metrics: Metrics = {}
+    for obj_type, key in samples.items():
+        # typify_json updates the objects in place, decode them beforehand
+        objects = [json.loads(API_DATA[key]) for i in range(iterations)]
+        if obj_type == SNAPSHOT:
+            objects = [obj["branches"] for obj in objects]
+        start = time.perf_counter()
+        for obj in objects:
+            typify_json(obj, obj_type)
+        duration = time.perf_counter() - start
+        metrics[obj_type] = {"us_per_object": duration / iterations * 1e6}
+    return metrics
+
+
+@benchmark("snapshot")
+def bench_snapshot(quick: bool) -> Metrics:
+    """time to fetch a large paginated snapshot"""
+    size = 5_000 if quick else 100_000
+    metrics: Metrics = {}
+    with ArchiveServer(page_size=1000) as server:
+        client = WebAPIClient(server.api_url)
+        snp_id = server.add_snapshot(size)
+        for latency in (0.0, 0.01):
+            server.latency = latency
+            start = time.perf_counter()
+            branches = sum(len(page) for page in client.snapshot(f"swh:1:snp:{snp_id}"))
+            duration = time.perf_counter() - start
+            assert branches == size
+            metrics[f"latency_{int(latency * 1000)}ms"] = {
+                "seconds": duration,
+                "branches_per_second": size / duration,
+            }
+    return metrics
+
+
+@benchmark("directory_memory")
+def bench_directory_memory(quick: bool) -> Metrics:
+    """peak memory used to fetch a large directory"""
+    size = 10_000 if quick else 200_000
+    with ArchiveServer() as server:
+        client = WebAPIClient(server.api_url)
+        dir_id = server.add_directory(size)
+        tracemalloc.start()
+        try:
+            start = time.perf_counter()
+            entries = client.directory(f"swh:1:dir:{dir_id}")
+            duration = time.perf_counter() - start
+            __, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    assert len(entries) == size
+    return {
+        "entries": size,
+        "seconds": duration,
+        "peak_bytes": peak,
+        "peak_bytes_per_entry": peak / size,
+    }
+
+
+@benchmark("rate_limit")
+def bench_rate_limit(quick: bool) -> Metrics:
+    """achieved request rate compared to the rate allowed by the server"""
+    limit, window = (100, 2.0) if quick else (1000, 10.0)
+    with ArchiveServer(rate_limit=(limit, window)) as server:
+        client = WebAPIClient(server.api_url)
+        # learn the rate limit of the window
+        client.content(CONTENT_SWHID)
+        server.reset_stats()
+        deadline = time.monotonic() + window * 0.8
+        done = 0
+
+        def worker() -> int:
+            count = 0
+            while time.monotonic() < deadline:
+                client.content(CONTENT_SWHID)
+                count += 1
+            return count
+
+        start = time.monotonic()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+            done = sum(executor.map(lambda i: worker(), range(8)))
+        duration = time.monotonic() - start
+        throttled = server.stats["content"] - done
+    allowed = limit / window
+    achieved = done / duration
+    return {
+        "allowed_per_second": allowed,
+        "achieved_per_second": achieved,
+        "ratio": achieved / allowed,
+        "throttled_requests": throttled,
+    }
+
+
+def _environment() -> Metrics:
+    try:
+        version = importlib.metadata.version("swh.web.client")
+    except importlib.metadata.PackageNotFoundError:
+        version = "unknown"
+    return {
+        "date": datetime.datetime.now(tz=datetime.timezone.utc).isoformat(),
+        "version": version,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+
+
+def _flatten(metrics: Metrics, prefix: str = "") -> Dict[str, float]:
+    flat: Dict[str, float] = {}
+    for key, value in metrics.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(results: Metrics, baseline: Metrics) -> None:
+    """print the relative change of every metric compared to a baseline"""
+    new = _flatten(results["results"])
+    old = _flatten(baseline["results"])
+    print(f"compared to {baseline['environment'].get('version')}:")
+    for key in sorted(new.keys() & old.keys()):
+        if old[key]:
+            change = (new[key] - old[key]) / old[key] * 100
+            print(f"  {key}: {old[key]:.4g} -> {new[key]:.4g} ({change:+.1f}%)")
+
+
+def run(
+    benchmarks: Dict[str, Tuple[Benchmark, str]],
+    description: str,
+    argv: Optional[List[str]] = None,
+) -> int:
+    """command line entry point running some registered benchmarks"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare with the results of this file")
+    parser.add_argument("--quick", action="store_true", help="smaller benchmarks")
+    parser.add_argument(
+        "--only", action="append", choices=sorted(benchmarks), help="run only these"
+    )
+    args = parser.parse_args(argv)
+
+    results: Metrics = {"environment": _environment(), "results": {}}
+    for name, (func, description) in benchmarks.items():
+        if args.only and name not in args.only:
+            continue
+        print(f"{name}: {description}", file=sys.stderr)
+        metrics = func(args.quick)
+        results["results"][name] = metrics
+        for key, value in sorted(_flatten(metrics).items()):
+            print(f"  {key}: {value:.4g}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        print()
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    return run(BENCHMARKS, __doc__.splitlines()[0], argv)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
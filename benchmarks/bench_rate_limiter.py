@@ -0,0 +1,112 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+"""Benchmarks of the rate limit enforcer accuracy and overhead
+
+The enforcer is driven in virtual time (see
+`swh.web.client.tests.rate_limit_simulation`), so that hours of pacing for
+thousands of clients take seconds, and the CPU time measured is the enforcer
+own overhead. Run them with::
+
+   python benchmarks/bench_rate_limiter.py --output results.json
+
+The options are the same as the ones of ``bench_client.py``.
+"""
+
+import random
+import sys
+from typing import Dict, List, Optional, Tuple
+
+from bench_client import Benchmark, Metrics, benchmark, run
+
+from swh.web.client.tests.rate_limit_simulation import Simulation
+
+BENCHMARKS: Dict[str, Tuple[Benchmark, str]] = {}
+
+# the example of the `_RateLimitInfo.setup_free_token` docstring:
+# (number of requests, seconds needed to issue them)
+DOCUMENTED_CURVE = [
+    (1, 0.0),
+    (10, 0.0),
+    (11, 0.66),
+    (15, 3.33),
+    (20, 6.66),
+    (50, 26.66),
+    (100, 60.0),
+]
+
+
+@benchmark("pacing", BENCHMARKS)
+def bench_pacing(quick: bool) -> Metrics:
+    """pacing curve compared to the one documented, in seconds"""
+    sim = Simulation()
+    client = sim.add_client(demand=100, limit=100, remaining=100, window=60)
+    sim.run()
+    metrics: Metrics = {}
+    for count, documented in DOCUMENTED_CURVE:
+        duration = client.duration(count)
+        metrics[f"requests_{count}"] = {
+            "seconds": duration,
+            "error": duration - documented,
+        }
+    return metrics
+
+
+def _overhead(sim: Simulation, expected: int) -> Metrics:
+    cpu = sim.run()
+    issued = sum(client.issued for client in sim.clients)
+    batches = sum(client.batches for client in sim.clients)
+    return {
+        "clients": len(sim.clients),
+        "tokens": issued,
+        "accuracy": issued / expected,
+        "tokens_per_batch": issued / max(batches, 1),
+        "virtual_seconds": sim.clock.monotonic(),
+        "cpu_seconds": cpu,
+        "cpu_us_per_token": cpu / max(issued, 1) * 1e6,
+    }
+
+
+@benchmark("many_clients", BENCHMARKS)
+def bench_many_clients(quick: bool) -> Metrics:
+    """enforcer overhead with many clients joining over an hour"""
+    count = 100 if quick else 2000
+    limit, window = 1200, 3600.0
+    rng = random.Random(0)
+    sim = Simulation()
+    expected = 0
+    for i in range(count):
+        # half of the budget left, some clients want more than that
+        remaining = limit // 2
+        demand = rng.randrange(remaining // 2, remaining * 2)
+        sim.add_client(
+            demand,
+            limit,
+            remaining,
+            window=rng.uniform(window / 2, window),
+            start=rng.uniform(0, window / 2),
+            record=False,
+        )
+        expected += min(demand, remaining)
+    return _overhead(sim, expected)
+
+
+@benchmark("generous", BENCHMARKS)
+def bench_generous(quick: bool) -> Metrics:
+    """enforcer overhead with generous rate limits, tokens granted in batches"""
+    clients = 2 if quick else 20
+    limit = 1_000_000
+    sim = Simulation()
+    for i in range(clients):
+        sim.add_client(limit, limit, limit, window=60.0, record=False)
+    return _overhead(sim, clients * limit)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    return run(BENCHMARKS, __doc__.splitlines()[0], argv)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
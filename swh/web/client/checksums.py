@@ -0,0 +1,99 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+"""Verification of the contents downloaded from the archive
+
+The checksums are the ones of the ``checksums`` field of the contents in the
+Web API (hexadecimal strings), the ``sha1_git`` one being the object id of
+their SWHID.
+"""
+
+from typing import Dict, Iterable, Iterator, Optional
+
+from swh.model.hashutil import DEFAULT_ALGORITHMS, MultiHash
+
+# hashes computed when verifying a content
+VERIFIED_HASHES = frozenset({"sha1", "sha1_git", "sha256"})
+
+
+class ChecksumMismatch(ValueError):
+    """Downloaded data do not match the checksums of the archive"""
+
+
+def _check(what: str, actual: Dict[str, str], expected: Dict[str, str]) -> None:
+    """raise ChecksumMismatch if a hash in `actual` differs from `expected`"""
+    mismatches = sorted(
+        name for name, value in expected.items() if actual.get(name, value) != value
+    )
+    if mismatches:
+        raise ChecksumMismatch(f"{what}: {', '.join(mismatches)} mismatch")
+
+
+def _verify_file(path: str, checksums: Dict[str, str]) -> None:
+    """check the content of a file against the checksums of the archive"""
+    expected = {k: v for k, v in checksums.items() if k in DEFAULT_ALGORITHMS}
+    actual = MultiHash.from_path(path, hash_names=set(expected)).hexdigest()
+    _check(path, actual, expected)
+
+
+class VerifyingStream:
+    """Iterate over the chunks of a content, verifying them at the end
+
+    The sha1_git (which depends on the `length` of the content), sha1 and
+    sha256 of the chunks are computed while they are yielded, along with any
+    other hash of `checksums`. Once the last chunk is yielded, the stream
+    raises :exc:`ChecksumMismatch` if the size of the chunks is not `length`
+    or if a hash differs from the expected one in `checksums`.
+
+    >>> data = b"hello\\n"
+    >>> sha1_git = "ce013625030ba8dba906f756967f9e9ca394464a"
+    >>> b"".join(VerifyingStream([data[:3], data[3:]], 6, {"sha1_git": sha1_git}))
+    b'hello\\n'
+    >>> b"".join(VerifyingStream([b"hell0\\n"], 6, {"sha1_git": sha1_git}))
+    Traceback (most recent call last):
+      ...
+    swh.web.client.checksums.ChecksumMismatch: content: sha1_git mismatch
+    """
+
+    def __init__(
+        self,
+        chunks: Iterable[bytes],
+        length: int,
+        checksums: Dict[str, str],
+        name: str = "content",
+    ):
+        self._chunks = chunks
+        self.length = length
+        self.checksums = {k: v for k, v in checksums.items() if k in DEFAULT_ALGORITHMS}
+        self.name = name
+        self._multihash = MultiHash(VERIFIED_HASHES | set(self.checksums), length)
+        self._size = 0
+        self._digests: Optional[Dict[str, str]] = None
+
+    def __iter__(self) -> Iterator[bytes]:
+        for chunk in self._chunks:
+            self._multihash.update(chunk)
+            self._size += len(chunk)
+            yield chunk
+        self.verify()
+
+    def update(self, chunk: bytes) -> None:
+        """account for a chunk of the content obtained by other means"""
+        self._multihash.update(chunk)
+        self._size += len(chunk)
+
+    def verify(self) -> None:
+        """check the chunks seen so far form the whole expected content"""
+        if self._size != self.length:
+            raise ChecksumMismatch(
+                f"{self.name}: got {self._size} bytes, expected {self.length}"
+            )
+        _check(self.name, self.hexdigest(), self.checksums)
+
+    def hexdigest(self) -> Dict[str, str]:
+        """return the hashes of the chunks, once all of them were seen"""
+        if self._digests is None:
+            self._digests = self._multihash.hexdigest()
+        return self._digests
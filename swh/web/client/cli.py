@@ -15,6 +15,7 @@ from swh.auth.cli import auth as auth_cli
 from swh.auth.cli import generate_token as auth_generate_token
 from swh.auth.cli import revoke_token as auth_revoke_token
 from swh.core.cli import swh as swh_cli_group
+from swh.web.client.coordinator import DEFAULT_PORT
 
 CONTEXT_SETTINGS = dict(help_option_names=["-h", "--help"])
 
@@ -26,6 +27,11 @@ DEFAULT_CONFIG_PATH = os.environ.get(
 DEFAULT_CONFIG: Dict[str, Any] = {
     "api_url": "https://archive.softwareheritage.org/api/1",
     "bearer_token": None,
+    # persist the rate limit information received, to pace the next runs
+    "persist_rate_limit": False,
+    # `[requests, seconds]` budget used until the server sends rate limit
+    # information
+    "static_rate_limit": None,
 }
 
 
@@ -69,8 +75,21 @@ def web(ctx: Context, config_file: str):
         )
         conf = DEFAULT_CONFIG
 
+    client_args: Dict[str, Any] = {}
+    if conf.get("persist_rate_limit"):
+        from swh.web.client.rate_limit import RateLimitInfoStore
+
+        client_args["rate_limit_store"] = RateLimitInfoStore.for_api(
+            conf["api_url"], conf["bearer_token"]
+        )
+    if conf.get("static_rate_limit"):
+        requests_count, duration = conf["static_rate_limit"]
+        client_args["static_rate_limit"] = (int(requests_count), float(duration))
+
     ctx.ensure_object(dict)
-    ctx.obj["client"] = WebAPIClient(conf["api_url"], conf["bearer_token"])
+    ctx.obj["client"] = WebAPIClient(
+        conf["api_url"], conf["bearer_token"], **client_args
+    )
 
 
 @web.command(name="search")
@@ -193,6 +212,35 @@ def submit_request(ctx, delimiter: str) -> None:
     print(json.dumps(processed_origins))
 
 
+@web.command(name="rate-limit-coordinator")
+@click.option(
+    "--host",
+    default="localhost",
+    show_default=True,
+    help="address to listen on",
+)
+@click.option(
+    "--port",
+    type=int,
+    default=DEFAULT_PORT,
+    show_default=True,
+    help="port to listen on",
+)
+def rate_limit_coordinator(host: str, port: int) -> None:
+    """Run a rate limit coordinator server
+
+    Clients of several hosts sharing a bearer token can pace their requests
+    against a single rate limit budget by using this server through
+    ``swh.web.client.coordinator.TCPRateLimitBackend``.
+    """
+    import logging
+
+    from swh.web.client.coordinator import serve
+
+    logging.basicConfig(level=logging.INFO)
+    serve(host, port)
+
+
 def _forward_context(ctx: Context, *args, **kwargs):
     ctx.forward(*args, **kwargs)
 
@@ -27,23 +27,40 @@ conversions and pagination.
    next(cli.snapshot('swh:1:snp:cabcc7d7bf639bbe1cc3b41989e1806618dd5764'))
 
 """
+import collections
 import concurrent.futures
+import contextlib
+import contextvars
 from datetime import datetime
+import functools
 import heapq
+import io
+import json
 import logging
+import os
 import queue
+import re
+import shutil
+import stat
+import tarfile
+import tempfile
 import threading
-import time
 from typing import (
+    IO,
     Any,
     Callable,
     Collection,
+    Deque,
     Dict,
     Iterable,
     Iterator,
     List,
     Optional,
+    Pattern,
+    Sequence,
+    Set,
     Tuple,
+    TypeVar,
     Union,
 )
 from urllib.parse import urlparse
@@ -52,11 +69,43 @@ import weakref
 import attr
 import dateutil.parser
 import requests
+import requests.adapters
 import requests.status_codes
 
 from swh.model.hashutil import hash_to_bytes, hash_to_hex
 from swh.model.swhids import CoreSWHID, ObjectType
+from swh.web.client.checksums import ChecksumMismatch, VerifyingStream, _verify_file
 from swh.web.client.cli import DEFAULT_CONFIG
+from swh.web.client.clock import SYSTEM_CLOCK, Clock, VirtualClock
+from swh.web.client.metrics import (
+    NULL_METRICS_SINK,
+    RATE_LIMIT_WAIT_METRIC,
+    REQUEST_DURATION_METRIC,
+    REQUESTS_METRIC,
+    RESPONSE_BYTES_METRIC,
+    RETRIES_METRIC,
+    MetricsSink,
+    endpoint_family,
+)
+from swh.web.client.rate_limit import (
+    RATE_LIMIT_DEFAULT_BUCKET,
+    RateLimitBackend,
+    RateLimitInfoStore,
+    RateLimitStatus,
+    RateLimitTimeout,
+    _to_datetime,
+)
+from swh.web.client.raw import DEFAULT_CHUNK_SIZE, RawContent
+from swh.web.client.scan import LocalObject, ScannedObject, hash_tree, iter_subtree
+from swh.web.client.tracing import (
+    HTTP_SPAN,
+    JSON_DECODE_SPAN,
+    RATE_LIMIT_WAIT_SPAN,
+    TYPIFY_SPAN,
+    Tracer,
+    default_tracer,
+    traced,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -79,6 +128,32 @@ ORIGIN = "origin"
 _1_SECOND = 1_000_000_000
 
 
+# Priority of a request when competing for rate limiting tokens.
+#
+# When the rate limit budget is tight, requests with a more urgent priority
+# get the tokens first. (see `_PrioritySemaphore` for details)
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_NORMAL = "normal"
+PRIORITY_BULK = "bulk"
+
+# lanes order, from the most urgent to the least urgent
+_PRIORITY_LANES = (PRIORITY_INTERACTIVE, PRIORITY_NORMAL, PRIORITY_BULK)
+
+# The rate limit buckets paced on their own budget, as `(name, pattern)` pairs.
+# The first pattern matching the query (relative to the API URL) selects the
+# bucket of a request, other requests use `RATE_LIMIT_DEFAULT_BUCKET`.
+DEFAULT_RATE_LIMIT_BUCKETS: Tuple[Tuple[str, str], ...] = (
+    ("vault", r"vault/"),
+    ("save", r"origin/save/"),
+    ("graph", r"graph/"),
+)
+
+# priority set through the `WebAPIClient.priority` context manager
+_current_priority: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "swh_web_client_priority", default=None
+)
+
+
 class _RateLimitInfo:
     """Object that holds rate limit information and can compute delay
 
@@ -91,6 +166,9 @@ class _RateLimitInfo:
     limit:         maximum number of requests in the rate limit window
     remaining:     number of remaining requestss
     reset_date:    date of rate limit window reset (second since epoch)
+    seeded:        True if the information does not come from the server
+                   response but from a previous run or the configuration
+                   (any information from the server replaces it)
 
     reset_date_ns: date of rate limit window reset (nanoseconds since epoch)
     wait_ns:       ideal number of nanoseconds to wait between each request.
@@ -110,6 +188,10 @@ class _RateLimitInfo:
     >>> # the later window replace the older window
     >>> assert newer.replacing(old)
     >>> assert newer.replacing(new)
+    >>> # server information always replace seeded information
+    >>> seed = _RateLimitInfo(42, 44, 1000, 10, reset * 3, seeded=True)
+    >>> assert old.replacing(seed)
+    >>> assert not seed.replacing(old)
     >>> ### test delay logic
     >>> # with a full budget
     >>> full = _RateLimitInfo(42, 50, 1000, 1000, reset)
@@ -134,12 +216,14 @@ class _RateLimitInfo:
         limit: int,
         remaining: int,
         reset: float,
+        seeded: bool = False,
     ):
         self.start = start
         self.end = end
         self.limit = limit
         self.remaining = remaining
         self.reset_date = reset
+        self.seeded = seeded
 
         self.free_token = 0
 
@@ -194,7 +278,12 @@ class _RateLimitInfo:
         - `self` is about a later rate limiting windows than `other`
         - `self` is about the same window but requires a significantly longer
                  wait time.
+
+        Information from the server always replaces seeded information (and
+        is never replaced by it).
         """
+        if other.seeded != self.seeded:
+            return other.seeded
         if other.reset_date != self.reset_date:
             # the one with a later reset date is likely more up to date.
             return other.reset_date < self.reset_date
@@ -247,22 +336,262 @@ class _RateLimitInfo:
         self.__dict__.pop("wait_ns", None)
 
 
+# minimal delay between two batches of tokens granted to the same client.
+#
+# With a generous rate limit, a token is due every few nanoseconds. Rather than
+# waking up that often, the enforcer grants all the tokens due since the last
+# batch at once.
+_MIN_GRANT_INTERVAL_NS = _1_SECOND // 1000
+
+
+@attr.s(slots=True)
+class _BucketPacing:
+    """Pacing state of one bucket, managed by _RateLimitEnforcer
+
+    The tokens of a bucket are generated at a constant pace: a new token is due
+    every `rate_limit.wait_ns` since the start of the pacing. They are granted
+    in batches, when some thread waits for them (or when a thread needs
+    several tokens at once, see `InProcessRateLimitBackend.acquire`).
+
+    All dates are from the monotonic clock of the enforcer (see
+    `swh.web.client.clock.Clock.monotonic_ns`).
+    """
+
+    # the bucket it applies to
+    bucket_ref = attr.ib(type=weakref.ref)
+    # the rate limit this try to enforce
+    rate_limit = attr.ib(type=_RateLimitInfo)
+    # end of the rate limit window
+    reset_date = attr.ib(type=int)
+    # date up to which tokens have been granted to the bucket
+    last_grant = attr.ib(type=int)
+    # date of the next event scheduled for this bucket (if any)
+    next_event = attr.ib(type=Optional[int], default=None)
+    # protect `last_grant`, tokens are granted outside of the enforcer thread
+    # too.
+    lock = attr.ib(factory=threading.Lock, eq=False, repr=False)
+
+    def grant_due_tokens(self, bucket: "_RateLimitBucket", current: int) -> None:
+        """grant the bucket all the tokens generated up to `current`"""
+        wait_ns = self.rate_limit.wait_ns
+        current = min(current, self.reset_date)
+        with self.lock:
+            count = (current - self.last_grant) // wait_ns
+            if count > 0:
+                self.last_grant += count * wait_ns
+                bucket._add_rate_limit_tokens(count)
+
+    def due_tokens(self, current: int) -> int:
+        """number of tokens generated but not granted yet at `current`"""
+        current = min(current, self.reset_date)
+        return max((current - self.last_grant) // self.rate_limit.wait_ns, 0)
+
+    def next_date(self, bucket: "_RateLimitBucket", current: int) -> int:
+        """date at which the enforcer should next handle this bucket
+
+        If threads are waiting for tokens, this is the date of the next token
+        (or batch of tokens). Otherwise, tokens simply accumulate and nothing
+        needs to happen until the end of the window (or until a thread starts
+        waiting, see `_RateLimitEnforcer.notify_waiting`).
+        """
+        if bucket._rate_limit_waiters():
+            next_grant = self.last_grant + self.rate_limit.wait_ns
+            next_grant = max(next_grant, current + _MIN_GRANT_INTERVAL_NS)
+            return min(next_grant, self.reset_date)
+        return self.reset_date
+
+
 @attr.s(slots=True, order=True)
 class _RateLimitEvent:
-    """Represent a date at which a rate limiting action is needed for a client
+    """Represent a date at which a rate limiting action is needed for a bucket
 
     This is used by _RateLimitEnforcer to schedule actions.
     """
 
-    # when is this event due, (from time.monotonic_ns())
+    # when is this event due, (from the monotonic clock of the enforcer)
     date = attr.ib(type=int)
-    # the rate limit this try to enforce
-    rate_limit = attr.ib(type=_RateLimitInfo)
-    # the client it applies too
-    client_ref = attr.ib(type=weakref.ref)
+    # the pacing state it applies to
+    pacing = attr.ib(type=_BucketPacing, eq=False, order=False)
+
+
+_ALL_BUCKET_TYPE = weakref.WeakKeyDictionary["_RateLimitBucket", _BucketPacing]
+
+
+class _PriorityWaiter:
+    """A thread waiting for tokens of a _PrioritySemaphore"""
+
+    __slots__ = ("cond", "count", "granted", "skipped")
+
+    def __init__(self, lock: threading.Lock, count: int):
+        self.cond = threading.Condition(lock)
+        # number of tokens this thread waits for
+        self.count = count
+        self.granted = False
+        # number of grants to other waiters while this one was first in line
+        # in its lane.
+        self.skipped = 0
+
+
+class _PrioritySemaphore:
+    """A Semaphore granting its tokens to the most urgent waiters first
+
+    Waiters are sorted in lanes, one per priority (see `_PRIORITY_LANES`).
+    Within a lane, tokens are granted in arrival order. A released token
+    goes to the first waiter of the most urgent non-empty lane.
 
+    To protect less urgent requests from starvation, the first waiter of a
+    lane is not skipped more than `STARVATION_LIMIT` times: once that limit
+    is reached it gets the next token, whatever the other lanes contains.
 
-_ALL_CLIENT_TYPE = weakref.WeakKeyDictionary["WebAPIClient", _RateLimitInfo]
+    Multiple tokens can be acquired atomically. While the waiter next in line
+    is short of tokens, the first waiters that need fewer tokens are served
+    instead, up to `STARVATION_LIMIT` times: it then keeps the tokens released
+    until it has enough of them.
+
+    Once `open`, the semaphore grants any number of tokens to every waiter,
+    current or future.
+
+    If set, `on_wait` is called (with the internal lock held) when a thread
+    starts waiting while no other thread was waiting.
+
+    >>> sem = _PrioritySemaphore(1)
+    >>> sem.acquire(PRIORITY_BULK)
+    True
+    >>> sem.acquire(PRIORITY_BULK, timeout=0.01)
+    False
+    >>> sem.release(2)
+    >>> sem.value
+    2
+    >>> sem.acquire(PRIORITY_BULK, count=3, timeout=0.01)
+    False
+    >>> sem.acquire(PRIORITY_BULK, count=2)
+    True
+    >>> sem.open()
+    >>> sem.acquire(PRIORITY_BULK, count=3)
+    True
+    """
+
+    # how many tokens can be granted to more urgent lanes before the first
+    # waiter of a lane get served.
+    STARVATION_LIMIT = 10
+
+    def __init__(self, value: int = 0, on_wait: Optional[Callable[[], None]] = None):
+        self._lock = threading.Lock()
+        self._value = value
+        self._on_wait = on_wait
+        self._opened = False
+        self._lanes: Dict[str, Deque[_PriorityWaiter]] = {
+            p: collections.deque() for p in _PRIORITY_LANES
+        }
+
+    @property
+    def value(self) -> int:
+        """number of tokens currently available"""
+        return self._value
+
+    @property
+    def waiting(self) -> int:
+        """number of threads currently waiting for tokens"""
+        return sum(len(lane) for lane in self._lanes.values())
+
+    def acquire(
+        self,
+        priority: str = PRIORITY_NORMAL,
+        blocking: bool = True,
+        timeout: Optional[float] = None,
+        count: int = 1,
+    ) -> bool:
+        """acquire `count` tokens, waiting for them with the given priority
+
+        Return True if the tokens were acquired, False otherwise. (same
+        semantic as `threading.Semaphore.acquire`)
+        """
+        lane = self._lanes[priority]
+        with self._lock:
+            if self._opened:
+                return True
+            if self._value >= count and not self.waiting:
+                self._value -= count
+                return True
+            if not blocking:
+                return False
+            if self._on_wait is not None and not self.waiting:
+                self._on_wait()
+            waiter = _PriorityWaiter(self._lock, count)
+            lane.append(waiter)
+            # tokens may be available, e.g. for an urgent waiter skipping
+            # less urgent ones
+            self._dispatch()
+            waiter.cond.wait_for(lambda: waiter.granted, timeout)
+            if not waiter.granted:
+                # timed out, the tokens it was waiting for might be usable by
+                # other waiters.
+                lane.remove(waiter)
+                self._dispatch()
+                return False
+            return True
+
+    def release(self, n: int = 1) -> None:
+        """release `n` tokens, granting them to waiters in priority order"""
+        with self._lock:
+            self._value += n
+            self._dispatch()
+
+    def open(self) -> None:
+        """grant their tokens to all waiters, and to all future ones"""
+        with self._lock:
+            self._opened = True
+            for lane in self._lanes.values():
+                while lane:
+                    self._grant(lane, lane[0])
+
+    def _dispatch(self) -> None:
+        """grant available tokens to waiters (lock must be held)"""
+        while True:
+            lane = self._next_lane()
+            if lane is None:
+                break
+            waiter = lane[0]
+            if waiter.count > self._value:
+                if waiter.skipped >= self.STARVATION_LIMIT:
+                    break
+                # let a waiter needing fewer tokens pass
+                found = self._first_servable()
+                if found is None:
+                    break
+                lane, waiter = found
+            heads = [other[0] for other in self._lanes.values() if other]
+            self._value -= waiter.count
+            self._grant(lane, waiter)
+            for head in heads:
+                if head is not waiter:
+                    head.skipped += 1
+
+    def _grant(self, lane: Deque[_PriorityWaiter], waiter: _PriorityWaiter) -> None:
+        """wake `waiter` up with its tokens (lock must be held)"""
+        lane.remove(waiter)
+        waiter.granted = True
+        waiter.cond.notify()
+
+    def _first_servable(
+        self,
+    ) -> Optional[Tuple[Deque[_PriorityWaiter], _PriorityWaiter]]:
+        """return the most urgent waiter the available tokens suffice for"""
+        for lane in self._lanes.values():
+            for waiter in lane:
+                if waiter.count <= self._value:
+                    return lane, waiter
+        return None
+
+    def _next_lane(self) -> Optional[Deque[_PriorityWaiter]]:
+        """return the lane whose first waiter is next in line"""
+        heads = [lane for lane in self._lanes.values() if lane]
+        if not heads:
+            return None
+        for lane in heads[1:]:
+            if lane[0].skipped >= self.STARVATION_LIMIT:
+                return lane
+        return heads[0]
 
 
 # a pair of Semaphore: `(available, waiting)`
@@ -270,102 +599,181 @@ _ALL_CLIENT_TYPE = weakref.WeakKeyDictionary["WebAPIClient", _RateLimitInfo]
 # `available`:
 #   hold one token for each request we can currently make while respecting the
 #   rate limit. It is filled in the background by the _RateLimitEnforcer`
-#   thread.
+#   thread. Tokens are granted to the most urgent requests first (see
+#   `_PrioritySemaphore`).
 # `waiting`:
 #   hold one token for each request currently trying to acquire a "available"
 #   token. These tokens are added and removed by the code doing the request.
 #   (and ultimately by the `_RateLimitEnforcer` thread through
-#   WebAPIClient._clear_rate_limit_tokens)
-_RateLimitTokens = Tuple[threading.Semaphore, threading.Semaphore]
+#   _RateLimitBucket._clear_rate_limit_tokens)
+_RateLimitTokens = Tuple[_PrioritySemaphore, threading.Semaphore]
 
 
 class _RateLimitEnforcer:
     """process rate limiting information into rate limiting token
 
-    This object is meant to be run forever in a daemon thread. That daemon
-    thread is started by the `_RateLimitEnforcer._get_limiter` class method when
-    needed.
+    This object runs in a daemon thread. That daemon thread is started by the
+    `_RateLimitEnforcer._get_limiter` class method when needed, and stops
+    once no bucket is rate limited anymore.
 
     The WebAPIClient send the rate limiting information they receive from the
     server into the `feed` Queue they get from that same `_get_limiter` class
     method, using the `new_info` class method.
 
-    This function process these rate limiting information and slowly issue
-    "available request" token to a `threading.Semaphore` instance at the
+    This function process these rate limiting information and issue
+    "available request" token to a `_PrioritySemaphore` instance at the
     appropriate rate.  These "available request" token are consumed by request,
     practically reducing the rate of requests.
+
+    The enforcer is event driven: tokens are computed from the elapsed time
+    (see `_BucketPacing`) and granted in batches, only when some threads wait
+    for them. The thread does not wake up when there is nothing to do.
     """
 
-    _queue: Optional[queue.Queue] = None
+    _queue: Optional[queue.SimpleQueue] = None
     _limiter: Optional["_RateLimitEnforcer"] = None
     _limiter_thread = None  # not really needed, but lets keep it around.
     _limiter_lock = threading.Lock()
 
     @classmethod
-    def new_info(cls, client: "WebAPIClient", info: _RateLimitInfo) -> None:
-        """pass new _RateLimitInfo from client to the _RateLimitEnforcer"""
-        feed = cls._get_limiter()
-        feed.put((client, info))
+    def new_info(cls, bucket: "_RateLimitBucket", info: _RateLimitInfo) -> None:
+        """pass new _RateLimitInfo for a bucket to the _RateLimitEnforcer"""
+        with cls._limiter_lock:
+            feed = cls._get_limiter()
+            feed.put((bucket, info))
 
     @classmethod
-    def current_rate_limit_delay(cls, client: "WebAPIClient") -> float:
-        """return the current rate limit delay for this Client (in second)"""
-        limiter = cls._limiter
-        if limiter is None:
-            return 0.0
-        rate_limit = limiter._all_clients.get(client)
-        if rate_limit is None:
+    def notify_waiting(cls, bucket_ref: weakref.ref) -> None:
+        """signal that some threads started waiting for tokens of a bucket
+
+        The _RateLimitEnforcer then grants the tokens due to that bucket and
+        keeps granting new ones while threads are waiting.
+        """
+        bucket = bucket_ref()
+        if bucket is None:
+            return
+        with cls._limiter_lock:
+            feed = cls._get_limiter()
+            feed.put((bucket, None))
+
+    @classmethod
+    def _reset_after_fork(cls) -> None:
+        """forget the enforcer of the parent process (see `_after_fork_in_child`)
+
+        Its thread does not exist in the child process, and its lock might
+        have been held by some other thread at the time of the fork.
+        """
+        cls._queue = None
+        cls._limiter = None
+        cls._limiter_thread = None
+        cls._limiter_lock = threading.Lock()
+
+    def pacing(self, bucket: "_RateLimitBucket") -> Optional[_BucketPacing]:
+        """return the current pacing state of a bucket, if rate limited"""
+        return self._all_buckets.get(bucket)
+
+    def grant_due_tokens(self, bucket: "_RateLimitBucket") -> None:
+        """grant a bucket the tokens due, without waiting for the enforcer"""
+        pacing = self._all_buckets.get(bucket)
+        if pacing is not None:
+            pacing.grant_due_tokens(bucket, self._clock.monotonic_ns())
+
+    def due_tokens(self, bucket: "_RateLimitBucket") -> int:
+        """return the number of tokens due to a bucket but not granted yet"""
+        pacing = self._all_buckets.get(bucket)
+        if pacing is None:
+            return 0
+        return pacing.due_tokens(self._clock.monotonic_ns())
+
+    def current_rate_limit_delay(self, bucket: "_RateLimitBucket") -> float:
+        """return the current rate limit delay for this bucket (in second)"""
+        pacing = self._all_buckets.get(bucket)
+        if pacing is None:
             return 0.0
-        wait_ns = rate_limit.wait_ns
+        wait_ns = pacing.rate_limit.wait_ns
         if wait_ns == 1:
             return 0.0
-        return max(rate_limit.wait_ns / _1_SECOND, 0.0)
+        return max(wait_ns / _1_SECOND, 0.0)
 
     @classmethod
-    def _get_limiter(cls) -> queue.Queue:
+    def _get_limiter(cls) -> queue.SimpleQueue:
         """return the current queue that gather rate limit information
 
         That function will initialize that Queue and the associated daemon thread
-        the first time it is called.
+        when needed. It must be called with `_limiter_lock` held.
         """
         if cls._queue is None:
-            with cls._limiter_lock:
-                if cls._queue is None:
-                    cls._queue = queue.Queue()
-                    cls._limiter = cls(cls._queue)
-                    cls._limiter_thread = threading.Thread(
-                        target=cls._limiter._run_forever,
-                        name=f"{__name__}._RateLimitEnforcer.run",
-                        daemon=True,
-                    )
-                    cls._limiter_thread.start()
+            cls._queue = queue.SimpleQueue()
+            cls._limiter = cls(cls._queue)
+            cls._limiter_thread = threading.Thread(
+                target=cls._limiter._run,
+                name=f"{__name__}._RateLimitEnforcer.run",
+                daemon=True,
+            )
+            cls._limiter_thread.start()
         return cls._queue
 
-    def __init__(self, feed: queue.Queue):
-        self._feed: queue.Queue = feed
-        # a heap of _RateLimitInfo
+    def __init__(self, feed: queue.SimpleQueue, clock: Clock = SYSTEM_CLOCK):
+        # The feed is a SimpleQueue because it is fed from weakref callbacks
+        # (see `_bucket_gone`) that might run at any point.
+        self._feed: queue.SimpleQueue = feed
+        # The clock used for pacing. With a `VirtualClock`, the enforcer is
+        # not run in a thread, see `InProcessRateLimitBackend`.
+        self._clock = clock
+        # a heap of _RateLimitEvent
         #
-        # contains a date-ordered list of the futur _RateLimitInfo to proceed.
+        # contains a date-ordered list of the future _RateLimitEvent to proceed.
         #
         self._events: list[_RateLimitEvent] = []
         # a mapping for most up-to-date information for each WebAPIClient
-        self._all_clients: _ALL_CLIENT_TYPE = weakref.WeakKeyDictionary()
+        self._all_buckets: _ALL_BUCKET_TYPE = weakref.WeakKeyDictionary()
+        self._stopped = False
 
-    def _run_forever(self):
-        """main entry points loop forever.
+    def _run(self):
+        """main entry points, loop until no bucket is rate limited.
 
         Proceed new incoming information from Client and managing the
-        _RateLimitTokens of the associated client.
+        _RateLimitTokens of the associated bucket.
 
         This must be run in a daemonized thread.
         """
         while True:
             self._consume_ready_events()
-            self._process_infos()
+            if not self._process_infos():
+                break
+
+    def _bucket_gone(self, bucket_ref: weakref.ref) -> None:
+        """wake the enforcer up when a rate limited bucket is garbage collected
+
+        If it was the last one, the enforcer can stop.
+        """
+        self._feed.put((None, None))
 
-    def _add_event(self, event: _RateLimitEvent) -> None:
-        """schedule a new event"""
-        heapq.heappush(self._events, event)
+    def _shutdown(self) -> bool:
+        """stop the enforcer if it has nothing left to do
+
+        Return True if the enforcer stopped. Future rate limiting information
+        will start a new one.
+        """
+        cls = type(self)
+        with cls._limiter_lock:
+            # Nobody can feed us new information while we hold the lock, so
+            # we can safely check the queue is empty.
+            if not self._feed.empty():
+                return False
+            if cls._queue is self._feed:
+                cls._queue = None
+                cls._limiter = None
+                cls._limiter_thread = None
+        return True
+
+    def _schedule(self, bucket: "_RateLimitBucket", pacing: _BucketPacing) -> None:
+        """schedule the next event for a bucket, if needed sooner"""
+        date = pacing.next_date(bucket, self._clock.monotonic_ns())
+        if pacing.next_event is not None and pacing.next_event <= date:
+            return
+        pacing.next_event = date
+        heapq.heappush(self._events, _RateLimitEvent(date=date, pacing=pacing))
 
     def _consume_ready_events(self) -> None:
         """Consume Rate Limit event that are ready
@@ -373,50 +781,45 @@ class _RateLimitEnforcer:
         This find all events whose time is up, and process them.
         """
 
-        current = time.monotonic_ns()
-        for client, this_event in self._next_events(current):
-            client._add_one_rate_limit_token()
-
-            rate_limit = this_event.rate_limit
-
-            # schedule the next event
-            if rate_limit.reset_date_ns >= current:
-                this_event.date += rate_limit.wait_ns
-                self._add_event(this_event)
-            else:
+        current = self._clock.monotonic_ns()
+        for bucket, this_event in self._next_events(current):
+            pacing = this_event.pacing
+            pacing.next_event = None
+            if pacing.reset_date <= current:
                 # The windows closed. we should not reschedule an event.
                 # The first request in the new window will rearm the logic.
-                self._all_clients.pop(client, None)
-                client._clear_rate_limit_tokens()
+                self._all_buckets.pop(bucket, None)
+                bucket._clear_rate_limit_tokens()
+            else:
+                pacing.grant_due_tokens(bucket, current)
+                self._schedule(bucket, pacing)
 
     def _next_events(
         self,
         current: int,
-    ) -> Iterator[Tuple["WebAPIClient", _RateLimitEvent]]:
-        """iterate over the (client, event) pair that is both ready and valid
+    ) -> Iterator[Tuple["_RateLimitBucket", _RateLimitEvent]]:
+        """iterate over the (bucket, event) pair that is both ready and valid
 
         Readiness is computed compared to "current".
-
-        return None if no such events exists.
         """
         while self._events and self._events[0].date <= current:
             event = heapq.heappop(self._events)
 
             # determine if that event is still valid
-            client = event.client_ref()
-            if client is None:
-                # that client is no longer active
-                continue
-            latest_rate_limit = self._all_clients.get(client)
-            if latest_rate_limit is None:
-                # that client is no longer active (narrow race)
+            bucket = event.pacing.bucket_ref()
+            if bucket is None:
+                # that bucket is no longer active
                 continue
-            if latest_rate_limit is not event.rate_limit:
+            latest_pacing = self._all_buckets.get(bucket)
+            if latest_pacing is not event.pacing:
                 # that event was superseded by a more recent one, lets ignore it
                 continue
-            yield (client, event)
+            if event.date != event.pacing.next_event:
+                # that event was rescheduled earlier
+                continue
+            yield (bucket, event)
 
-    def _process_infos(self):
+    def _process_infos(self) -> bool:
         """process incoming _RateLimitInfo
 
         This process all available _RateLimitInfo, then wait until the next
@@ -424,52 +827,96 @@ class _RateLimitEnforcer:
 
         So if no new _RateLimitInfo come, this is equivalent to a sleep until
         the next _RateLimitEvent.
+
+        Return False if the enforcer has nothing left to do and stopped.
         """
-        for current, client, rate_limit in self._next_infos():
-            old = self._all_clients.get(client)
-            if old is None or rate_limit.replacing(old):
-                # We lets consider the time between the generation of this
-                # limit server side and its processing negligible
-                current = time.monotonic_ns()
-                event = _RateLimitEvent(
-                    date=current + rate_limit.wait_ns,
-                    client_ref=weakref.ref(client),
-                    rate_limit=rate_limit,
-                )
-                self._all_clients[client] = rate_limit
-                if old is None:
-                    # If this is the initial requests, we give the user a small
-                    # free budget
-                    #
-                    # We do not do this when renewing the windows because we
-                    # assume that if some rate limit information was still in
-                    # place from the previous windows, the connection is
-                    # somewhat heavily used.
-                    rate_limit.setup_free_token()
-                if old is None or old.reset_date != rate_limit.reset_date:
-                    client._refresh_rate_limit_tokens(rate_limit.free_token)
-                self._add_event(event)
+        for bucket, rate_limit in self._next_infos():
+            if bucket is not None:
+                self._process_info(bucket, rate_limit)
+            # otherwise, some bucket was garbage collected
+        return not self._stopped
+
+    def _process_info(
+        self, bucket: "_RateLimitBucket", rate_limit: Optional[_RateLimitInfo]
+    ) -> None:
+        """process a _RateLimitInfo received for a bucket
+
+        A `None` _RateLimitInfo signals threads started waiting for tokens.
+        """
+        if rate_limit is None:
+            # some threads started waiting for tokens
+            pacing = self._all_buckets.get(bucket)
+            if pacing is not None:
+                current = self._clock.monotonic_ns()
+                pacing.grant_due_tokens(bucket, current)
+                self._schedule(bucket, pacing)
+            return
+        old = self._all_buckets.get(bucket)
+        if old is None or rate_limit.replacing(old.rate_limit):
+            # We lets consider the time between the generation of this
+            # limit server side and its processing negligible
+            current = self._clock.monotonic_ns()
+            # the reset date is a wall-clock date, convert it to our
+            # monotonic clock.
+            reset_date = current + rate_limit.reset_date_ns - self._clock.time_ns()
+            pacing = _BucketPacing(
+                bucket_ref=weakref.ref(bucket, self._bucket_gone),
+                rate_limit=rate_limit,
+                reset_date=reset_date,
+                last_grant=current,
+            )
+            self._all_buckets[bucket] = pacing
+            if old is None:
+                # If this is the initial requests, we give the user a small
+                # free budget
+                #
+                # We do not do this when renewing the windows because we
+                # assume that if some rate limit information was still in
+                # place from the previous windows, the connection is
+                # somewhat heavily used.
+                rate_limit.setup_free_token()
+            if old is None or old.rate_limit.reset_date != rate_limit.reset_date:
+                bucket._refresh_rate_limit_tokens(rate_limit.free_token)
+            self._schedule(bucket, pacing)
 
     def _next_infos(
         self,
-    ) -> Iterator[Tuple[int, "WebAPIClient", _RateLimitInfo]]:
-        """iterate over the available (client, _RateLimitInfo) pairs
-
-        If no new information are currently available, this wait until then
-        wait until the next _RateLimitEvent is due. If no new information
-        arrive during that time. The iteration is over.
+    ) -> Iterator[
+        Union[
+            Tuple["_RateLimitBucket", Optional[_RateLimitInfo]],
+            Tuple[None, None],
+        ]
+    ]:
+        """iterate over the available (bucket, _RateLimitInfo) pairs
+
+        A `None` _RateLimitInfo signals threads started waiting for tokens of
+        that bucket. A `(None, None)` pair signals a bucket was garbage
+        collected.
+
+        If no new information are currently available, this wait until the
+        next _RateLimitEvent is due. If no new information arrive during that
+        time. The iteration is over.
+
+        If there is no event to wait for, this wait indefinitely, unless no
+        bucket is rate limited anymore. In that case the enforcer is shut down
+        and the iteration is over.
         """
         while True:
-            current = time.monotonic_ns()
-            wait_ns = _1_SECOND  # default wait if there is nothing to do
+            timeout: Optional[float] = None
+            if not self._all_buckets:
+                # all remaining events are about buckets that are gone
+                self._events.clear()
             if self._events:
-                wait_ns = self._events[0].date - current
-            try:
+                wait_ns = self._events[0].date - self._clock.monotonic_ns()
                 # passing timeout 0, or negative timeout will create issue, so
                 # we set the minimum to one nano second.
                 wait_ns = max(wait_ns, 1)
-                wait = wait_ns / _1_SECOND
-                client, rate_limit = self._feed.get(timeout=wait)
+                timeout = wait_ns / _1_SECOND
+            elif not self._all_buckets and self._shutdown():
+                self._stopped = True
+                return
+            try:
+                bucket, rate_limit = self._feed.get(timeout=timeout)
             except queue.Empty:
                 # No external information received.
                 #
@@ -477,7 +924,7 @@ class _RateLimitEnforcer:
                 # to process them.
                 break
             else:
-                yield (current, client, rate_limit)
+                yield (bucket, rate_limit)
 
 
 def _free_existing_request(tokens: _RateLimitTokens) -> None:
@@ -490,25 +937,394 @@ def _free_existing_request(tokens: _RateLimitTokens) -> None:
     "waiting".
 
     When this method no other code should be able to get access to that
-    token.  Some client might still hold a reference to it, but the
+    token.  Some threads might still hold a reference to it, but the
     `_RateLimitEnforcer` will no longer add "available" tokens to it.
 
     The "waiting" semaphore contains one token for each request currently
-    waiting for an available token. The goal is to unlock all of them. So
-    add one "available" token for each "waiting-token" we can find. We
-    acquire them before issuing the "available-token" otherwise the Thread
-    doing request will concurrently acquire their "waiting-token" too,
-    making our count wrong.
+    waiting for an available token. The goal is to unlock all of them,
+    whatever the number of tokens they wait for (e.g. a `WebAPIClient.reserve`
+    of more than what the window could still grant): the "available"
+    semaphore is opened, granting them, and any request about to wait on it,
+    their tokens. The "waiting-tokens" are acquired first, otherwise the
+    Thread doing request will concurrently acquire them too.
 
     /!\ This is an internal method related to rate-limiting management.  /!\
     /!\ It should only be called by the `_RateLimitEnforcer` function. /!\
     """
     available, waiting = tokens
-    need_unlock = 0
     while waiting.acquire(blocking=False):
-        need_unlock += 1
-    for r in range(need_unlock):
-        available.release()
+        pass
+    available.open()
+
+
+def _check_priority(priority: str) -> None:
+    """raise ValueError if `priority` is not a known request priority"""
+    if priority not in _PRIORITY_LANES:
+        raise ValueError(f"invalid request priority: {priority}")
+
+
+class _RateLimitBucket:
+    """Rate limiting state of a family of endpoints of a `WebAPIClient`
+
+    The server may enforce separate budgets for some endpoints (e.g. the vault
+    or the save code now requests). Each bucket is fed with the rate limit
+    information of its own responses and paced on its own by its `backend`,
+    so that a slow budget does not throttle the other requests.
+
+    With the `InProcessRateLimitBackend`, the bucket also holds the
+    `_RateLimitTokens` filled by the `_RateLimitEnforcer`.
+    """
+
+    def __init__(self, name: str, backend: Optional[RateLimitBackend]):
+        self.name = name
+        self.backend = backend
+        self._rate_tokens: Optional[_RateLimitTokens] = None
+        # did we receive rate limit information from the server yet?
+        self.server_rate_limited = False
+
+    def __repr__(self) -> str:
+        return f"<_RateLimitBucket {self.name}>"
+
+    def _reset_after_fork(self) -> None:
+        self._rate_tokens = None
+
+    def _add_rate_limit_tokens(self, count: int) -> None:
+        r"""Internal Rate Limiting Method. Do not call directly.
+
+        This method is called when `count` extra requests can be issued.
+
+        /!\ This is an internal method related to rate-limiting management.  /!\
+        /!\ It should only be called by the `_RateLimitEnforcer` function.   /!\
+        """
+        tokens = self._rate_tokens
+        if tokens is not None:
+            tokens[0].release(count)
+
+    def _rate_limit_waiters(self) -> int:
+        r"""Internal Rate Limiting Method. Do not call directly.
+
+        Return the number of threads waiting for a rate limiting token.
+
+        /!\ This is an internal method related to rate-limiting management.  /!\
+        /!\ It should only be called by the `_RateLimitEnforcer` function.   /!\
+        """
+        tokens = self._rate_tokens
+        if tokens is None:
+            return 0
+        return tokens[0].waiting
+
+    def _clear_rate_limit_tokens(self) -> None:
+        r"""Internal Rate Limiting Method. Do not call directly.
+
+        This is called used when a rate limit window conclude as we reached its
+        end date.
+
+        At that point we disable rate limiting and free any waiting requests.
+
+        In some case, information about a new windows will be received before
+        we detect this windows expiration and `_refresh_rate_limit_tokens` will
+        be called instead.
+
+        /!\ This is an internal method related to rate-limiting management.  /!\
+        /!\ It should only be called by the `_RateLimitEnforcer` function.   /!\
+        """
+        tokens = self._rate_tokens
+        self._rate_tokens = None
+        if tokens is not None:
+            _free_existing_request(tokens)
+
+    def _refresh_rate_limit_tokens(self, free_token=0) -> None:
+        r"""Internal Rate Limiting Method. Do not call directly.
+
+        Setup a new Rate limit Windows by resetting the rate limit Semaphores.
+        This is used when a RateLimitInfo for a newer windows is received.
+
+        When a rate limit windows conclude, there is two possibles situations:
+
+        1) There is no waiting request: the number of available token in ≥ 0.
+        2) There is waiting request: the number of available token is 0.
+
+        In the case (1) We need to discard this available tokens. A new Rate
+        limiting window will start, and it need a blank slate. The request we
+        did not do early are irrelevant for that new windows.
+
+        For example, let says rate limit a window s 1 minute long with 100
+        request. If the client issued only one request in each of the past two
+        minutes, it used only 2 request out of a 200 total budget. However
+        server side the budget reset for each windows, so at the start of the
+        new windows, the client can only issue 100 request over the next
+        minute. If we preserved token from only window to the next, at the
+        point the client would have 198 available token already (+ 100 to
+        accumulate over the next minute) a number totally disconnected from the
+        server state.
+
+        So, we have to reset the Semaphore token for each window.
+
+
+        However, some request might still be waiting for token on the Semaphore
+        of the old Windows. If we do nothing they would be stuck forever. We
+        could do some fancy logic to transfer these waiting requests to the new
+        semaphore, but is is significantly simpler to just unlock them. They'll
+        consume some of the budget of the new windows, and the rate limiting
+        will adjust to the remaining budget.
+
+        If the number of waiting request is exceed (or even it close to) the
+        total budget of the next windows, this means request are being made at
+        an unreasonable parallelism level and there will be troubles anyways.
+
+        /!\ This is an internal method related to rate-limiting management.  /!\
+        /!\ It should only be called by the `_RateLimitEnforcer` function.   /!\
+        """
+        tokens = self._rate_tokens
+        notify_waiting = functools.partial(
+            _RateLimitEnforcer.notify_waiting, weakref.ref(self)
+        )
+        self._rate_tokens = (
+            _PrioritySemaphore(free_token, notify_waiting),  # available request
+            threading.Semaphore(),  # waiting request
+        )
+        if tokens is not None:
+            _free_existing_request(tokens)
+
+
+class InProcessRateLimitBackend(RateLimitBackend):
+    """Rate limiting backend pacing each bucket within the current process
+
+    This is the default backend. The rate limiting information are processed
+    by the `_RateLimitEnforcer` daemon thread, which fills the
+    `_RateLimitTokens` of each bucket at the appropriate pace. Requests
+    acquire these tokens according to their priority.
+
+    With a `VirtualClock`, the backend has an enforcer of its own, run by the
+    requesting threads: a request short of tokens advances the clock up to
+    the date its tokens are due (see `_acquire_virtual`).
+    """
+
+    def __init__(self, clock: Optional[VirtualClock] = None):
+        self.clock = clock
+        self._virtual_limiter: Optional[_RateLimitEnforcer] = None
+        self._virtual_lock = threading.Lock()
+        if clock is not None:
+            self._virtual_limiter = _RateLimitEnforcer(queue.SimpleQueue(), clock)
+
+    def _limiter(self) -> Optional[_RateLimitEnforcer]:
+        """return the enforcer pacing the buckets of this backend, if any"""
+        if self._virtual_limiter is not None:
+            return self._virtual_limiter
+        return _RateLimitEnforcer._limiter
+
+    def new_info(self, bucket: "_RateLimitBucket", info: _RateLimitInfo) -> None:
+        limiter = self._virtual_limiter
+        if limiter is None:
+            _RateLimitEnforcer.new_info(bucket, info)
+            return
+        with self._virtual_lock:
+            self._process_virtual_events()
+            limiter._process_info(bucket, info)
+
+    def _process_virtual_events(self) -> _RateLimitEnforcer:
+        """process the events of the virtual enforcer due by now
+
+        This must be called with `_virtual_lock` held.
+        """
+        limiter = self._virtual_limiter
+        assert limiter is not None
+        # nothing reads the feed of this enforcer, it only receives the
+        # notifications of garbage collected buckets, which need no processing.
+        while not limiter._feed.empty():
+            limiter._feed.get_nowait()
+        limiter._consume_ready_events()
+        return limiter
+
+    def acquire(
+        self,
+        bucket: "_RateLimitBucket",
+        priority: str = PRIORITY_NORMAL,
+        timeout: Optional[float] = None,
+        count: int = 1,
+    ) -> bool:
+        if self._virtual_limiter is not None:
+            return self._acquire_virtual(bucket, priority, timeout, count)
+        tokens = bucket._rate_tokens
+        if tokens is None:
+            # no rate limiting in place
+            return True
+        acquired = True
+        available, waiting = tokens
+        # signal we wait for a token, to ensure a refresh of the rate_token
+        # does not leave us hanging forever.
+        #
+        # See `_free_existing_request(…)` for details.
+        waiting.release()
+        try:
+            # If the `rate_token` tuple changed since we read it, this means
+            # the tokens Semaphore where refreshed, and it might have
+            # happened before our "waiting-token" was registered. Therefore
+            # we cannot 100% rely on the "waiting-token" to ensure we will
+            # eventually get a "available-request-token" available for us.
+            #
+            # We ignore the rate limiting logic in that case. The race is
+            # narrow enough that it is unlikely to create issue in
+            # practice.
+            #
+            # If the `rate_token` tuple did not change, we are certain the
+            # "waiting-token" will be taken in account in the case a
+            # refresh happens while waiting for an "available-request-token".
+            if tokens is bucket._rate_tokens:
+                # respect the rate limit enforced globally
+                #
+                # the `available` Semaphore is filled by the code in
+                # _RateLimitEnforcer. Tokens accumulated while nobody was
+                # waiting are granted right away, sparing a round trip
+                # through the enforcer thread (and allowing a reservation
+                # with a zero timeout to succeed).
+                acquired = available.acquire(priority, blocking=False, count=count)
+                if not acquired:
+                    limiter = _RateLimitEnforcer._limiter
+                    if limiter is not None:
+                        limiter.grant_due_tokens(bucket)
+                    acquired = available.acquire(priority, timeout=timeout, count=count)
+        finally:
+            # signal we no longer need to be saved from infinite hang
+            #
+            # We do a non-blocking acquire, because if the _RateLimitTokens
+            # is being discarded, the `_RateLimitEnforcer` might have
+            # acquired *our* "waiting-token" in the process of unlocking
+            # this thread.
+            waiting.acquire(blocking=False)
+        return acquired
+
+    def _acquire_virtual(
+        self,
+        bucket: "_RateLimitBucket",
+        priority: str,
+        timeout: Optional[float],
+        count: int,
+    ) -> bool:
+        """acquire tokens in virtual time
+
+        Nothing else advances the virtual clock while we wait, so rather than
+        waiting for the enforcer, advance the clock to the date the missing
+        tokens are due (or to the end of the window) and process the events
+        due by then.
+        """
+        clock = self.clock
+        assert clock is not None
+        deadline = None
+        if timeout is not None:
+            deadline = clock.monotonic_ns() + round(timeout * _1_SECOND)
+        with self._virtual_lock:
+            while True:
+                limiter = self._process_virtual_events()
+                tokens = bucket._rate_tokens
+                pacing = limiter.pacing(bucket)
+                if tokens is None or pacing is None:
+                    # no rate limiting in place
+                    return True
+                limiter.grant_due_tokens(bucket)
+                available = tokens[0]
+                if available.acquire(priority, blocking=False, count=count):
+                    return True
+                missing = count - available.value
+                date = pacing.last_grant + missing * pacing.rate_limit.wait_ns
+                date = min(date, pacing.reset_date)
+                if deadline is not None and date > deadline:
+                    clock.advance_to_ns(deadline)
+                    return False
+                clock.advance_to_ns(date)
+
+    def release(self, bucket: "_RateLimitBucket", count: int) -> None:
+        bucket._add_rate_limit_tokens(count)
+
+    def current_delay(self, bucket: "_RateLimitBucket") -> float:
+        limiter = self._limiter()
+        if limiter is None:
+            return 0.0
+        return limiter.current_rate_limit_delay(bucket)
+
+    def status(self, bucket: "_RateLimitBucket") -> RateLimitStatus:
+        tokens = bucket._rate_tokens
+        limiter = self._limiter()
+        pacing = None if limiter is None else limiter.pacing(bucket)
+        if tokens is None or limiter is None or pacing is None:
+            return RateLimitStatus()
+        available = tokens[0]
+        info = pacing.rate_limit
+        return RateLimitStatus(
+            active=True,
+            limit=info.limit,
+            remaining=info.remaining,
+            reset_date=_to_datetime(info.reset_date_ns),
+            delay=self.current_delay(bucket),
+            free_tokens=available.value + limiter.due_tokens(bucket),
+            waiting=available.waiting,
+        )
+
+
+_IN_PROCESS_BACKEND = InProcessRateLimitBackend()
+
+
+class RateLimitReservation:
+    """Rate limiting tokens reserved in advance by `WebAPIClient.reserve`
+
+    The requests issued by the reserving client within the ``reserve`` block
+    (and belonging to the reserved rate limit bucket) use these tokens instead
+    of waiting for the rate limit, until there is none left.
+    """
+
+    def __init__(self, bucket: _RateLimitBucket, count: int):
+        self.bucket = bucket
+        self.count = count
+        self._lock = threading.Lock()
+        self._remaining = count
+
+    @property
+    def remaining(self) -> int:
+        """number of reserved tokens not used yet"""
+        return self._remaining
+
+    def take(self) -> bool:
+        """use one of the reserved tokens, return False if none is left"""
+        with self._lock:
+            if self._remaining <= 0:
+                return False
+            self._remaining -= 1
+            return True
+
+    def _take_all(self) -> int:
+        """use all the tokens left, return how many"""
+        with self._lock:
+            left, self._remaining = self._remaining, 0
+            return left
+
+
+# reservation made through the `WebAPIClient.reserve` context manager
+_current_reservation: contextvars.ContextVar[Optional[RateLimitReservation]] = (
+    contextvars.ContextVar("swh_web_client_reservation", default=None)
+)
+
+# all the live WebAPIClient, see `_after_fork_in_child`
+_ALL_CLIENTS: "weakref.WeakSet[WebAPIClient]" = weakref.WeakSet()
+
+
+def _after_fork_in_child() -> None:
+    """reset the state that does not survive a fork in the child process
+
+    Threads are not forked. So the `_RateLimitEnforcer` thread and any thread
+    waiting for rate limiting tokens do not exist in the child, leaving the
+    rate limiting state of the parent unusable. The HTTP connections of the
+    parent must not be used by the child either.
+
+    So we reset the enforcer and the state of every client. The rate limiting
+    will resume with the rate limit information of the next response.
+    """
+    _RateLimitEnforcer._reset_after_fork()
+    for client in list(_ALL_CLIENTS):
+        client._reset_after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
 
 
 def _get_object_id_hex(swhidish: SWHIDish) -> str:
@@ -613,6 +1429,26 @@ def _parse_limit_header(response) -> Tuple[Optional[int], Optional[int], Optiona
     return (limit, remaining, reset)
 
 
+def _response_size(response: requests.Response, streamed: bool) -> int:
+    """return the size of a response body, announced if it is streamed"""
+    if not streamed:
+        return len(response.content)
+    try:
+        return int(response.headers.get("Content-Length", 0))
+    except ValueError:
+        return 0
+
+
+def _body_length(response: requests.Response) -> Optional[int]:
+    """return the length of a response body before reading it, if announced"""
+    if response.headers.get("Content-Encoding", "identity") != "identity":
+        return None  # Content-Length is the size of the encoded body
+    try:
+        return int(response.headers["Content-Length"])
+    except (KeyError, ValueError):
+        return None
+
+
 # The maximum amount of SWHID that one can request in a single `known` request
 KNOWN_QUERY_LIMIT = 1000
 
@@ -623,6 +1459,351 @@ def _get_known_chunk(swhids):
         yield swhids[i : i + KNOWN_QUERY_LIMIT]
 
 
+# size of the chunks written by `WebAPIClient.download_content`, also the
+# granularity of its progress records
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class _RangeUnsupported(Exception):
+    """The server ignored the Range header of a request"""
+
+
+def _split_range(length: int, parts: int) -> List[List[int]]:
+    """split `length` bytes in up to `parts` segments
+
+    Segments are ``[start, end, done]`` lists, `done` being the offset up to
+    which the segment was downloaded.
+
+    >>> _split_range(10, 3)
+    [[0, 4, 0], [4, 8, 4], [8, 10, 8]]
+    >>> _split_range(0, 3)
+    []
+    """
+    if length == 0:
+        return []
+    size = -(-length // max(parts, 1))
+    return [
+        [start, min(start + size, length), start] for start in range(0, length, size)
+    ]
+
+
+class _DownloadState:
+    """progress of a `WebAPIClient.download_content` or `fetch_bundle`
+
+    Saved next to the partial file after each chunk written, so that an
+    interrupted download can be resumed. The `key` identifies the data
+    downloaded: a saved progress is only resumed for the same key and length.
+
+    `on_advance` is called with the number of bytes written after each chunk.
+    If a `validator` header (name and value, e.g. the ``ETag`` of a bundle)
+    is given, every response must carry it unchanged.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        key: str,
+        length: int,
+        segments: List[List[int]],
+        on_advance: Optional[Callable[[int], None]] = None,
+        validator: Optional[Tuple[str, str]] = None,
+    ):
+        self.path = path
+        self.key = key
+        self.length = length
+        self.segments = segments
+        self.on_advance = on_advance
+        self.validator = validator
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str, key: str, length: int) -> Optional["_DownloadState"]:
+        """return the saved progress of a download, if any"""
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("key") != key or data.get("length") != length:
+            return None
+        return cls(path, key, length, data["segments"])
+
+    @property
+    def done(self) -> int:
+        """number of bytes downloaded so far"""
+        return sum(s[2] - s[0] for s in self.segments)
+
+    def advance(self, segment: List[int], done: int) -> None:
+        with self._lock:
+            written = done - segment[2]
+            segment[2] = done
+            self._save()
+            if self.on_advance is not None:
+                self.on_advance(written)
+
+    def reset(self, segments: List[List[int]]) -> None:
+        with self._lock:
+            self.segments = segments
+            self._save()
+
+    def _save(self) -> None:
+        data = {
+            "key": self.key,
+            "length": self.length,
+            "segments": self.segments,
+        }
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+    def remove(self) -> None:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.path)
+
+
+def _preallocate(fd: int, length: int) -> None:
+    """reserve the space of a file of `length` bytes"""
+    if length and hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, length)
+            return
+        except OSError:
+            pass  # not supported by the file system
+    os.ftruncate(fd, length)
+
+
+# slices of the sha1_git of a content forming the directories of its path,
+# in the directories written by `WebAPIClient.download_contents`
+CONTENT_PATH_SLICES = ((0, 2), (2, 4))
+
+# contents larger than this are spooled to disk before being added to a tar
+# archive by `WebAPIClient.download_contents`
+TAR_SPOOL_SIZE = 16 * 1024 * 1024
+
+
+def content_path(sha1_git: str) -> str:
+    """relative path of a content in a `WebAPIClient.download_contents` target
+
+    >>> content_path("fe95a46679d128ff167b7c55df5d02356c5a1ae1")
+    'fe/95/fe95a46679d128ff167b7c55df5d02356c5a1ae1'
+    """
+    return "/".join(
+        [*(sha1_git[start:end] for start, end in CONTENT_PATH_SLICES), sha1_git]
+    )
+
+
+@attr.s(slots=True)
+class ContentsDownload:
+    """Progress of a `WebAPIClient.download_contents`"""
+
+    # number of contents downloaded
+    downloaded = attr.ib(type=int, default=0)
+    # number of contents already present (or requested several times)
+    skipped = attr.ib(type=int, default=0)
+    # contents that could not be downloaded, by SWHID, with the error
+    failed = attr.ib(type=Dict[str, Exception], factory=dict)
+    # size of the contents downloaded, in bytes
+    bytes = attr.ib(type=int, default=0)
+    # time elapsed since the start of the download, in seconds
+    seconds = attr.ib(type=float, default=0.0)
+
+    @property
+    def throughput(self) -> float:
+        """average download rate, in bytes per second"""
+        return self.bytes / self.seconds if self.seconds else 0.0
+
+
+@attr.s(slots=True)
+class FileDownload:
+    """Progress of a `WebAPIClient.fetch_bundle` or `download_content`"""
+
+    # file written once the download is complete
+    path = attr.ib(type=str)
+    # size of the file, in bytes
+    length = attr.ib(type=int)
+    # size of the parts downloaded by previous, interrupted, calls in bytes
+    resumed = attr.ib(type=int, default=0)
+    # size of the parts downloaded by this call, in bytes
+    bytes = attr.ib(type=int, default=0)
+    # time elapsed since the start of this call, in seconds
+    seconds = attr.ib(type=float, default=0.0)
+
+    @property
+    def done(self) -> int:
+        """size of the parts of the file downloaded so far, in bytes"""
+        return self.resumed + self.bytes
+
+    @property
+    def throughput(self) -> float:
+        """average download rate of this call, in bytes per second"""
+        return self.bytes / self.seconds if self.seconds else 0.0
+
+
+# file name extensions of the bundles written by `WebAPIClient.cook_many`
+BUNDLE_EXTENSIONS = {
+    "flat": ".tar.gz",
+    "gitfast": ".gitfast.gz",
+    "git_bare": ".git.tar",
+}
+
+# types of the bundles that are (possibly compressed) tarballs
+TAR_BUNDLE_TYPES = frozenset({"flat", "git_bare"})
+
+
+@attr.s(slots=True)
+class CookedBundle:
+    """Outcome of the cooking of a bundle by `WebAPIClient.cook_many`"""
+
+    # SWHID of the object cooked
+    swhid = attr.ib(type=str)
+    # "done" or "failed"
+    status = attr.ib(type=str)
+    # last status of the cooking task reported by the vault, if any
+    info = attr.ib(type=Dict[str, Any], factory=dict)
+    # file the bundle was written to, if any
+    path = attr.ib(type=Optional[str], default=None)
+    # error that made the cooking (or the download of the bundle) fail
+    error = attr.ib(type=Optional[Exception], default=None)
+
+
+def _safe_members(
+    members: Iterable[tarfile.TarInfo], dest: str
+) -> Iterator[tarfile.TarInfo]:
+    """yield the members of a tarball, unless one escapes from `dest`
+
+    Used with the versions of Python lacking the extraction filters of
+    :mod:`tarfile`.
+    """
+    root = os.path.realpath(dest)
+    for member in members:
+        path = os.path.realpath(os.path.join(root, member.name))
+        targets = [path]
+        if member.issym():
+            targets.append(os.path.join(os.path.dirname(path), member.linkname))
+        elif member.islnk():
+            targets.append(os.path.join(root, member.linkname))
+        for target in targets:
+            if os.path.commonpath([root, os.path.realpath(target)]) != root:
+                raise tarfile.TarError(f"{member.name}: outside of {dest}")
+        yield member
+
+
+def _record_download(
+    report: ContentsDownload, swhid: str, future: concurrent.futures.Future
+) -> None:
+    """account for the download of a content, whose size `future` returns
+
+    (None for a content that was already present)
+    """
+    error = future.exception()
+    if isinstance(error, (requests.RequestException, ChecksumMismatch)):
+        logger.debug("download of %s failed: %s", swhid, error)
+        report.failed[swhid] = error
+    elif error is not None:
+        raise error
+    elif future.result() is None:
+        report.skipped += 1
+    else:
+        report.downloaded += 1
+        report.bytes += future.result()
+
+
+T = TypeVar("T")
+
+
+def _bounded_map(
+    fn: Callable[[T], Any], items: Iterable[T], max_concurrency: int
+) -> Iterator[Tuple[T, concurrent.futures.Future]]:
+    """call `fn` on `items` in threads, yield `(item, future)` as they complete
+
+    `items` is consumed as the calls complete, with at most twice
+    `max_concurrency` calls queued, so it can be a lazy iterator over many
+    items. The calls run in a copy of the current context, as in
+    `WebAPIClient._call_groups`.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        pending: Dict[concurrent.futures.Future, T] = {}
+        try:
+            for item in items:
+                if len(pending) >= 2 * max_concurrency:
+                    done, _ = concurrent.futures.wait(
+                        pending, return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+                    for future in done:
+                        yield pending.pop(future), future
+                ctx = contextvars.copy_context()
+                pending[executor.submit(ctx.run, fn, item)] = item
+            for future in concurrent.futures.as_completed(list(pending)):
+                yield pending.pop(future), future
+        except BaseException:
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+
+
+def _entry_name(name: str) -> str:
+    """check the name of a directory entry can be used as a file name"""
+    if name in ("", ".", "..") or "/" in name or "\0" in name:
+        raise ValueError(f"invalid directory entry name: {name!r}")
+    return name
+
+
+def _checkout_mode(perms: int) -> Optional[int]:
+    """mode of a file entry in a checkout, None for a symbolic link"""
+    if stat.S_ISLNK(perms):
+        return None
+    return 0o755 if perms & 0o111 else 0o644
+
+
+def _is_complete(path: str, length: int) -> bool:
+    """whether a regular file of `length` bytes is at `path`"""
+    try:
+        st = os.lstat(path)
+    except FileNotFoundError:
+        return False
+    return stat.S_ISREG(st.st_mode) and st.st_size == length
+
+
+def _sibling(path: str, suffix: str) -> str:
+    """return a free temporary path next to `path`"""
+    directory, name = os.path.split(path)
+    tmp = os.path.join(directory, f".{name}.{suffix}")
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(tmp)
+    return tmp
+
+
+def _write_file(path: str, raw: RawContent, mode: int) -> int:
+    """write `raw` to `path` through a temporary file, return its size"""
+    directory, name = os.path.split(path)
+    with raw:
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=f".{name}.")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                size = raw.copy_to(f)
+            os.chmod(tmp, mode)
+            os.replace(tmp, path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(tmp)
+            raise
+    return size
+
+
+def _copy_file(source: str, path: str, mode: int, link: bool) -> None:
+    """hard link or copy `source` to `path`"""
+    tmp = _sibling(path, "swh-copy")
+    if link:
+        try:
+            os.link(source, tmp)
+        except OSError:
+            link = False  # e.g. not supported by the file system
+    if not link:
+        shutil.copyfile(source, tmp)
+        os.chmod(tmp, mode)
+    os.replace(tmp, path)
+
+
 MAX_RETRY = 10
 
 DEFAULT_RETRY_REASONS = {
@@ -644,6 +1825,15 @@ class WebAPIClient:
         use_rate_limit: bool = True,
         automatic_concurrent_queries: bool = True,
         max_automatic_concurrency: Optional[int] = None,
+        default_priority: str = PRIORITY_NORMAL,
+        rate_limit_backend: Optional[RateLimitBackend] = None,
+        rate_limit_store: Optional[RateLimitInfoStore] = None,
+        static_rate_limit: Optional[Tuple[int, float]] = None,
+        rate_limit_buckets: Sequence[Tuple[str, str]] = DEFAULT_RATE_LIMIT_BUCKETS,
+        clock: Clock = SYSTEM_CLOCK,
+        metrics: MetricsSink = NULL_METRICS_SINK,
+        tracer: Optional[Tracer] = None,
+        adapter: Optional[requests.adapters.BaseAdapter] = None,
     ):
         """Create a client for the Software Heritage Web API
 
@@ -658,6 +1848,38 @@ class WebAPIClient:
                 need to be chunked might automatically be issued in parallel
             max_automatic_concurrency: maximum number of concurrent requests
                 when ``automatic_concurrent_queries`` is set
+            default_priority: priority of the requests issued by this client
+                when competing for rate limiting tokens, one of
+                :const:`PRIORITY_INTERACTIVE`, :const:`PRIORITY_NORMAL` and
+                :const:`PRIORITY_BULK`
+            rate_limit_backend: the backend pacing requests according to the
+                server rate limit information, default to a budget private to
+                this client (see :mod:`swh.web.client.rate_limit` for budgets
+                shared between processes or hosts)
+            rate_limit_store: where to persist the rate limit information
+                received, so that the next clients using the same API and
+                token are paced from their first request (see
+                :meth:`swh.web.client.rate_limit.RateLimitInfoStore.for_api`)
+            static_rate_limit: a ``(requests, seconds)`` budget to pace the
+                requests with until the server provides rate limit
+                information
+            rate_limit_buckets: ``(name, pattern)`` pairs of the endpoint
+                families paced on their own budget, the first regular
+                expression matching the query (relative to ``api_url``)
+                selects the bucket of a request, other requests use the
+                default ``"api"`` bucket. Default to
+                :const:`DEFAULT_RATE_LIMIT_BUCKETS`.
+            clock: the source of time of the client, a
+                :class:`swh.web.client.clock.VirtualClock` paces the requests
+                in virtual time (see :mod:`swh.web.client.clock`)
+            metrics: where to report the metrics of the requests (see
+                :mod:`swh.web.client.metrics`), discarded by default
+            tracer: where to report the spans of the calls and requests
+                (see :mod:`swh.web.client.tracing`), default to OpenTelemetry
+                if it is installed, discarded otherwise
+            adapter: the transport adapter sending the requests, e.g. a
+                :class:`swh.web.client.recording.RecordingAdapter` or
+                :class:`swh.web.client.recording.ReplayAdapter`
 
         With rate limiting enabled (the default), the client will adjust its
         request rate if the server provides Rate limiting headers.
@@ -685,13 +1907,38 @@ class WebAPIClient:
         The above is true regardless of the number of threads using the same
         WebAPIClient.
 
+        The server may enforce separate budgets for some endpoint families
+        (e.g. the vault or save code now requests): each rate limit bucket is
+        paced on its own, according to the information of its own responses.
+        A bucket shares its budget with the other processes or hosts through
+        ``rate_limit_backend.for_bucket(name)``.
+
+        Before the server provides any information, the requests of the
+        default bucket are paced according to the information persisted in
+        ``rate_limit_store`` if its window is not over yet, or else according
+        to ``static_rate_limit``.
+
         In practice, to avoid slowing down small application doing few
         requests, 10% of the available budget is available immediately, the other
         90% of the requests being spread out over the rate limit window.o
 
         This initial "immediate" budget is only granted if at least 25% of the
         total request budget is available.
+
+        When requests are waiting for the rate limit, the available requests
+        are granted to the most urgent ones first. The priority of requests
+        can be set for the whole client (``default_priority``), for a block of
+        code (see :meth:`priority`) or for a single call (through the
+        ``priority`` keyword argument of the methods accepting ``req_args``).
+        A less urgent request is never delayed for more than
+        ``_PrioritySemaphore.STARVATION_LIMIT`` more urgent ones. (Priorities
+        are not enforced by a shared ``rate_limit_backend``.)
+
+        The HTTP requests are sent with the transport ``adapter`` if given,
+        e.g. to record them or to replay a recording (see
+        :mod:`swh.web.client.recording`).
         """
+        _check_priority(default_priority)
         api_url = api_url.rstrip("/")
         u = urlparse(api_url)
 
@@ -700,19 +1947,42 @@ class WebAPIClient:
         self.bearer_token = bearer_token
         self._max_retry = request_retry
         self._retry_status = retry_status
+        self.clock = clock
+        self.metrics = metrics
+        self.tracer = tracer if tracer is not None else default_tracer()
 
-        self._getters: Dict[ObjectType, Callable[[SWHIDish, bool], Any]] = {
+        self._getters: Dict[ObjectType, Callable[..., Any]] = {
             ObjectType.CONTENT: self.content,
             ObjectType.DIRECTORY: self.directory,
             ObjectType.RELEASE: self.release,
             ObjectType.REVISION: self.revision,
             ObjectType.SNAPSHOT: self._get_snapshot,
         }
+        self._adapter = adapter
         # assume we will do multiple call and keep the connection alive
-        self._session = requests.Session()
+        self._session = self._new_session()
 
         self._use_rate_limit: bool = use_rate_limit
-        self._rate_tokens: Optional[_RateLimitTokens] = None
+        self._default_priority: str = default_priority
+        self._rate_limit_backend: Optional[RateLimitBackend] = None
+        if use_rate_limit:
+            if rate_limit_backend is None and isinstance(clock, VirtualClock):
+                rate_limit_backend = InProcessRateLimitBackend(clock)
+            elif rate_limit_backend is None:
+                rate_limit_backend = _IN_PROCESS_BACKEND
+            self._rate_limit_backend = rate_limit_backend
+        self._rate_limit_buckets: Dict[str, _RateLimitBucket] = {}
+        # (pattern, bucket) pairs, see `_rate_limit_bucket`
+        self._bucket_patterns: List[Tuple[Pattern[str], _RateLimitBucket]] = [
+            (re.compile(pattern), self._add_bucket(name))
+            for name, pattern in rate_limit_buckets
+        ]
+        self._default_bucket = self._add_bucket(RATE_LIMIT_DEFAULT_BUCKET)
+        self._rate_limit_store: Optional[RateLimitInfoStore] = None
+        self._static_rate_limit: Optional[Tuple[int, float]] = None
+        # end of the current static rate limit window (seconds since epoch)
+        self._static_window_end = 0.0
+        self._static_window_lock = threading.Lock()
 
         self._automatic_concurrent_queries: bool = automatic_concurrent_queries
         if max_automatic_concurrency is None:
@@ -721,104 +1991,220 @@ class WebAPIClient:
         # used for automatic concurrent queries
         self._thread_pool = None
 
-    @property
-    def rate_limit_delay(self):
-        """current rate limit delay in second"""
-        return _RateLimitEnforcer.current_rate_limit_delay(self)
-
-    def _add_one_rate_limit_token(self) -> None:
-        r"""Internal Rate Limiting Method. Do not call directly.
-
-        This method is called when one extra request can be issued.
-
-        /!\ This is an internal method related to rate-limiting management.  /!\
-        /!\ It should only be called by the `_RateLimitEnforcer` function.   /!\
-        """
-        assert self._rate_tokens is not None
-        self._rate_tokens[0].release()
-
-    def _clear_rate_limit_tokens(self) -> None:
-        r"""Internal Rate Limiting Method. Do not call directly.
-
-        This is called used when a rate limit window conclude as we reached its
-        end date.
-
-        At that point we disable rate limiting and free any waiting requests.
-
-        In some case, information about a new windows will be received before
-        we detect this windows expiration and `_refresh_rate_limit_tokens` will
-        be called instead.
-
-        /!\ This is an internal method related to rate-limiting management.  /!\
-        /!\ It should only be called by the `_RateLimitEnforcer` function.   /!\
-        """
-        tokens = self._rate_tokens
-        self._rate_tokens = None
-        if tokens is not None:
-            _free_existing_request(tokens)
-
-    def _refresh_rate_limit_tokens(self, free_token=0) -> None:
-        r"""Internal Rate Limiting Method. Do not call directly.
+        _ALL_CLIENTS.add(self)
 
-        Setup a new Rate limit Windows by resetting the rate limit Semaphores.
-        This is used when a RateLimitInfo for a newer windows is received.
-
-        When a rate limit windows conclude, there is two possibles situations:
-
-        1) There is no waiting request: the number of available token in ≥ 0.
-        2) There is waiting request: the number of available token is 0.
-
-        In the case (1) We need to discard this available tokens. A new Rate
-        limiting window will start, and it need a blank slate. The request we
-        did not do early are irrelevant for that new windows.
-
-        For example, let says rate limit a window s 1 minute long with 100
-        request. If the client issued only one request in each of the past two
-        minutes, it used only 2 request out of a 200 total budget. However
-        server side the budget reset for each windows, so at the start of the
-        new windows, the client can only issue 100 request over the next
-        minute. If we preserved token from only window to the next, at the
-        point the client would have 198 available token already (+ 100 to
-        accumulate over the next minute) a number totally disconnected from the
-        server state.
+        if self._rate_limit_backend is not None:
+            self._rate_limit_store = rate_limit_store
+            self._static_rate_limit = static_rate_limit
+            self._seed_rate_limit()
 
-        So, we have to reset the Semaphore token for each window.
+    def _reset_after_fork(self) -> None:
+        """reset the state inherited from the parent process after a fork
 
+        See `_after_fork_in_child` for details.
+        """
+        # the connections of the pool are shared with the parent process
+        self._session = self._new_session()
+        for bucket in self._rate_limit_buckets.values():
+            bucket._reset_after_fork()
+        self._thread_pool = None
+        self._static_window_lock = threading.Lock()
+
+    def _new_session(self) -> requests.Session:
+        session = requests.Session()
+        if self._adapter is not None:
+            session.mount("http://", self._adapter)
+            session.mount("https://", self._adapter)
+        return session
+
+    def _add_bucket(self, name: str) -> _RateLimitBucket:
+        """return the rate limit bucket called `name`, creating it if needed"""
+        bucket = self._rate_limit_buckets.get(name)
+        if bucket is None:
+            backend = self._rate_limit_backend
+            if backend is not None:
+                backend = backend.for_bucket(name)
+            bucket = _RateLimitBucket(name, backend)
+            self._rate_limit_buckets[name] = bucket
+        return bucket
+
+    def _get_bucket(self, name: str) -> _RateLimitBucket:
+        """return the rate limit bucket called `name`"""
+        try:
+            return self._rate_limit_buckets[name]
+        except KeyError:
+            raise ValueError(f"unknown rate limit bucket: {name}") from None
+
+    def _rate_limit_bucket(self, path: str) -> _RateLimitBucket:
+        """return the rate limit bucket of a query
+
+        `path` is the query relative to the API URL, or an absolute URL
+        outside of the API.
+        """
+        for pattern, bucket in self._bucket_patterns:
+            if pattern.match(path):
+                return bucket
+        return self._default_bucket
 
-        However, some request might still be waiting for token on the Semaphore
-        of the old Windows. If we do nothing they would be stuck forever. We
-        could do some fancy logic to transfer these waiting requests to the new
-        semaphore, but is is significantly simpler to just unlock them. They'll
-        consume some of the budget of the new windows, and the rate limiting
-        will adjust to the remaining budget.
+    def _seed_rate_limit(self) -> None:
+        """pace requests before the server provides rate limit information
 
-        If the number of waiting request is exceed (or even it close to) the
-        total budget of the next windows, this means request are being made at
-        an unreasonable parallelism level and there will be troubles anyways.
+        Use the persisted information if still relevant, the static budget
+        otherwise. Backends already pacing requests (e.g. a shared budget in
+        use by other processes) are left alone.
 
-        /!\ This is an internal method related to rate-limiting management.  /!\
-        /!\ It should only be called by the `_RateLimitEnforcer` function.   /!\
+        This only applies to the default rate limit bucket.
         """
-        if not self._use_rate_limit:
-            return
-        tokens = self._rate_tokens
-        self._rate_tokens = (
-            threading.Semaphore(),  # available request
-            threading.Semaphore(),  # waiting request
+        bucket = self._default_bucket
+        assert bucket.backend is not None
+        info = None
+        if self._rate_limit_store is not None:
+            info = self._rate_limit_store.load(self.clock)
+        if info is not None:
+            # the persisted window stands for the static one until it is over
+            self._static_window_end = info.reset_date
+        elif self._static_rate_limit is not None:
+            info = self._next_static_window()
+        if info is not None and not bucket.backend.status(bucket).active:
+            bucket.backend.new_info(bucket, info)
+
+    def _next_static_window(self) -> _RateLimitInfo:
+        """return the seeded information of a new static rate limit window"""
+        assert self._static_rate_limit is not None
+        requests_count, duration = self._static_rate_limit
+        now = self.clock.time()
+        self._static_window_end = now + duration
+        return _RateLimitInfo(
+            now, now, requests_count, requests_count, now + duration, seeded=True
         )
-        for i in range(free_token):
-            self._rate_tokens[0].release()
-        if tokens is not None:
-            _free_existing_request(tokens)
+
+    def _renew_static_window(self) -> None:
+        """start a new static rate limit window if the current one is over"""
+        bucket = self._default_bucket
+        with self._static_window_lock:
+            now = self.clock.time()
+            if bucket.server_rate_limited or now < self._static_window_end:
+                return  # somebody else did it
+            assert bucket.backend is not None
+            bucket.backend.new_info(bucket, self._next_static_window())
+
+    @property
+    def rate_limit_delay(self):
+        """current rate limit delay in second (of the default bucket)"""
+        bucket = self._default_bucket
+        if bucket.backend is None:
+            return 0.0
+        return bucket.backend.current_delay(bucket)
+
+    @contextlib.contextmanager
+    def priority(self, priority: str) -> Iterator[None]:
+        """Context manager setting the priority of the requests issued within
+
+        .. code-block:: python
+
+           with cli.priority(PRIORITY_BULK):
+               cli.known(many_swhids)
+
+        A priority passed explicitly to a method call takes precedence.
+        """
+        _check_priority(priority)
+        reset_token = _current_priority.set(priority)
+        try:
+            yield
+        finally:
+            _current_priority.reset(reset_token)
+
+    def rate_limit_status(
+        self, bucket: str = RATE_LIMIT_DEFAULT_BUCKET
+    ) -> RateLimitStatus:
+        """current state of the rate limit budget of this client
+
+        .. code-block:: python
+
+           status = cli.rate_limit_status()
+           if status.projected_wait(len(batch)) < deadline:
+               dispatch(batch)
+
+        `bucket` is the name of the rate limit bucket to report about (see
+        the ``rate_limit_buckets`` argument of the constructor).
+        """
+        rate_limit_bucket = self._get_bucket(bucket)
+        if rate_limit_bucket.backend is None:
+            return RateLimitStatus()
+        return rate_limit_bucket.backend.status(rate_limit_bucket)
+
+    @contextlib.contextmanager
+    def reserve(
+        self,
+        count: int,
+        timeout: Optional[float] = None,
+        priority: Optional[str] = None,
+        bucket: str = RATE_LIMIT_DEFAULT_BUCKET,
+    ) -> Iterator[RateLimitReservation]:
+        """Context manager reserving the budget of `count` requests at once
+
+        The tokens are acquired atomically, with the given priority: either
+        all of them are, or none. The next `count` requests issued by this
+        client within the block (from any thread started in it, or from
+        `_call_groups`) and belonging to the given rate limit `bucket` are
+        then issued right away. Unused tokens are given back when the block
+        exits.
+
+        .. code-block:: python
+
+           try:
+               with cli.reserve(len(batch), timeout=0):
+                   process(batch)
+           except RateLimitTimeout as e:
+               postpone(batch, e.projected_wait)
+
+        Raise :class:`RateLimitTimeout` (a :class:`TimeoutError`) if the
+        tokens could not be acquired within `timeout` seconds; its
+        ``projected_wait`` attribute estimates how much longer it would take.
+        """
+        if count < 1:
+            raise ValueError(f"invalid reservation size: {count}")
+        priority = self._resolve_priority(priority)
+        rate_limit_bucket = self._get_bucket(bucket)
+        backend = rate_limit_bucket.backend
+        if backend is not None and not backend.acquire(
+            rate_limit_bucket, priority, timeout=timeout, count=count
+        ):
+            status = backend.status(rate_limit_bucket)
+            raise RateLimitTimeout(count, status.projected_wait(count))
+        reservation = RateLimitReservation(rate_limit_bucket, count)
+        reset_token = _current_reservation.set(reservation)
+        try:
+            yield reservation
+        finally:
+            _current_reservation.reset(reset_token)
+            left = reservation._take_all()
+            if left and backend is not None:
+                backend.release(rate_limit_bucket, left)
+
+    def _resolve_priority(self, priority: Optional[str]) -> str:
+        """return the priority to use for a request"""
+        if priority is None:
+            priority = _current_priority.get()
+        if priority is None:
+            priority = self._default_priority
+        _check_priority(priority)
+        return priority
 
     def _call(
-        self, query: str, http_method: str = "get", **req_args
+        self,
+        query: str,
+        http_method: str = "get",
+        priority: Optional[str] = None,
+        **req_args,
     ) -> requests.models.Response:
         """Dispatcher for archive API invocation
 
         Args:
             query: API method to be invoked, rooted at api_url
             http_method: HTTP method to be invoked, one of: 'get', 'head'
+            priority: priority of the request regarding rate limiting
+                (default to the current priority of the client)
             req_args: extra keyword arguments for requests.get()/.head()
 
         Raises:
@@ -828,95 +2214,144 @@ class WebAPIClient:
         url = None
         if urlparse(query).scheme:  # absolute URL
             url = query
+            path = query
+            if query.startswith(self.api_url + "/"):
+                path = query[len(self.api_url) + 1 :]
         else:  # relative URL; prepend base API URL
             url = "/".join([self.api_url, query])
+            path = query
 
         headers = {}
         if self.bearer_token is not None:
             headers = {"Authorization": f"Bearer {self.bearer_token}"}
+        headers.update(req_args.pop("headers", None) or {})
 
         if http_method not in ("get", "post", "head"):
             raise ValueError(f"unsupported HTTP method: {http_method}")
 
-        return self._retryable_call(http_method, url, headers, req_args)
+        priority = self._resolve_priority(priority)
+        bucket = self._rate_limit_bucket(path)
+        return self._retryable_call(
+            http_method, url, headers, req_args, priority, bucket, endpoint_family(path)
+        )
 
-    def _retryable_call(self, http_method, url, headers, req_args):
+    def _retryable_call(
+        self,
+        http_method,
+        url,
+        headers,
+        req_args,
+        priority=PRIORITY_NORMAL,
+        bucket=None,
+        endpoint="other",
+    ):
         assert http_method in ("get", "post", "head"), http_method
 
         retry = self._max_retry
         delay = 0.1
         while retry > 0:
             retry -= 1
-            r = self._one_call(http_method, url, headers, req_args)
+            r = self._one_call(
+                http_method, url, headers, req_args, priority, bucket, endpoint
+            )
             if r.status_code not in self._retry_status:
                 r.raise_for_status()
                 break
+            self.metrics.increment(
+                RETRIES_METRIC,
+                tags={"endpoint": endpoint, "status": str(r.status_code)},
+            )
             if logger.isEnabledFor(logging.DEBUG):
                 msg = (
                     f"HTTP RETRY {http_method} {url}"
                     f" delay={delay:.6f} remaining-tries={retry}"
                 )
                 logger.debug(msg)
-            time.sleep(delay)
+            self.clock.sleep(delay)
             delay *= 2
         return r
 
-    def _one_call(self, http_method, url, headers, req_args):
-        """call on request and update rate limit info if available"""
+    def _one_call(
+        self,
+        http_method,
+        url,
+        headers,
+        req_args,
+        priority=PRIORITY_NORMAL,
+        bucket=None,
+        endpoint="other",
+    ):
+        """call on request and update rate limit info if available
+
+        `bucket` is the rate limit bucket of the request (default to the
+        default bucket), `endpoint` its endpoint family (for metrics).
+        """
         assert http_method in ("get", "post", "head"), http_method
+        if bucket is None:
+            bucket = self._default_bucket
         is_dbg = logger.isEnabledFor(logging.DEBUG)
         delay = 0
-        pre_grab = time.monotonic()
-        tokens = self._rate_tokens
-        if tokens is not None:
-            available, waiting = tokens
-            # signal we wait for a token, to ensure a refresh of the rate_token
-            # does not leave us hanging forever.
-            #
-            # See `_free_existing_request(…)` for details.
-            waiting.release()
-            try:
-                # If the `rate_token` tuple changed since we read it, this means
-                # the tokens Semaphore where refreshed, and it might have
-                # happened before our "waiting-token" was registered. Therefore
-                # we cannot 100% rely on the "waiting-token" to ensure we will
-                # eventually get a "available-request-token" available for us.
-                #
-                # We ignore the rate limiting logic in that case. The race is
-                # narrow enough that it is unlikely to create issue in
-                # practice.
-                #
-                # If the `rate_token` tuple did not change, we are certain the
-                # "waiting-token" will be taken in account in the case a
-                # refresh happens while waiting for an "available-request-token".
-                if tokens is self._rate_tokens:
-                    # respect the rate limit enforced globally
-                    #
-                    # the `available` Semaphore is filled by the code in
-                    # _RateLimitEnforcer
-                    available.acquire()
-            finally:
-                # signal we no longer need to be saved from infinite hang
-                #
-                # We do a non-blocking acquire, because if the _RateLimitTokens
-                # is being discarded, the `_RateLimitEnforcer` might have
-                # acquired *our* "waiting-token" in the process of unlocking
-                # this thread.
-                waiting.acquire(blocking=False)
-            delay = time.monotonic() - pre_grab
+        clock = self.clock
+        metrics = self.metrics
+        tracer = self.tracer
+        pre_grab = clock.monotonic()
+        reservation = _current_reservation.get()
+        if reservation is not None and reservation.bucket is bucket:
+            reserved = reservation.take()
+        else:
+            reserved = False
+        if (
+            self._static_rate_limit is not None
+            and bucket is self._default_bucket
+            and not bucket.server_rate_limited
+            and clock.time() >= self._static_window_end
+        ):
+            self._renew_static_window()
+        if bucket.backend is not None and not reserved:
+            with tracer.span(
+                RATE_LIMIT_WAIT_SPAN, {"swh.rate_limit.bucket": bucket.name}
+            ):
+                bucket.backend.acquire(bucket, priority)
+            delay = clock.monotonic() - pre_grab
+            metrics.timing(
+                RATE_LIMIT_WAIT_METRIC,
+                delay,
+                tags={"endpoint": endpoint, "bucket": bucket.name},
+            )
         if is_dbg:
             dbg_msg = f"HTTP CALL {http_method} {url}"
             if delay:
-                dbg_msg += f" delay={delay:.6f}"
+                dbg_msg += f" delay={delay:.6f} priority={priority}"
             logger.debug(dbg_msg)
-        start = time.time()
-        if http_method == "get":
-            r = self._session.get(url, **req_args, headers=headers)
-        elif http_method == "post":
-            r = self._session.post(url, **req_args, headers=headers)
-        elif http_method == "head":
-            r = self._session.head(url, **req_args, headers=headers)
-        end = time.time()
+        tags = {"endpoint": endpoint, "method": http_method}
+        start = clock.time()
+        sent = clock.monotonic()
+        span_attributes = {
+            "http.request.method": http_method.upper(),
+            "url.full": url,
+            "swh.endpoint": endpoint,
+        }
+        with tracer.span(HTTP_SPAN, span_attributes) as span:
+            try:
+                if http_method == "get":
+                    r = self._session.get(url, **req_args, headers=headers)
+                elif http_method == "post":
+                    r = self._session.post(url, **req_args, headers=headers)
+                elif http_method == "head":
+                    r = self._session.head(url, **req_args, headers=headers)
+            except Exception:
+                metrics.increment(REQUESTS_METRIC, tags={**tags, "status": "error"})
+                raise
+            span.set_attribute("http.response.status_code", r.status_code)
+        end = clock.time()
+        tags["status"] = str(r.status_code)
+        metrics.increment(REQUESTS_METRIC, tags=tags)
+        metrics.timing(REQUEST_DURATION_METRIC, clock.monotonic() - sent, tags=tags)
+        metrics.increment(
+            RESPONSE_BYTES_METRIC,
+            _response_size(r, req_args.get("stream", False)),
+            tags={"endpoint": endpoint},
+        )
 
         if is_dbg:
             dbg_msg = f"HTTP REPLY {r.status_code} {http_method} {url}"
@@ -926,11 +2361,28 @@ class WebAPIClient:
             new = _RateLimitInfo(start, end, *rate_limit_header)
             if is_dbg:
                 dbg_msg += " rate-limit-info=%r" % new
-            _RateLimitEnforcer.new_info(self, new)
+            if bucket.backend is not None:
+                bucket.server_rate_limited = True
+                bucket.backend.new_info(bucket, new)
+                if (
+                    self._rate_limit_store is not None
+                    and bucket is self._default_bucket
+                ):
+                    self._rate_limit_store.save(new, self.clock)
         if is_dbg:
             logger.debug(dbg_msg)
         return r
 
+    def _decode(self, r: requests.models.Response) -> Any:
+        """decode the JSON body of a response"""
+        with self.tracer.span(JSON_DECODE_SPAN):
+            return r.json()
+
+    def _typify(self, data: Any, obj_type: str) -> Any:
+        """convert the JSON of an object to pythonic types"""
+        with self.tracer.span(TYPIFY_SPAN, {"swh.object_type": obj_type}):
+            return typify_json(data, obj_type)
+
     def _call_groups(
         self,
         query: str,
@@ -946,11 +2398,13 @@ class WebAPIClient:
 
         .. note::
 
-            Through ``self._rate_tokens``, the actual pace of requests will
+            Through the rate limit buckets, the actual pace of requests will
             comply with rate limit information provided by the server.
 
+        The priority set with :meth:`priority` applies to the requests issued
+        in parallel too.
         """
-        if len(args_groups) <= 1 or self._automatic_concurrent_queries:
+        if len(args_groups) <= 1 or not self._automatic_concurrent_queries:
             for args in args_groups:
                 loop_args = req_args.copy()
                 loop_args.update(args)
@@ -963,22 +2417,29 @@ class WebAPIClient:
                 for args in args_groups:
                     loop_args = req_args.copy()
                     loop_args.update(args)
-                    f = executor.submit(self._call, query, **loop_args)
+                    # run in a copy of the current context to preserve
+                    # context-local settings (e.g. request priority)
+                    ctx = contextvars.copy_context()
+                    call = functools.partial(self._call, query, **loop_args)
+                    f = executor.submit(ctx.run, call)
                     pending.append(f)
                 for future in concurrent.futures.as_completed(pending):
                     yield future.result()
 
-    def _get_snapshot(self, swhid: SWHIDish, typify: bool = True) -> Dict[str, Any]:
+    def _get_snapshot(
+        self, swhid: SWHIDish, typify: bool = True, **req_args
+    ) -> Dict[str, Any]:
         """Analogous to self.snapshot(), but zipping through partial snapshots,
         merging them together before returning
 
         """
         snapshot = {}
-        for snp in self.snapshot(swhid, typify):
+        for snp in self.snapshot(swhid, typify, **req_args):
             snapshot.update(snp)
 
         return snapshot
 
+    @traced
     def get(self, swhid: SWHIDish, typify: bool = True, **req_args) -> Any:
         """Retrieve information about an object of any kind
 
@@ -994,8 +2455,9 @@ class WebAPIClient:
             obj_type = CoreSWHID.from_string(swhid).object_type
         else:
             obj_type = swhid.object_type
-        return self._getters[obj_type](swhid, typify)
+        return self._getters[obj_type](swhid, typify, **req_args)
 
+    @traced
     def iter(
         self, swhid: SWHIDish, typify: bool = True, **req_args
     ) -> Iterator[Dict[str, Any]]:
@@ -1009,18 +2471,19 @@ class WebAPIClient:
         else:
             obj_type = swhid.object_type
         if obj_type == ObjectType.SNAPSHOT:
-            yield from self.snapshot(swhid, typify)
+            yield from self.snapshot(swhid, typify, **req_args)
         elif obj_type == ObjectType.REVISION:
-            yield from [self.revision(swhid, typify)]
+            yield from [self.revision(swhid, typify, **req_args)]
         elif obj_type == ObjectType.RELEASE:
-            yield from [self.release(swhid, typify)]
+            yield from [self.release(swhid, typify, **req_args)]
         elif obj_type == ObjectType.DIRECTORY:
-            yield from self.directory(swhid, typify)
+            yield from self.directory(swhid, typify, **req_args)
         elif obj_type == ObjectType.CONTENT:
-            yield from [self.content(swhid, typify)]
+            yield from [self.content(swhid, typify, **req_args)]
         else:
             raise ValueError(f"invalid object type: {obj_type}")
 
+    @traced
     def content(
         self, swhid: SWHIDish, typify: bool = True, **req_args
     ) -> Dict[str, Any]:
@@ -1036,11 +2499,12 @@ class WebAPIClient:
           requests.HTTPError: if HTTP request fails
 
         """
-        json = self._call(
-            f"content/sha1_git:{_get_object_id_hex(swhid)}/", **req_args
-        ).json()
-        return typify_json(json, CONTENT) if typify else json
+        json = self._decode(
+            self._call(f"content/sha1_git:{_get_object_id_hex(swhid)}/", **req_args)
+        )
+        return self._typify(json, CONTENT) if typify else json
 
+    @traced
     def directory(
         self, swhid: SWHIDish, typify: bool = True, **req_args
     ) -> List[Dict[str, Any]]:
@@ -1056,9 +2520,12 @@ class WebAPIClient:
           requests.HTTPError: if HTTP request fails
 
         """
-        json = self._call(f"directory/{_get_object_id_hex(swhid)}/", **req_args).json()
-        return typify_json(json, DIRECTORY) if typify else json
+        json = self._decode(
+            self._call(f"directory/{_get_object_id_hex(swhid)}/", **req_args)
+        )
+        return self._typify(json, DIRECTORY) if typify else json
 
+    @traced
     def revision(
         self, swhid: SWHIDish, typify: bool = True, **req_args
     ) -> Dict[str, Any]:
@@ -1074,9 +2541,12 @@ class WebAPIClient:
           requests.HTTPError: if HTTP request fails
 
         """
-        json = self._call(f"revision/{_get_object_id_hex(swhid)}/", **req_args).json()
-        return typify_json(json, REVISION) if typify else json
+        json = self._decode(
+            self._call(f"revision/{_get_object_id_hex(swhid)}/", **req_args)
+        )
+        return self._typify(json, REVISION) if typify else json
 
+    @traced
     def release(
         self, swhid: SWHIDish, typify: bool = True, **req_args
     ) -> Dict[str, Any]:
@@ -1092,9 +2562,12 @@ class WebAPIClient:
           requests.HTTPError: if HTTP request fails
 
         """
-        json = self._call(f"release/{_get_object_id_hex(swhid)}/", **req_args).json()
-        return typify_json(json, RELEASE) if typify else json
+        json = self._decode(
+            self._call(f"release/{_get_object_id_hex(swhid)}/", **req_args)
+        )
+        return self._typify(json, RELEASE) if typify else json
 
+    @traced
     def snapshot(
         self, swhid: SWHIDish, typify: bool = True, **req_args
     ) -> Iterator[Dict[str, Any]]:
@@ -1121,13 +2594,14 @@ class WebAPIClient:
 
         while not done:
             r = self._call(query, http_method="get", **req_args)
-            json = r.json()["branches"]
-            yield typify_json(json, SNAPSHOT) if typify else json
+            json = self._decode(r)["branches"]
+            yield self._typify(json, SNAPSHOT) if typify else json
             if "next" in r.links and "url" in r.links["next"]:
                 query = r.links["next"]["url"]
             else:
                 done = True
 
+    @traced
     def visits(
         self,
         origin: str,
@@ -1166,13 +2640,18 @@ class WebAPIClient:
 
         while not done:
             r = self._call(query, http_method="get", params=params, **req_args)
-            yield from [typify_json(v, ORIGIN_VISIT) if typify else v for v in r.json()]
+            visits = self._decode(r)
+            if typify:
+                with self.tracer.span(TYPIFY_SPAN, {"swh.object_type": ORIGIN_VISIT}):
+                    visits = [typify_json(v, ORIGIN_VISIT) for v in visits]
+            yield from visits
             if "next" in r.links and "url" in r.links["next"]:
                 params = []
                 query = r.links["next"]["url"]
             else:
                 done = True
 
+    @traced
     def last_visit(self, origin: str, typify: bool = True) -> Dict[str, Any]:
         """Return the last visit of an origin.
 
@@ -1190,9 +2669,10 @@ class WebAPIClient:
         """
         query = f"origin/{origin}/visit/latest/"
         r = self._call(query, http_method="get")
-        visit = r.json()
-        return typify_json(visit, ORIGIN_VISIT) if typify else visit
+        visit = self._decode(r)
+        return self._typify(visit, ORIGIN_VISIT) if typify else visit
 
+    @traced
     def known(
         self, swhids: Iterable[SWHIDish], **req_args
     ) -> Dict[CoreSWHID, Dict[Any, Any]]:
@@ -1215,9 +2695,116 @@ class WebAPIClient:
         args_group = [{"json": ids} for ids in chunks]
         req_args["http_method"] = "post"
         responses = self._call_groups("known/", args_group, **req_args)
-        replies = (i for r in responses for i in r.json().items())
+        replies = (i for r in responses for i in self._decode(r).items())
         return {CoreSWHID.from_string(k): v for k, v in replies}
 
+    @traced
+    def iter_known(
+        self,
+        swhids: Iterable[SWHIDish],
+        max_concurrency: Optional[int] = None,
+        **req_args,
+    ) -> Iterator[Tuple[CoreSWHID, Dict[Any, Any]]]:
+        """Verify the presence in the archive of a stream of objects
+
+        Unlike :meth:`known`, `swhids` is consumed as the queries progress:
+        each batch of ``KNOWN_QUERY_LIMIT`` SWHIDs is queried as soon as it is
+        complete, up to `max_concurrency` queries at once (default to the
+        ``max_automatic_concurrency`` of the client), while the next ones are
+        produced. `swhids` can thus be a lazy iterator over the hashes of a
+        local tree being computed (see
+        :func:`swh.web.client.scan.iter_hashes`).
+
+        Args:
+            swhids: SWHIDs of the objects to verify
+            max_concurrency: maximum number of queries running at once
+            req_args: extra keyword arguments for requests.post()
+
+        Returns:
+            an iterator over ``(swhid, info)`` pairs, in the order the
+            queries complete, with the archive information about the objects
+            as returned by :meth:`known`
+
+        Raises:
+            requests.HTTPError: if HTTP request fails
+
+        """
+        if max_concurrency is None:
+            max_concurrency = self._max_automatic_concurrency
+
+        def batches() -> Iterator[List[str]]:
+            batch: List[str] = []
+            for swhid in swhids:
+                batch.append(str(swhid))
+                if len(batch) == KNOWN_QUERY_LIMIT:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+        def query(batch: List[str]) -> Dict[str, Any]:
+            r = self._call("known/", http_method="post", json=batch, **req_args)
+            return self._decode(r)
+
+        for _, future in _bounded_map(query, batches(), max_concurrency):
+            for swhid, info in future.result().items():
+                yield CoreSWHID.from_string(swhid), info
+
+    @traced
+    def scan(
+        self,
+        path: Union[str, "os.PathLike[str]"],
+        exclude: Iterable[str] = (),
+        **req_args,
+    ) -> Dict[str, ScannedObject]:
+        """Scan a local tree for the files and directories in the archive
+
+        The SWHIDs of the files and directories under `path` are computed
+        locally (see :func:`swh.web.client.scan.iter_hashes`), then their
+        presence in the archive is queried level by level from the root down
+        (each level with :meth:`known`, in concurrent queries of up to
+        ``KNOWN_QUERY_LIMIT`` SWHIDs). The subtrees of known directories are
+        not queried, everything in them being known too.
+
+        Args:
+            path: root directory of the tree to scan
+            exclude: shell patterns of the files and directories to skip,
+              matched against their path relative to `path` (e.g. ``.git``)
+            req_args: extra keyword arguments for requests.post()
+
+        Returns:
+            the scanned objects by path relative to `path` (with ``/``
+            separators, ``.`` being `path` itself), see :class:`ScannedObject`
+
+        Raises:
+            requests.HTTPError: if HTTP request fails
+
+        """
+        level = [hash_tree(path, exclude)]
+        statuses: Dict[CoreSWHID, bool] = {}
+        scanned: Dict[str, ScannedObject] = {}
+        while level:
+            # objects found several times are queried once, at their first level
+            query = {obj.swhid for obj in level} - statuses.keys()
+            if query:
+                for swhid, info in self.known(query, **req_args).items():
+                    statuses[swhid] = info["known"]
+            next_level: List[LocalObject] = []
+            for obj in level:
+                scanned[obj.path] = ScannedObject(obj.swhid, statuses[obj.swhid])
+                if obj.entries is None:
+                    continue
+                if not statuses[obj.swhid]:
+                    next_level.extend(obj.entries.values())
+                    continue
+                for sub_obj in iter_subtree(obj):
+                    scanned[sub_obj.path] = ScannedObject(
+                        sub_obj.swhid, True, queried=False
+                    )
+            level = next_level
+        return scanned
+
+    @traced
     def content_exists(self, swhid: SWHIDish, **req_args) -> bool:
         """Check if a content object exists in the archive
 
@@ -1237,6 +2824,7 @@ class WebAPIClient:
             )
         )
 
+    @traced
     def directory_exists(self, swhid: SWHIDish, **req_args) -> bool:
         """Check if a directory object exists in the archive
 
@@ -1256,6 +2844,7 @@ class WebAPIClient:
             )
         )
 
+    @traced
     def revision_exists(self, swhid: SWHIDish, **req_args) -> bool:
         """Check if a revision object exists in the archive
 
@@ -1275,6 +2864,7 @@ class WebAPIClient:
             )
         )
 
+    @traced
     def release_exists(self, swhid: SWHIDish, **req_args) -> bool:
         """Check if a release object exists in the archive
 
@@ -1294,6 +2884,7 @@ class WebAPIClient:
             )
         )
 
+    @traced
     def snapshot_exists(self, swhid: SWHIDish, **req_args) -> bool:
         """Check if a snapshot object exists in the archive
 
@@ -1313,6 +2904,7 @@ class WebAPIClient:
             )
         )
 
+    @traced
     def origin_exists(self, origin: str, **req_args) -> bool:
         """Check if an origin object exists in the archive
 
@@ -1332,26 +2924,666 @@ class WebAPIClient:
             )
         )
 
-    def content_raw(self, swhid: SWHIDish, **req_args) -> Iterator[bytes]:
+    @traced
+    def content_raw(
+        self, swhid: SWHIDish, check_checksums: bool = True, **req_args
+    ) -> Iterator[bytes]:
         """Iterate over the raw content of a content object
 
+        The sha1_git of a content depends on its length: if the response does
+        not announce it (e.g. when it is compressed), checking the checksums
+        costs an extra request, for the metadata of the content.
+
+        Args:
+            swhid: object persistent identifier
+            check_checksums: if True, hash the chunks as they are yielded and
+                check them against the SWHID once they all were (default:
+                True)
+            req_args: extra keyword arguments for requests.get()
+
+        Raises:
+          requests.HTTPError: if HTTP request fails
+          ChecksumMismatch: at the end of the iteration, if the content does
+            not match its SWHID
+
+        """
+        sha1_git = _get_object_id_hex(swhid)
+        r = self._call(
+            f"content/sha1_git:{sha1_git}/raw/",
+            stream=True,
+            **req_args,
+        )
+        r.raise_for_status()
+
+        chunks = r.iter_content(chunk_size=None, decode_unicode=False)
+        if not check_checksums:
+            yield from chunks
+            return
+        # the sha1_git of a content depends on its length
+        length = _body_length(r)
+        checksums = {"sha1_git": sha1_git}
+        if length is None:
+            metadata = self.content(swhid, typify=False, **req_args)
+            length, checksums = metadata["length"], metadata["checksums"]
+        yield from VerifyingStream(chunks, length, checksums, str(swhid))
+
+    @traced
+    def content_raw_file(
+        self,
+        swhid: SWHIDish,
+        check_checksums: bool = True,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        **req_args,
+    ) -> RawContent:
+        """Open the raw content of a content object as a binary file
+
+        Unlike :meth:`content_raw`, the content is read into buffers
+        provided by the caller (see :class:`swh.web.client.raw.RawContent`),
+        avoiding an allocation per chunk. As with :meth:`content_raw`,
+        checking the checksums may cost an extra request.
+
         Args:
             swhid: object persistent identifier
+            check_checksums: if True, hash the data as they are read and check
+                them against the SWHID once the end of the content is reached
+                (default: True)
+            chunk_size: size of the buffer of :meth:`RawContent.copy_to`
             req_args: extra keyword arguments for requests.get()
 
         Raises:
           requests.HTTPError: if HTTP request fails
+          ChecksumMismatch: when reaching the end of the content, if it does
+            not match its SWHID
 
         """
+        sha1_git = _get_object_id_hex(swhid)
         r = self._call(
-            f"content/sha1_git:{_get_object_id_hex(swhid)}/raw/",
+            f"content/sha1_git:{sha1_git}/raw/",
             stream=True,
             **req_args,
         )
         r.raise_for_status()
+        stream = None
+        if check_checksums:
+            length = _body_length(r)
+            checksums = {"sha1_git": sha1_git}
+            if length is None:
+                metadata = self.content(swhid, typify=False, **req_args)
+                length, checksums = metadata["length"], metadata["checksums"]
+            stream = VerifyingStream((), length, checksums, str(swhid))
+        return RawContent(r, stream, chunk_size)
+
+    @traced
+    def download_content(
+        self,
+        swhid: SWHIDish,
+        dest: Union[str, "os.PathLike[str]"],
+        parts: int = 4,
+        progress: Optional[Callable[[FileDownload], None]] = None,
+        **req_args,
+    ) -> Dict[str, Any]:
+        """Download the raw content of a content object to a file
+
+        The content is fetched in up to `parts` segments requested in
+        parallel (with HTTP ``Range`` requests), written in place into a
+        preallocated ``<dest>.part`` file. Segments interrupted by a network
+        error are resumed where they stopped, up to ``request_retry`` times
+        each. If the download still fails, its progress is kept in a
+        ``<dest>.part.json`` file and calling this method again resumes it.
+
+        Once complete, the file is verified against the checksums of the
+        content (while it is written when downloaded in a single segment),
+        then renamed to `dest`.
+
+        Args:
+            swhid: object persistent identifier
+            dest: path of the file to write
+            parts: number of segments to download in parallel
+            progress: function called with a :class:`FileDownload` after each
+              chunk written (from the downloading threads, one at a time)
+            req_args: extra keyword arguments for requests.get()
+
+        Returns:
+            the information about the content object, as returned by
+            :meth:`content` with ``typify=False``
+
+        Raises:
+          requests.HTTPError: if HTTP request fails
+          ChecksumMismatch: if the downloaded file does not match the
+            checksums of the content (it is then removed)
+
+        """
+        sha1_git = _get_object_id_hex(swhid)
+        metadata = self.content(swhid, typify=False, **req_args)
+        self._download_file(
+            f"content/sha1_git:{sha1_git}/raw/",
+            os.fspath(dest),
+            metadata["length"],
+            sha1_git,
+            parts,
+            req_args,
+            metadata["checksums"],
+            progress,
+        )
+        return metadata
+
+    @traced
+    def fetch_bundle(
+        self,
+        bundle_type: str,
+        swhid: SWHIDish,
+        dest: Union[str, "os.PathLike[str]"],
+        parts: int = 1,
+        progress: Optional[Callable[[FileDownload], None]] = None,
+        **req_args,
+    ) -> FileDownload:
+        """Download a cooked bundle to a file, resuming interrupted downloads
+
+        The bundle is downloaded as the raw contents are by
+        :meth:`download_content`: in `parts` segments requested in parallel,
+        into a ``<dest>.part`` file renamed to `dest` once complete, network
+        errors being retried from where they stopped and the progress of a
+        failed download being kept for the next call to resume it.
+
+        The vault provides no checksums of the bundles: a download is only
+        resumed if the bundle has the same size and validator (``ETag`` or
+        ``Last-Modified`` header) as when it started, and is complete once
+        its announced size was received. If the server does not announce
+        the size of the bundle, it is downloaded in one go, without resuming.
+
+        Args:
+            bundle_type: Type of the bundle
+            swhid: object persistent identifier
+            dest: path of the file to write
+            parts: number of segments to download in parallel
+            progress: function called with a :class:`FileDownload` after each
+              chunk written (from the downloading threads, one at a time)
+            req_args: extra keyword arguments for requests.get()
+
+        Returns:
+            the outcome of the download, with its throughput
+
+        Raises:
+            requests.HTTPError: if HTTP request fails
+            ChecksumMismatch: if the bundle changed during the download, or
+              its size differs from the announced one (the partial file is
+              then removed)
+
+        """
+        query = f"vault/{bundle_type}/{swhid}/raw"
+        dest = os.fspath(dest)
+        # follow redirections as GET requests do, bundles may be served elsewhere
+        r = self._call(
+            query, http_method="head", **{"allow_redirects": True, **req_args}
+        )
+        length = _body_length(r)
+        if length is None:
+            start = self.clock.monotonic()
+            size = _write_file(
+                dest,
+                RawContent(self.cooking_fetch(bundle_type, swhid, **req_args)),
+                0o644,
+            )
+            report = FileDownload(dest, size, bytes=size)
+            report.seconds = self.clock.monotonic() - start
+            if progress:
+                progress(report)
+            return report
+        validator = None
+        for header in ("ETag", "Last-Modified"):
+            if r.headers.get(header):
+                validator = (header, r.headers[header])
+                break
+        key = f"{bundle_type}:{swhid}:{validator[1] if validator else ''}"
+        return self._download_file(
+            query, dest, length, key, parts, req_args, None, progress, validator
+        )
+
+    def _download_file(
+        self,
+        query: str,
+        dest: str,
+        length: int,
+        key: str,
+        parts: int,
+        req_args: Dict[str, Any],
+        checksums: Optional[Dict[str, str]] = None,
+        progress: Optional[Callable[[FileDownload], None]] = None,
+        validator: Optional[Tuple[str, str]] = None,
+    ) -> FileDownload:
+        """download the `length` bytes returned by `query` to `dest`
+
+        See `download_content`, the file is verified against the `checksums`
+        given, if any, and every response must carry the `validator` header
+        given, if any (see `_DownloadState`).
+        """
+        partial = f"{dest}.part"
+        state = None
+        if os.path.exists(partial):
+            state = _DownloadState.load(f"{partial}.json", key, length)
+        resumed = state is not None
+        if state is None:
+            segments = _split_range(length, parts)
+            state = _DownloadState(f"{partial}.json", key, length, segments)
+        state.validator = validator
+        report = FileDownload(dest, length, resumed=state.done)
+        start = self.clock.monotonic()
+
+        def on_advance(written: int) -> None:
+            report.bytes += written
+            report.seconds = self.clock.monotonic() - start
+            if progress:
+                progress(report)
+
+        state.on_advance = on_advance
+        fd = os.open(partial, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if not resumed:
+                os.ftruncate(fd, 0)
+            _preallocate(fd, length)
+            pending = [s for s in state.segments if s[2] < s[1]]
+            stream = None
+            if checksums is not None and pending == [[0, length, 0]]:
+                stream = VerifyingStream((), length, checksums, partial)
+            try:
+                self._download_segments(
+                    query, fd, state, pending, True, req_args, stream
+                )
+            except _RangeUnsupported:
+                logger.debug("HTTP Range not supported for %s", query)
+                state.reset([[0, length, 0]])
+                report.resumed = 0
+                if checksums is not None:
+                    stream = VerifyingStream((), length, checksums, partial)
+                self._download_segments(
+                    query, fd, state, state.segments, False, req_args, stream
+                )
+        except ChecksumMismatch:
+            os.unlink(partial)
+            state.remove()
+            raise
+        finally:
+            os.close(fd)
+
+        try:
+            size = os.path.getsize(partial)
+            if state.done != length or size != length:
+                raise ChecksumMismatch(
+                    f"{partial}: {state.done} bytes downloaded, "
+                    f"{size} bytes written, {length} expected"
+                )
+            if stream is not None:
+                stream.verify()
+            elif checksums is not None:
+                _verify_file(partial, checksums)
+        except ChecksumMismatch:
+            os.unlink(partial)
+            raise
+        finally:
+            state.remove()
+        os.replace(partial, dest)
+        report.seconds = self.clock.monotonic() - start
+        return report
+
+    def _download_segments(
+        self,
+        query: str,
+        fd: int,
+        state: _DownloadState,
+        segments: List[List[int]],
+        ranged: bool,
+        req_args: Dict[str, Any],
+        stream: Optional[VerifyingStream] = None,
+    ) -> None:
+        """download `segments` of a file in parallel, see `download_content`
+
+        The data written are hashed with `stream`, if there is a single
+        segment.
+        """
+        if len(segments) <= 1:
+            for segment in segments:
+                self._download_segment(
+                    query, fd, state, segment, ranged, req_args, stream
+                )
+            return
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=len(segments)
+        ) as executor:
+            pending = []
+            for segment in segments:
+                # run in a copy of the current context, as in `_call_groups`
+                ctx = contextvars.copy_context()
+                download = functools.partial(
+                    self._download_segment, query, fd, state, segment, ranged, req_args
+                )
+                pending.append(executor.submit(ctx.run, download))
+            for future in concurrent.futures.as_completed(pending):
+                future.result()
+
+    def _download_segment(
+        self,
+        query: str,
+        fd: int,
+        state: _DownloadState,
+        segment: List[int],
+        ranged: bool,
+        req_args: Dict[str, Any],
+        stream: Optional[VerifyingStream] = None,
+    ) -> None:
+        """download a segment of a file, resuming it after network errors"""
+        attempts = self._max_retry
+        end = segment[1]
+        while True:
+            headers = {}
+            if ranged:
+                headers["Range"] = f"bytes={segment[2]}-{end - 1}"
+            try:
+                with self._call(query, stream=True, headers=headers, **req_args) as r:
+                    if ranged and r.status_code != 206:
+                        raise _RangeUnsupported(query)
+                    if state.validator is not None:
+                        name, value = state.validator
+                        if r.headers.get(name) != value:
+                            raise ChecksumMismatch(
+                                f"{query}: {name} changed during the download"
+                            )
+                    # without a Range, the body starts over from the start of
+                    # the file: skip what was already written (and hashed)
+                    offset = segment[2] if ranged else 0
+                    for chunk in r.iter_content(DOWNLOAD_CHUNK_SIZE):
+                        view = memoryview(chunk)
+                        if offset < segment[2]:
+                            skipped = min(len(view), segment[2] - offset)
+                            view = view[skipped:]
+                            offset += skipped
+                            if not view:
+                                continue
+                        if len(view) > end - offset:
+                            raise ChecksumMismatch(
+                                f"{query}: more than {end} bytes received"
+                            )
+                        if stream is not None:
+                            stream.update(view)
+                        while view:
+                            written = os.pwrite(fd, view, offset)
+                            view = view[written:]
+                            offset += written
+                        state.advance(segment, offset)
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.ChunkedEncodingError,
+            ) as e:
+                error: Exception = e
+            else:
+                if segment[2] >= end:
+                    return
+                error = requests.exceptions.ChunkedEncodingError(
+                    f"incomplete response for {query}"
+                )
+            attempts -= 1
+            if attempts <= 0:
+                raise error
+            logger.debug(
+                "HTTP RESUME %s at %d (%s) remaining-tries=%d",
+                query,
+                segment[2],
+                error,
+                attempts,
+            )
+
+    @traced
+    def download_contents(
+        self,
+        swhids: Iterable[SWHIDish],
+        dest: Union[str, "os.PathLike[str]", tarfile.TarFile],
+        max_concurrency: Optional[int] = None,
+        progress: Optional[Callable[[ContentsDownload], None]] = None,
+        **req_args,
+    ) -> ContentsDownload:
+        """Download the raw contents of many content objects
+
+        Up to `max_concurrency` contents (default to the
+        ``max_automatic_concurrency`` of the client) are downloaded at once,
+        each one being verified against its SWHID (see :meth:`content_raw`).
+        `swhids` is consumed as the downloads progress, so it can be a lazy
+        iterator over many contents.
+
+        If `dest` is a directory, each content is written to the path given
+        by :func:`content_path` (e.g. ``fe/95/fe95a466...``) in it, through a
+        temporary file renamed once complete. Contents already present are
+        skipped. If `dest` is a :class:`tarfile.TarFile` open for writing
+        (possibly in streaming mode, e.g. ``"w|gz"``), the contents are added
+        to it as members named after the same paths.
+
+        A content that cannot be downloaded (HTTP error, or checksum
+        mismatch) does not stop the others, and is reported in the ``failed``
+        field of the result.
+
+        Args:
+            swhids: persistent identifiers of the content objects
+            dest: directory or tar archive to write the contents to
+            max_concurrency: number of contents downloaded at once
+            progress: called with the progress so far after each content
+            req_args: extra keyword arguments for requests.get()
+
+        Returns:
+            the final progress of the download
+
+        """
+        if max_concurrency is None:
+            max_concurrency = self._max_automatic_concurrency
+        fetch: Callable[[str], Optional[int]]
+        if isinstance(dest, tarfile.TarFile):
+            fetch = functools.partial(
+                self._download_to_tar, dest, threading.Lock(), req_args
+            )
+        else:
+            fetch = functools.partial(self._download_to_dir, os.fspath(dest), req_args)
+
+        report = ContentsDownload()
+        start = self.clock.monotonic()
+
+        def unique() -> Iterator[str]:
+            seen: Set[str] = set()
+            for swhid in swhids:
+                sha1_git = _get_object_id_hex(swhid)
+                if sha1_git in seen:
+                    report.skipped += 1
+                    continue
+                seen.add(sha1_git)
+                yield sha1_git
+
+        for sha1_git, future in _bounded_map(fetch, unique(), max_concurrency):
+            _record_download(report, f"swh:1:cnt:{sha1_git}", future)
+            report.seconds = self.clock.monotonic() - start
+            if progress is not None:
+                progress(report)
+        return report
+
+    @traced
+    def checkout(
+        self,
+        swhid: SWHIDish,
+        dest: Union[str, "os.PathLike[str]"],
+        max_concurrency: Optional[int] = None,
+        link: bool = True,
+        progress: Optional[Callable[[ContentsDownload], None]] = None,
+        **req_args,
+    ) -> ContentsDownload:
+        """Write the tree of a directory object to a local directory
+
+        The directories of the tree are listed in parallel, and their files
+        downloaded as they are discovered, up to `max_concurrency` at once
+        (default to the ``max_automatic_concurrency`` of the client). Each
+        file is streamed to disk and verified against its SWHID (see
+        :meth:`content_raw_file`).
 
-        yield from r.iter_content(chunk_size=None, decode_unicode=False)
+        Executable files get mode 755 and the other files mode 644,
+        symbolic links are created as such, and submodules are left as empty
+        directories (as with git).
 
+        A content present several times in the tree is downloaded once, then
+        hard linked to its other paths (copied if `link` is False, or if the
+        paths differ in their executable bit).
+
+        Files are written through temporary files renamed once complete, so
+        an interrupted checkout can be resumed by calling this method again:
+        files already present with the expected size are kept.
+
+        Args:
+            swhid: persistent identifier of the directory object
+            dest: directory to write the tree to, created if needed
+            max_concurrency: number of requests issued at once
+            link: hard link the copies of a content rather than copying it
+            progress: called with the progress so far after each file
+            req_args: extra keyword arguments for requests.get()
+
+        Returns:
+            the final progress of the checkout, which is incomplete if its
+            ``failed`` field is not empty
+
+        Raises:
+          requests.HTTPError: if listing a directory fails
+
+        """
+        if max_concurrency is None:
+            max_concurrency = self._max_automatic_concurrency
+        dest = os.fspath(dest)
+        os.makedirs(dest, exist_ok=True)
+        report = ContentsDownload()
+        start = self.clock.monotonic()
+        # path and mode of the first file of each content
+        first: Dict[str, Tuple[str, int]] = {}
+        # other files of these contents: (path, sha1_git, mode, length)
+        copies: List[Tuple[str, str, int, int]] = []
+
+        def files() -> Iterator[Tuple[str, Dict[str, Any]]]:
+            walk = self._walk_directory(
+                _get_object_id_hex(swhid), dest, max_concurrency, req_args
+            )
+            for path, entry in walk:
+                mode = _checkout_mode(entry["perms"])
+                if mode is not None:
+                    if entry["target"] in first:
+                        copies.append((path, entry["target"], mode, entry["length"]))
+                        continue
+                    first[entry["target"]] = (path, mode)
+                yield path, entry
+
+        fetch = functools.partial(self._checkout_file, req_args)
+        for (path, entry), future in _bounded_map(fetch, files(), max_concurrency):
+            _record_download(report, f"swh:1:cnt:{entry['target']}", future)
+            report.seconds = self.clock.monotonic() - start
+            if progress is not None:
+                progress(report)
+
+        for path, sha1_git, mode, length in copies:
+            if f"swh:1:cnt:{sha1_git}" in report.failed:
+                continue
+            source, source_mode = first[sha1_git]
+            if not _is_complete(path, length):
+                _copy_file(source, path, mode, link and mode == source_mode)
+            report.skipped += 1
+        report.seconds = self.clock.monotonic() - start
+        return report
+
+    def _walk_directory(
+        self,
+        dir_id: str,
+        dest: str,
+        max_concurrency: int,
+        req_args: Dict[str, Any],
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """list the tree of a directory, creating its directories in `dest`
+
+        Yield the path and the entry of every file and symbolic link of the
+        tree, as the directories are listed in parallel.
+        """
+        list_directory = functools.partial(self.directory, typify=False, **req_args)
+        pending: Dict[concurrent.futures.Future, str] = {}
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_concurrency
+        ) as executor:
+
+            def submit(dir_id: str, path: str) -> None:
+                # run in a copy of the current context, as in `_call_groups`
+                ctx = contextvars.copy_context()
+                future = executor.submit(ctx.run, list_directory, f"swh:1:dir:{dir_id}")
+                pending[future] = path
+
+            try:
+                submit(dir_id, dest)
+                while pending:
+                    done, _ = concurrent.futures.wait(
+                        pending, return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+                    for future in done:
+                        path = pending.pop(future)
+                        for entry in future.result():
+                            entry_path = os.path.join(path, _entry_name(entry["name"]))
+                            if entry["type"] == "dir":
+                                os.makedirs(entry_path, exist_ok=True)
+                                submit(entry["target"], entry_path)
+                            elif entry["type"] == "rev":
+                                os.makedirs(entry_path, exist_ok=True)
+                            else:
+                                yield entry_path, entry
+            except BaseException:
+                executor.shutdown(wait=True, cancel_futures=True)
+                raise
+
+    def _checkout_file(
+        self, req_args: Dict[str, Any], item: Tuple[str, Dict[str, Any]]
+    ) -> Optional[int]:
+        """write a file of a checkout, return its size (None if present)"""
+        path, entry = item
+        swhid = f"swh:1:cnt:{entry['target']}"
+        mode = _checkout_mode(entry["perms"])
+        if mode is None:
+            if os.path.lexists(path):
+                return None
+            target = b"".join(self.content_raw(swhid, **req_args))
+            tmp = _sibling(path, "swh-link")
+            os.symlink(os.fsdecode(target), tmp)
+            os.replace(tmp, path)
+            return len(target)
+        if _is_complete(path, entry["length"]):
+            os.chmod(path, mode)
+            return None
+        return _write_file(path, self.content_raw_file(swhid, **req_args), mode)
+
+    def _download_to_dir(
+        self, dest_dir: str, req_args: Dict[str, Any], sha1_git: str
+    ) -> Optional[int]:
+        """download a content to `dest_dir`, return its size (None if present)"""
+        path = os.path.join(dest_dir, content_path(sha1_git))
+        if os.path.exists(path):
+            return None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        raw = self.content_raw_file(f"swh:1:cnt:{sha1_git}", **req_args)
+        return _write_file(path, raw, 0o644)
+
+    def _download_to_tar(
+        self,
+        tar: tarfile.TarFile,
+        lock: threading.Lock,
+        req_args: Dict[str, Any],
+        sha1_git: str,
+    ) -> int:
+        """download a content and add it to `tar`, return its size"""
+        with tempfile.SpooledTemporaryFile(max_size=TAR_SPOOL_SIZE) as spool:
+            for chunk in self.content_raw(f"swh:1:cnt:{sha1_git}", **req_args):
+                spool.write(chunk)
+            info = tarfile.TarInfo(content_path(sha1_git))
+            info.size = spool.tell()
+            info.mtime = int(self.clock.time())
+            info.mode = 0o644
+            spool.seek(0)
+            with lock:
+                tar.addfile(info, spool)
+        return info.size
+
+    @traced
     def origin_search(
         self,
         query: str,
@@ -1385,7 +3617,7 @@ class WebAPIClient:
         q = f"origin/search/{query}/"
         while not done:
             r = self._call(q, params=params, **req_args)
-            json = r.json()
+            json = self._decode(r)
             if limit and nb_returned + len(json) > limit:
                 json = json[: limit - nb_returned]
 
@@ -1401,6 +3633,7 @@ class WebAPIClient:
             else:
                 done = True
 
+    @traced
     def origin_save(self, visit_type: str, origin: str) -> Dict:
         """Save code now query for the origin with visit_type.
 
@@ -1417,8 +3650,9 @@ class WebAPIClient:
         """
         q = f"origin/save/{visit_type}/url/{origin}/"
         r = self._call(q, http_method="post")
-        return r.json()
+        return self._decode(r)
 
+    @traced
     def get_origin(self, swhid: CoreSWHID) -> Optional[Any]:
         """Walk the compressed graph to discover the origin of a given swhid
 
@@ -1433,6 +3667,7 @@ class WebAPIClient:
         with self._call(q, http_method="get") as r:
             return r.text
 
+    @traced
     def cooking_request(
         self, bundle_type: str, swhid: SWHIDish, email: Optional[str] = None, **req_args
     ) -> Dict[str, Any]:
@@ -1465,8 +3700,9 @@ class WebAPIClient:
             **req_args,
         )
         r.raise_for_status()
-        return r.json()
+        return self._decode(r)
 
+    @traced
     def cooking_check(
         self, bundle_type: str, swhid: SWHIDish, **req_args
     ) -> Dict[str, Any]:
@@ -1497,8 +3733,9 @@ class WebAPIClient:
             **req_args,
         )
         r.raise_for_status()
-        return r.json()
+        return self._decode(r)
 
+    @traced
     def cooking_fetch(
         self, bundle_type: str, swhid: SWHIDish, **req_args
     ) -> requests.models.Response:
@@ -1526,3 +3763,210 @@ class WebAPIClient:
         )
         r.raise_for_status()
         return r
+
+    @traced
+    def cook_many(
+        self,
+        bundle_type: str,
+        swhids: Iterable[SWHIDish],
+        dest: Union[None, str, "os.PathLike[str]"] = None,
+        max_concurrency: Optional[int] = None,
+        poll_delay: float = 1.0,
+        max_poll_delay: float = 60.0,
+        **req_args,
+    ) -> Iterator[CookedBundle]:
+        """Cook many bundles, yielding them as they are ready
+
+        The cooking of all the bundles is requested at once, then the
+        pending ones are polled by a single scheduler (the calling thread),
+        each one after a delay starting at `poll_delay` seconds and doubling
+        up to `max_poll_delay` seconds. Requests (and downloads of bundles)
+        are issued by up to `max_concurrency` threads (default to the
+        ``max_automatic_concurrency`` of the client), however many bundles
+        are pending.
+
+        If `dest` is given, each bundle is downloaded to a file of this
+        directory named after its SWHID (e.g. ``swh:1:dir:...tar.gz`` for a
+        ``flat`` bundle) with :meth:`fetch_bundle` before being yielded.
+
+        Args:
+            bundle_type: Type of the bundles
+            swhids: persistent identifiers of the objects to cook
+            dest: directory to download the bundles to
+            max_concurrency: number of requests issued at once
+            poll_delay: initial delay between two checks of a bundle
+            max_poll_delay: maximum delay between two checks of a bundle
+            req_args: extra keyword arguments for requests
+
+        Returns:
+            an iterator over the bundles done or failed, in the order they
+            reach this status
+
+        """
+        if max_concurrency is None:
+            max_concurrency = self._max_automatic_concurrency
+        dest_dir = None if dest is None else os.fspath(dest)
+        clock = self.clock
+        infos: Dict[str, Dict[str, Any]] = {}
+        delays: Dict[str, float] = {}
+        # (date, swhid) of the next checks, by date
+        polls: List[Tuple[float, str]] = []
+        # the operation each request runs, for the object whose SWHID it is
+        futures: Dict[concurrent.futures.Future, Tuple[str, str]] = {}
+
+        operations: Dict[str, Callable[[str], Any]] = {
+            "request": functools.partial(self.cooking_request, bundle_type, **req_args),
+            "check": functools.partial(self.cooking_check, bundle_type, **req_args),
+            "fetch": functools.partial(
+                self._write_bundle, bundle_type, dest_dir, req_args
+            ),
+        }
+
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_concurrency
+        ) as executor:
+
+            def submit(operation: str, swhid: str) -> None:
+                # run in a copy of the current context, as in `_call_groups`
+                ctx = contextvars.copy_context()
+                future = executor.submit(ctx.run, operations[operation], swhid)
+                futures[future] = (operation, swhid)
+
+            try:
+                for swhid in dict.fromkeys(str(swhid) for swhid in swhids):
+                    submit("request", swhid)
+                while futures or polls:
+                    now = clock.monotonic()
+                    while polls and polls[0][0] <= now:
+                        submit("check", heapq.heappop(polls)[1])
+                    if not futures:
+                        clock.sleep(polls[0][0] - now)
+                        continue
+                    timeout = polls[0][0] - now if polls else None
+                    done, _ = concurrent.futures.wait(
+                        futures,
+                        timeout=timeout,
+                        return_when=concurrent.futures.FIRST_COMPLETED,
+                    )
+                    for future in done:
+                        operation, swhid = futures.pop(future)
+                        error = future.exception()
+                        if isinstance(error, requests.RequestException):
+                            info = infos.get(swhid, {})
+                            yield CookedBundle(swhid, "failed", info, error=error)
+                            continue
+                        elif error is not None:
+                            raise error
+                        if operation == "fetch":
+                            yield CookedBundle(
+                                swhid, "done", infos[swhid], future.result()
+                            )
+                            continue
+                        info = infos[swhid] = future.result()
+                        if info["status"] == "done":
+                            if dest_dir is None:
+                                yield CookedBundle(swhid, "done", info)
+                            else:
+                                submit("fetch", swhid)
+                        elif info["status"] == "failed":
+                            yield CookedBundle(swhid, "failed", info)
+                        else:
+                            delay = delays.get(swhid, poll_delay / 2) * 2
+                            delays[swhid] = delay = min(delay, max_poll_delay)
+                            heapq.heappush(polls, (clock.monotonic() + delay, swhid))
+            except BaseException:
+                executor.shutdown(wait=True, cancel_futures=True)
+                raise
+
+    def _write_bundle(
+        self,
+        bundle_type: str,
+        dest_dir: Optional[str],
+        req_args: Dict[str, Any],
+        swhid: str,
+    ) -> str:
+        """download a bundle to `dest_dir`, return the path of its file"""
+        assert dest_dir is not None
+        path = os.path.join(dest_dir, swhid + BUNDLE_EXTENSIONS.get(bundle_type, ""))
+        self.fetch_bundle(bundle_type, swhid, path, **req_args)
+        return path
+
+    @contextlib.contextmanager
+    def _bundle_tar(
+        self, bundle_type: str, swhid: SWHIDish, req_args: Dict[str, Any]
+    ) -> Iterator[tarfile.TarFile]:
+        """open the stream of a bundle as a tarball, see `extract_bundle`"""
+        if bundle_type not in TAR_BUNDLE_TYPES:
+            raise ValueError(f"{bundle_type} bundles are not tarballs")
+        raw = RawContent(self.cooking_fetch(bundle_type, swhid, **req_args))
+        with io.BufferedReader(raw, DEFAULT_CHUNK_SIZE) as f:
+            with tarfile.open(fileobj=f, mode="r|*") as tar:
+                yield tar
+
+    @traced
+    def extract_bundle(
+        self,
+        bundle_type: str,
+        swhid: SWHIDish,
+        dest: Union[str, "os.PathLike[str]"],
+        **req_args,
+    ) -> None:
+        """Extract a cooked bundle to a directory while it is downloaded
+
+        The bundle (of a type in :data:`TAR_BUNDLE_TYPES`) is decompressed
+        and extracted as it is received, in a single pass with a bounded
+        memory use, rather than written to a file to extract afterwards.
+
+        Members that would be written outside of `dest` (absolute paths,
+        ``..`` components or links) are refused, with the ``"data"``
+        extraction filter of :mod:`tarfile` where it is available.
+
+        Args:
+            bundle_type: Type of the bundle
+            swhid: object persistent identifier
+            dest: directory to extract the bundle to, created if needed
+            req_args: extra keyword arguments for requests.get()
+
+        Raises:
+            requests.HTTPError: if HTTP request fails
+            tarfile.TarError: if the bundle is not a valid tarball, or has
+              members outside of `dest`
+            ValueError: if the bundles of this type are not tarballs
+
+        """
+        dest = os.fspath(dest)
+        os.makedirs(dest, exist_ok=True)
+        with self._bundle_tar(bundle_type, swhid, req_args) as tar:
+            if hasattr(tarfile, "data_filter"):
+                tar.extractall(dest, filter="data")
+            else:
+                tar.extractall(dest, members=_safe_members(tar, dest))
+
+    @traced
+    def bundle_files(
+        self, bundle_type: str, swhid: SWHIDish, **req_args
+    ) -> Iterator[Tuple[str, IO[bytes]]]:
+        """Iterate over the files of a cooked bundle while it is downloaded
+
+        Yield a ``(path, file)`` pair for each regular file of the bundle (of
+        a type in :data:`TAR_BUNDLE_TYPES`), in the order of the tarball.
+        The bundle being read as a stream, each file can only be read until
+        the next pair is requested.
+
+        Args:
+            bundle_type: Type of the bundle
+            swhid: object persistent identifier
+            req_args: extra keyword arguments for requests.get()
+
+        Raises:
+            requests.HTTPError: if HTTP request fails
+            tarfile.TarError: if the bundle is not a valid tarball
+            ValueError: if the bundles of this type are not tarballs
+
+        """
+        with self._bundle_tar(bundle_type, swhid, req_args) as tar:
+            for member in tar:
+                if member.isfile():
+                    f = tar.extractfile(member)
+                    assert f is not None
+                    yield member.name, f
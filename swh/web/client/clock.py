@@ -0,0 +1,116 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+"""Sources of time of the client
+
+All the timing of a :class:`swh.web.client.client.WebAPIClient` (request
+dates, retry delays and in-process rate limit pacing) goes through a
+:class:`Clock`, the system clock by default.
+
+A :class:`VirtualClock` only moves forward when something sleeps on it, or
+when told to. A client using one paces its requests in virtual time, in the
+requesting threads rather than in the rate limit enforcer thread: tests and
+simulations run hours of paced traffic in milliseconds, deterministically.
+
+.. code-block:: python
+
+   from swh.web.client.clock import VirtualClock
+   from swh.web.client.client import WebAPIClient
+
+   clock = VirtualClock()
+   cli = WebAPIClient(api_url, clock=clock)
+   for swhid in swhids:
+       cli.content(swhid)
+   elapsed = clock.monotonic()  # virtual seconds needed to issue the requests
+
+The rate limiting backends sharing their state with other processes
+(:class:`swh.web.client.rate_limit.SharedRateLimitBackend` and
+:class:`swh.web.client.coordinator.TCPRateLimitBackend`) keep using the
+system clock, the only one these processes agree on.
+"""
+
+import threading
+import time
+from typing import Optional
+
+_1_SECOND = 1_000_000_000
+
+
+class Clock:
+    """The system clock (see the `time` module)"""
+
+    def time(self) -> float:
+        """seconds since the epoch"""
+        return time.time()
+
+    def time_ns(self) -> int:
+        """nanoseconds since the epoch"""
+        return time.time_ns()
+
+    def monotonic(self) -> float:
+        """seconds of a clock that cannot go backward"""
+        return time.monotonic()
+
+    def monotonic_ns(self) -> int:
+        """nanoseconds of a clock that cannot go backward"""
+        return time.monotonic_ns()
+
+    def sleep(self, seconds: float) -> None:
+        """suspend the calling thread for `seconds`"""
+        time.sleep(seconds)
+
+
+SYSTEM_CLOCK = Clock()
+
+
+class VirtualClock(Clock):
+    """A clock that only moves forward when slept on, or told to
+
+    Sleeping advances the clock and returns immediately. The monotonic clock
+    starts at 0, and the wall clock at `start` (seconds since the epoch, the
+    current date by default).
+
+    >>> clock = VirtualClock(start=1_700_000_000)
+    >>> clock.sleep(3600)
+    >>> clock.monotonic()
+    3600.0
+    >>> clock.time()
+    1700003600.0
+    """
+
+    def __init__(self, start: Optional[float] = None):
+        self._lock = threading.Lock()
+        self._now_ns = 0
+        if start is None:
+            self._epoch_ns = time.time_ns()
+        else:
+            self._epoch_ns = int(start * _1_SECOND)
+
+    def time(self) -> float:
+        return self.time_ns() / _1_SECOND
+
+    def time_ns(self) -> int:
+        return self._epoch_ns + self._now_ns
+
+    def monotonic(self) -> float:
+        return self._now_ns / _1_SECOND
+
+    def monotonic_ns(self) -> int:
+        return self._now_ns
+
+    def sleep(self, seconds: float) -> None:
+        self.advance_ns(round(seconds * _1_SECOND))
+
+    def advance_ns(self, duration_ns: int) -> None:
+        """move the clock `duration_ns` nanoseconds forward"""
+        if duration_ns < 0:
+            raise ValueError("a clock cannot go backward")
+        with self._lock:
+            self._now_ns += duration_ns
+
+    def advance_to_ns(self, date_ns: int) -> None:
+        """move the monotonic clock forward to `date_ns`, if not there yet"""
+        with self._lock:
+            self._now_ns = max(self._now_ns, date_ns)
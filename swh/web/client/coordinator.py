@@ -0,0 +1,289 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+"""Rate limiting coordination between hosts
+
+When workers of several hosts share a bearer token, they have to pace their
+requests against the same rate limit budget. The :class:`RateLimitCoordinator`
+is a small TCP server holding one token bucket per budget, and the
+:class:`TCPRateLimitBackend` is the rate limiting backend the clients use to
+talk to it.
+
+Start the coordinator on one host::
+
+   swh web rate-limit-coordinator --host 0.0.0.0 --port 5011
+
+and configure the clients of every host to use it:
+
+.. code-block:: python
+
+   from swh.web.client.client import WebAPIClient
+   from swh.web.client.coordinator import TCPRateLimitBackend
+
+   backend = TCPRateLimitBackend.for_api("coordinator-host", 5011, api_url, token)
+   cli = WebAPIClient(api_url, token, rate_limit_backend=backend)
+
+The protocol is made of newline-delimited JSON messages. Each request gets a
+single reply:
+
+- ``{"op": "info", "key": …, "start": …, "end": …, "limit": …,
+  "remaining": …, "reset": …, "seeded": …}`` reports rate limiting
+  information received from the server (or seeded, if ``seeded`` is true),
+  the reply is ``{}``;
+- ``{"op": "acquire", "key": …, "count": …}`` tries to take ``count`` tokens
+  at once (1 if omitted), the reply is ``{"wait_ns": …}``, 0 meaning the
+  tokens were granted;
+- ``{"op": "release", "key": …, "count": …}`` gives back unused tokens, the
+  reply is ``{}``;
+- ``{"op": "status", "key": …}`` returns the state of the bucket.
+
+The coordinator uses its own clock for the token generation, so the hosts
+clocks only need to be roughly synchronized.
+"""
+
+import json
+import logging
+import socket
+import socketserver
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+from swh.web.client.rate_limit import (
+    _PollingRateLimitBackend,
+    _register_for_fork,
+    _TokenBucket,
+    state_key,
+)
+
+if TYPE_CHECKING:
+    from swh.web.client.client import _RateLimitBucket, _RateLimitInfo
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 5011
+# how long to wait for the coordinator (connection, then each reply), in
+# seconds
+DEFAULT_TIMEOUT = 5.0
+
+
+class _CoordinatorHandler(socketserver.StreamRequestHandler):
+    """Serve the requests of one connection to the coordinator"""
+
+    server: "RateLimitCoordinator"
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                reply = self.server.process(request)
+            except Exception as e:
+                logger.warning("invalid coordinator request %r: %s", line, e)
+                reply = {"error": str(e)}
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+
+class RateLimitCoordinator(socketserver.ThreadingTCPServer):
+    """TCP server holding the rate limit budgets of a cluster
+
+    Use ``server_address[1]`` to learn the actual port when binding to
+    port 0.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "localhost", port: int = DEFAULT_PORT):
+        super().__init__((host, port), _CoordinatorHandler)
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, _TokenBucket] = {}
+
+    def process(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """process one request and return its reply"""
+        from swh.web.client.client import _RateLimitInfo
+
+        op = request["op"]
+        key = str(request["key"])
+        now = time.time_ns()
+        with self._lock:
+            bucket = self._buckets.setdefault(key, _TokenBucket())
+            if op == "info":
+                info = _RateLimitInfo(
+                    request["start"],
+                    request["end"],
+                    int(request["limit"]),
+                    int(request["remaining"]),
+                    request["reset"],
+                    seeded=bool(request.get("seeded", False)),
+                )
+                bucket.merge(info, now)
+                return {}
+            elif op == "acquire":
+                return {"wait_ns": bucket.take(now, int(request.get("count", 1)))}
+            elif op == "release":
+                if bucket.active(now):
+                    bucket.give_back(int(request["count"]))
+                return {}
+            elif op == "status":
+                if bucket.active(now):
+                    bucket.refill(now)
+                return {
+                    "active": bucket.active(now),
+                    "reset_date_ns": bucket.reset_date,
+                    "wait_ns": bucket.wait_ns,
+                    "tokens": bucket.tokens,
+                    "limit": bucket.limit,
+                    "remaining": bucket.remaining,
+                }
+            else:
+                raise ValueError(f"unknown operation: {op}")
+
+    def start(self) -> threading.Thread:
+        """serve requests in a daemon thread, return that thread"""
+        thread = threading.Thread(
+            target=self.serve_forever,
+            name=f"{__name__}.RateLimitCoordinator",
+            daemon=True,
+        )
+        thread.start()
+        return thread
+
+
+class TCPRateLimitBackend(_PollingRateLimitBackend):
+    """Rate limiting backend pacing requests through a `RateLimitCoordinator`
+
+    All the clients using the same coordinator and `key` share a single rate
+    limit budget. The connection is opened lazily and re-opened after
+    failures. If the coordinator cannot be reached, or does not reply within
+    `timeout` seconds, requests are not paced (and an error is logged) rather
+    than blocked.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int = DEFAULT_PORT,
+        key: str = "default",
+        timeout: float = DEFAULT_TIMEOUT,
+    ):
+        self.address: Tuple[str, int] = (host, port)
+        self.key = key
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sock: Optional[socket.socket] = None
+        self._rfile: Any = None
+        super().__init__()
+        _register_for_fork(self)
+
+    @classmethod
+    def for_api(
+        cls,
+        host: str,
+        port: int,
+        api_url: str,
+        bearer_token: Optional[str],
+        timeout: float = DEFAULT_TIMEOUT,
+    ) -> "TCPRateLimitBackend":
+        """return the backend for clients of `api_url` using `bearer_token`"""
+        return cls(host, port, key=state_key(api_url, bearer_token), timeout=timeout)
+
+    def _new_bucket_backend(self, name: str) -> "TCPRateLimitBackend":
+        host, port = self.address
+        return TCPRateLimitBackend(
+            host, port, key=f"{self.key}.{name}", timeout=self.timeout
+        )
+
+    def close(self) -> None:
+        super().close()
+        with self._lock:
+            self._disconnect()
+
+    def _reset_after_fork(self) -> None:
+        # the connection is shared with the parent process, use a new one.
+        super()._reset_after_fork()
+        self._lock = threading.Lock()
+        self._disconnect()
+
+    def _disconnect(self) -> None:
+        if self._sock is not None:
+            self._rfile.close()
+            self._sock.close()
+        self._sock = None
+        self._rfile = None
+
+    def _request(self, **request) -> Optional[Dict[str, Any]]:
+        """send a request to the coordinator and return its reply
+
+        return None if the coordinator could not be reached.
+        """
+        request["key"] = self.key
+        data = json.dumps(request).encode() + b"\n"
+        with self._lock:
+            try:
+                if self._sock is None:
+                    # the timeout applies to the connection and to every
+                    # later operation on the socket
+                    self._sock = socket.create_connection(
+                        self.address, timeout=self.timeout
+                    )
+                    self._rfile = self._sock.makefile("rb")
+                self._sock.sendall(data)
+                line = self._rfile.readline()
+                if not line:
+                    raise ConnectionError("connection closed by the coordinator")
+            except OSError as e:  # including socket.timeout
+                logger.error("cannot reach rate limit coordinator: %s", e)
+                self._disconnect()
+                return None
+        reply = json.loads(line)
+        if "error" in reply:
+            raise ValueError(f"rate limit coordinator error: {reply['error']}")
+        return reply
+
+    def new_info(
+        self, bucket: Optional["_RateLimitBucket"], info: "_RateLimitInfo"
+    ) -> None:
+        self._request(
+            op="info",
+            start=info.start,
+            end=info.end,
+            limit=info.limit,
+            remaining=info.remaining,
+            reset=info.reset_date,
+            seeded=info.seeded,
+        )
+
+    def try_acquire(self, count: int = 1) -> int:
+        reply = self._request(op="acquire", count=count)
+        if reply is None:
+            return 0
+        return int(reply["wait_ns"])
+
+    def release(self, bucket: Optional["_RateLimitBucket"], count: int) -> None:
+        self._request(op="release", count=count)
+
+    def _bucket(self) -> _TokenBucket:
+        reply = self._request(op="status")
+        if reply is None:
+            return _TokenBucket()
+        return _TokenBucket(
+            reply["reset_date_ns"],
+            reply["wait_ns"],
+            reply["tokens"],
+            # the coordinator generated the tokens due, in its own clock.
+            time.time_ns(),
+            reply["limit"],
+            reply["remaining"],
+        )
+
+
+def serve(host: str = "localhost", port: int = DEFAULT_PORT) -> None:
+    """run a coordinator until interrupted"""
+    with RateLimitCoordinator(host, port) as server:
+        logger.info("rate limit coordinator listening on %s:%d", host, port)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,183 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+"""Metrics of the requests issued by the client
+
+A :class:`swh.web.client.client.WebAPIClient` reports metrics about its
+requests to a :class:`MetricsSink`. The default sink discards them, two
+adapters forward them to a monitoring system:
+
+- :class:`StatsdMetricsSink` sends them with :mod:`swh.core.statsd` (e.g.
+  to a ``prometheus-statsd-exporter``);
+- :class:`PrometheusMetricsSink` exposes them with ``prometheus_client``
+  (an optional dependency).
+
+.. code-block:: python
+
+   from swh.web.client.client import WebAPIClient
+   from swh.web.client.metrics import StatsdMetricsSink
+
+   cli = WebAPIClient(api_url, metrics=StatsdMetricsSink())
+
+The metrics are tagged with the ``endpoint`` family of the request (the first
+segment of its path in the API, e.g. ``content`` or ``vault``):
+
+- ``swh_web_client_requests_total``: number of HTTP requests, also tagged
+  with the HTTP ``method`` and the response ``status`` (``error`` when no
+  response was received);
+- ``swh_web_client_request_duration_seconds``: time to receive the response
+  to a request (its body too, unless streamed), same tags;
+- ``swh_web_client_response_bytes_total``: size of the response bodies;
+- ``swh_web_client_retries_total``: number of requests retried, tagged with
+  the ``status`` of the response that triggered the retry;
+- ``swh_web_client_rate_limit_wait_seconds``: time spent waiting for a rate
+  limiting token, also tagged with the rate limit ``bucket``.
+"""
+
+import threading
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+Tags = Dict[str, str]
+
+REQUESTS_METRIC = "swh_web_client_requests_total"
+REQUEST_DURATION_METRIC = "swh_web_client_request_duration_seconds"
+RESPONSE_BYTES_METRIC = "swh_web_client_response_bytes_total"
+RETRIES_METRIC = "swh_web_client_retries_total"
+RATE_LIMIT_WAIT_METRIC = "swh_web_client_rate_limit_wait_seconds"
+
+# request durations (and rate limit waits) worth telling apart, in seconds
+DEFAULT_DURATION_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
+class MetricsSink:
+    """Receiver of the metrics of a client, this one discards them
+
+    Subclasses override `increment` and `timing`, which may be called from
+    several threads at once.
+    """
+
+    def increment(
+        self, metric: str, value: int = 1, tags: Optional[Tags] = None
+    ) -> None:
+        """add `value` to the counter `metric`"""
+        pass
+
+    def timing(self, metric: str, seconds: float, tags: Optional[Tags] = None) -> None:
+        """record a duration in the histogram `metric`"""
+        pass
+
+
+class StatsdMetricsSink(MetricsSink):
+    """Send the metrics with a `swh.core.statsd.Statsd` client
+
+    Default to the ``swh.core.statsd.statsd`` client, configured from the
+    ``STATSD_*`` environment variables. Durations are sent in milliseconds,
+    the unit expected by ``prometheus-statsd-exporter``.
+    """
+
+    def __init__(self, statsd: Any = None):
+        if statsd is None:
+            from swh.core.statsd import statsd
+        self.statsd = statsd
+
+    def increment(
+        self, metric: str, value: int = 1, tags: Optional[Tags] = None
+    ) -> None:
+        self.statsd.increment(metric, value, tags=tags)
+
+    def timing(self, metric: str, seconds: float, tags: Optional[Tags] = None) -> None:
+        self.statsd.timing(metric, seconds * 1000, tags=tags)
+
+
+class PrometheusMetricsSink(MetricsSink):
+    """Expose the metrics with ``prometheus_client``
+
+    The counters and histograms are registered in `registry` (default to the
+    global registry of ``prometheus_client``) the first time they are
+    reported. The label names of a metric are the tags it is first reported
+    with.
+    """
+
+    def __init__(
+        self,
+        registry: Any = None,
+        buckets: Sequence[float] = DEFAULT_DURATION_BUCKETS,
+    ):
+        import prometheus_client
+
+        self._prometheus = prometheus_client
+        if registry is None:
+            registry = prometheus_client.REGISTRY
+        self.registry = registry
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Tuple[Any, Tuple[str, ...]]] = {}
+
+    def _metric(self, kind: Any, metric: str, tags: Optional[Tags], **kwargs) -> Any:
+        tags = tags or {}
+        entry = self._metrics.get(metric)
+        if entry is None:
+            with self._lock:
+                entry = self._metrics.get(metric)
+                if entry is None:
+                    labels = tuple(sorted(tags))
+                    # the counter suffix is added by prometheus_client
+                    name = metric
+                    if kind is self._prometheus.Counter:
+                        name = metric[: -len("_total")]
+                    collector = kind(
+                        name, metric, labels, registry=self.registry, **kwargs
+                    )
+                    entry = self._metrics[metric] = (collector, labels)
+        collector, labels = entry
+        if not labels:
+            return collector
+        return collector.labels(*(tags.get(label, "") for label in labels))
+
+    def increment(
+        self, metric: str, value: int = 1, tags: Optional[Tags] = None
+    ) -> None:
+        self._metric(self._prometheus.Counter, metric, tags).inc(value)
+
+    def timing(self, metric: str, seconds: float, tags: Optional[Tags] = None) -> None:
+        histogram = self._metric(
+            self._prometheus.Histogram, metric, tags, buckets=self.buckets
+        )
+        histogram.observe(seconds)
+
+
+NULL_METRICS_SINK = MetricsSink()
+
+
+def endpoint_family(path: str) -> str:
+    """return the endpoint family of a query
+
+    `path` is the query relative to the API URL, or an absolute URL outside
+    of the API.
+
+    >>> endpoint_family("content/sha1_git:fe95a46679d128ff167b7c55df5d02356c5a1ae1/")
+    'content'
+    >>> endpoint_family("vault/flat/swh:1:dir:977fc4b98c0e85816348cebd3b12026407c368b6/")
+    'vault'
+    >>> endpoint_family("https://example.org/file")
+    'external'
+    """
+    if "://" in path:
+        return "external"
+    return path.split("/", 1)[0] or "root"
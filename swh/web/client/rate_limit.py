@@ -0,0 +1,724 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+"""Rate limiting backends
+
+A rate limiting backend decides when a :class:`swh.web.client.client.WebAPIClient`
+may issue its next request, based on the rate limiting information returned
+by the server (the ``X-RateLimit-*`` headers). Three backends are available:
+
+- :class:`swh.web.client.client.InProcessRateLimitBackend` (the default) paces
+  each client on its own, inside the current process;
+- :class:`SharedRateLimitBackend` paces all the processes of a host sharing
+  the same state file against a single budget;
+- :class:`swh.web.client.coordinator.TCPRateLimitBackend` paces processes of
+  multiple hosts through a coordinator server
+  (:class:`swh.web.client.coordinator.RateLimitCoordinator`).
+
+By default, each process using a :class:`swh.web.client.client.WebAPIClient`
+paces its requests on its own, believing it owns the whole rate limit budget
+advertised by the server. When multiple processes share a bearer token, they
+collectively overshoot that budget. The shared backends solve this:
+
+.. code-block:: python
+
+   from swh.web.client.client import WebAPIClient
+   from swh.web.client.rate_limit import SharedRateLimitBackend
+
+   backend = SharedRateLimitBackend.for_api(api_url, bearer_token)
+   cli = WebAPIClient(api_url, bearer_token, rate_limit_backend=backend)
+
+Every new client starts unpaced until the server sends rate limiting
+information. A :class:`RateLimitInfoStore` persists the last information
+received, so that clients started later (e.g. the workers of a restarted
+fleet) are paced from their first request. A static budget can also be
+configured (see the ``static_rate_limit`` argument of
+:class:`swh.web.client.client.WebAPIClient`).
+
+Whatever the backend, :meth:`swh.web.client.client.WebAPIClient.rate_limit_status`
+reports the state of the budget (as a :class:`RateLimitStatus`), and
+:meth:`swh.web.client.client.WebAPIClient.reserve` reserves a batch of
+requests at once.
+"""
+
+import abc
+import contextlib
+from datetime import datetime, timezone
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Iterator, Optional, Tuple, Union
+import weakref
+
+import attr
+
+from swh.web.client.clock import SYSTEM_CLOCK, Clock
+
+if TYPE_CHECKING:
+    from swh.web.client.client import _RateLimitBucket, _RateLimitInfo
+
+logger = logging.getLogger(__name__)
+
+# name of the rate limit bucket of the requests not matching any specific
+# bucket (see `swh.web.client.client.DEFAULT_RATE_LIMIT_BUCKETS`)
+RATE_LIMIT_DEFAULT_BUCKET = "api"
+
+_1_SECOND = 1_000_000_000
+
+# default directory holding the shared rate limit state files
+DEFAULT_STATE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "swh",
+    "web-client",
+    "rate-limit",
+)
+
+
+def state_key(api_url: str, bearer_token: Optional[str]) -> str:
+    """return a file name safe key identifying a rate limit budget
+
+    The budget is tied to the API and to the token used to access it. The
+    token is hashed so that it is never written to disk.
+
+    >>> state_key("https://example.org/api/1", None) == state_key(
+    ...     "https://example.org/api/1/", None
+    ... )
+    True
+    >>> state_key("https://example.org/api/1", "a") == state_key(
+    ...     "https://example.org/api/1", "b"
+    ... )
+    False
+    """
+    material = f"{api_url.rstrip('/')}\0{bearer_token or ''}"
+    return hashlib.sha256(material.encode()).hexdigest()[:32]
+
+
+@attr.s(frozen=True, slots=True)
+class RateLimitStatus:
+    """State of the rate limit budget of a client
+
+    When no rate limiting is in place (``active`` is False), requests are
+    issued right away and the other fields are not meaningful.
+    """
+
+    # True if requests are currently paced
+    active = attr.ib(type=bool, default=False)
+    # request budget of the current window, as reported by the server
+    limit = attr.ib(type=Optional[int], default=None)
+    # remaining budget, as last reported by the server
+    remaining = attr.ib(type=Optional[int], default=None)
+    # end of the current window
+    reset_date = attr.ib(type=Optional[datetime], default=None)
+    # delay between the generation of two tokens, in seconds
+    delay = attr.ib(type=float, default=0.0)
+    # number of requests that can be issued right away
+    free_tokens = attr.ib(type=int, default=0)
+    # number of requests waiting for a token
+    waiting = attr.ib(type=int, default=0)
+
+    def projected_wait(self, count: int = 1) -> float:
+        """estimate how long `count` more requests would wait, in seconds
+
+        Requests already waiting are served first. The estimate assumes the
+        current pace holds.
+
+        >>> status = RateLimitStatus(True, 100, 50, None, 0.5, 3, 1)
+        >>> status.projected_wait(2)
+        0.0
+        >>> status.projected_wait(10)
+        4.0
+        >>> RateLimitStatus().projected_wait(1000)
+        0.0
+        """
+        if not self.active:
+            return 0.0
+        missing = count + self.waiting - self.free_tokens
+        return max(missing, 0) * self.delay
+
+
+class RateLimitTimeout(TimeoutError):
+    """The requested rate limit budget could not be obtained in time
+
+    `projected_wait` estimates (in seconds) how long obtaining it would have
+    taken from the moment the attempt was given up.
+    """
+
+    def __init__(self, count: int, projected_wait: float):
+        super().__init__(
+            f"could not reserve {count} requests, "
+            f"projected wait: {projected_wait:.3f}s"
+        )
+        self.count = count
+        self.projected_wait = projected_wait
+
+
+def _to_datetime(date_ns: int) -> datetime:
+    """convert wall-clock nanoseconds to an aware datetime"""
+    return datetime.fromtimestamp(date_ns / _1_SECOND, tz=timezone.utc)
+
+
+class RateLimitInfoStore:
+    """Persist the last rate limit information received for a budget
+
+    The information is stored as a small JSON file, replaced atomically.
+    Saving happens at most once every `MIN_SAVE_INTERVAL` seconds for a given
+    window, so that it does not slow down the requests.
+    """
+
+    MIN_SAVE_INTERVAL = 1.0
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+        self._last_reset: Optional[float] = None
+        _register_for_fork(self)
+
+    def _reset_after_fork(self) -> None:
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_api(
+        cls,
+        api_url: str,
+        bearer_token: Optional[str],
+        directory: str = DEFAULT_STATE_DIR,
+    ) -> "RateLimitInfoStore":
+        """return the store of the budget of `api_url` used with `bearer_token`"""
+        return cls(os.path.join(directory, f"{state_key(api_url, bearer_token)}.json"))
+
+    def load(self, clock: Clock = SYSTEM_CLOCK) -> Optional["_RateLimitInfo"]:
+        """return the stored information, if its window is not over yet
+
+        The information is rebased on the current date (according to
+        `clock`): the remaining budget is spread over what is left of the
+        window.
+        """
+        from swh.web.client.client import _RateLimitInfo
+
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            limit = int(data["limit"])
+            remaining = int(data["remaining"])
+            reset = float(data["reset"])
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning("ignoring invalid rate limit state %s: %s", self.path, e)
+            return None
+        now = clock.time()
+        if reset <= now:
+            return None
+        return _RateLimitInfo(now, now, limit, remaining, reset, seeded=True)
+
+    def save(self, info: "_RateLimitInfo", clock: Clock = SYSTEM_CLOCK) -> None:
+        """store `info`, unless some information was stored very recently"""
+        if not self._lock.acquire(blocking=False):
+            return  # another thread is saving
+        try:
+            now = clock.monotonic()
+            if (
+                info.reset_date == self._last_reset
+                and now - self._last_save < self.MIN_SAVE_INTERVAL
+            ):
+                return
+            self._last_save = now
+            self._last_reset = info.reset_date
+            data = {
+                "limit": info.limit,
+                "remaining": info.remaining,
+                "reset": info.reset_date,
+            }
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                with open(tmp_path, "w") as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.warning("cannot save rate limit state %s: %s", self.path, e)
+        finally:
+            self._lock.release()
+
+
+class RateLimitBackend(abc.ABC):
+    """Interface of the rate limiting backends
+
+    The client reports the rate limiting information it receives through
+    :meth:`new_info`, and calls :meth:`acquire` before each request. Tokens
+    acquired in advance (see `WebAPIClient.reserve`) but not used are given
+    back with :meth:`release`.
+
+    Each rate limit bucket of a client (see
+    `swh.web.client.client.DEFAULT_RATE_LIMIT_BUCKETS`) is paced by the
+    backend returned by :meth:`for_bucket`. The `bucket` argument of the
+    methods below is the `_RateLimitBucket` of the request.
+
+    Backends holding locks, files or connections should register themselves
+    with `_register_for_fork` and reset them in `_reset_after_fork`.
+    """
+
+    @abc.abstractmethod
+    def new_info(self, bucket: "_RateLimitBucket", info: "_RateLimitInfo") -> None:
+        """process rate limiting information received by `bucket`"""
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def acquire(
+        self,
+        bucket: "_RateLimitBucket",
+        priority: str,
+        timeout: Optional[float] = None,
+        count: int = 1,
+    ) -> bool:
+        """wait until `bucket` may issue `count` requests
+
+        The tokens are acquired all at once. Return False if this was not
+        possible within `timeout` seconds.
+        """
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def release(self, bucket: "_RateLimitBucket", count: int) -> None:
+        """give back `count` acquired tokens that were not used"""
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def current_delay(self, bucket: "_RateLimitBucket") -> float:
+        """current delay between two requests of `bucket`, in seconds"""
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def status(self, bucket: "_RateLimitBucket") -> RateLimitStatus:
+        """current state of the rate limit budget of `bucket`"""
+        raise NotImplementedError()
+
+    def for_bucket(self, name: str) -> "RateLimitBackend":
+        """return the backend pacing the rate limit bucket called `name`
+
+        The default implementation returns the backend itself, which is
+        appropriate when the backend keeps its state in the buckets.
+        """
+        return self
+
+    def close(self) -> None:
+        """release the resources held by the backend"""
+
+    def _reset_after_fork(self) -> None:
+        """reset the state inherited from the parent process after a fork"""
+
+
+_ForkSensitive = Union[RateLimitBackend, RateLimitInfoStore]
+
+# backends (and stores) with a state to reset after a fork
+_FORK_SENSITIVE_BACKENDS: "weakref.WeakSet[_ForkSensitive]" = weakref.WeakSet()
+
+
+def _register_for_fork(backend: _ForkSensitive) -> None:
+    """have `backend._reset_after_fork` called in child processes"""
+    _FORK_SENSITIVE_BACKENDS.add(backend)
+
+
+def _after_fork_in_child() -> None:
+    for backend in list(_FORK_SENSITIVE_BACKENDS):
+        backend._reset_after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+class _TokenBucket:
+    """Token bucket arithmetic for a rate limit window
+
+    All dates are in nanoseconds, and must come from the same clock.
+
+    reset_date: end of the rate limit window
+    wait_ns:    delay between the generation of two tokens
+    tokens:     number of tokens currently available
+    last_grant: date up to which tokens have been generated
+    limit:      request budget of the window, as reported by the server
+    remaining:  remaining budget, as last reported by the server
+    seeded:     1 if the window comes from seeded information rather than
+                from the server (see `_RateLimitInfo`), 0 otherwise
+
+    Tokens are generated lazily from the elapsed time when the bucket is
+    consumed, there is no need for a background process.
+
+    >>> bucket = _TokenBucket(reset_date=10_000, wait_ns=100, tokens=2, last_grant=0)
+    >>> bucket.take(now=0), bucket.take(now=0)
+    (0, 0)
+    >>> bucket.take(now=0)  # no token left, we have to wait
+    100
+    >>> bucket.take(now=250)  # two tokens generated in the meantime
+    0
+    >>> bucket.tokens, bucket.last_grant
+    (1, 200)
+    >>> bucket.take(now=20_000)  # the window is over, no more pacing
+    0
+    >>> bucket = _TokenBucket(reset_date=10_000, wait_ns=100, tokens=2, last_grant=0)
+    >>> bucket.take(now=0, count=5)  # all or nothing
+    300
+    >>> bucket.give_back(1)
+    >>> bucket.take(now=0, count=3)
+    0
+    """
+
+    __slots__ = (
+        "reset_date",
+        "wait_ns",
+        "tokens",
+        "last_grant",
+        "limit",
+        "remaining",
+        "seeded",
+    )
+
+    def __init__(
+        self,
+        reset_date: int = 0,
+        wait_ns: int = 0,
+        tokens: int = 0,
+        last_grant: int = 0,
+        limit: int = 0,
+        remaining: int = 0,
+        seeded: int = 0,
+    ):
+        self.reset_date = reset_date
+        self.wait_ns = wait_ns
+        self.tokens = tokens
+        self.last_grant = last_grant
+        self.limit = limit
+        self.remaining = remaining
+        self.seeded = seeded
+
+    def as_tuple(self) -> Tuple[int, int, int, int, int, int, int]:
+        return (
+            self.reset_date,
+            self.wait_ns,
+            self.tokens,
+            self.last_grant,
+            self.limit,
+            self.remaining,
+            self.seeded,
+        )
+
+    def active(self, now: int) -> bool:
+        """True if the bucket is pacing requests at date `now`"""
+        return self.wait_ns > 0 and now < self.reset_date
+
+    def refill(self, now: int) -> int:
+        """generate the tokens due at date `now`, return how many"""
+        if now <= self.last_grant:
+            return 0
+        new = (now - self.last_grant) // self.wait_ns
+        self.tokens += new
+        self.last_grant += new * self.wait_ns
+        return new
+
+    def take(self, now: int, count: int = 1) -> int:
+        """try to take `count` tokens at once
+
+        return 0 if the tokens were taken, or the number of nanoseconds to
+        wait before enough tokens are available.
+        """
+        if not self.active(now):
+            return 0
+        self.refill(now)
+        if self.tokens >= count:
+            self.tokens -= count
+            return 0
+        return self.last_grant + (count - self.tokens) * self.wait_ns - now
+
+    def give_back(self, count: int) -> None:
+        """return `count` unused tokens to the bucket"""
+        self.tokens += count
+
+    def status(self, now: int, waiting: int = 0) -> RateLimitStatus:
+        """return the `RateLimitStatus` of the bucket at date `now`"""
+        if not self.active(now):
+            return RateLimitStatus(waiting=waiting)
+        self.refill(now)
+        return RateLimitStatus(
+            active=True,
+            limit=self.limit,
+            remaining=self.remaining,
+            reset_date=_to_datetime(self.reset_date),
+            delay=self.wait_ns / _1_SECOND,
+            free_tokens=self.tokens,
+            waiting=waiting,
+        )
+
+    def merge(self, info: "_RateLimitInfo", now: int) -> bool:
+        """update the bucket with information received from the server
+
+        This follows the same logic as the in-process rate limiting: a new
+        window starts with a small free budget (see
+        `_RateLimitInfo.setup_free_token`), and information about the current
+        window only replaces the current pace if it is stricter. Information
+        from the server always replaces seeded information, and is never
+        replaced by it.
+
+        Return True if the bucket changed.
+        """
+        if not self.active(now):
+            info.setup_free_token()
+            tokens = info.free_token
+        elif info.seeded and not self.seeded:
+            return False
+        elif self.seeded and not info.seeded:
+            # as when the enforcer of a process replaces seeded information,
+            # the new window comes without free token.
+            tokens = 0
+        elif info.reset_date_ns < self.reset_date:
+            return False  # outdated information
+        elif info.reset_date_ns > self.reset_date:
+            # a new window started while the previous one was still in use:
+            # the tokens left are meaningless, and we do not give free token.
+            tokens = 0
+        elif self.wait_ns < (info.wait_ns / 0.9):
+            # significantly stricter information for the same window
+            self.refill(now)
+            self.wait_ns = info.wait_ns
+            self.limit = info.limit
+            self.remaining = info.remaining
+            return True
+        else:
+            return False
+        self.reset_date = info.reset_date_ns
+        self.wait_ns = info.wait_ns
+        self.tokens = tokens
+        self.last_grant = now
+        self.limit = info.limit
+        self.remaining = info.remaining
+        self.seeded = int(info.seeded)
+        return True
+
+
+class _PollingRateLimitBackend(RateLimitBackend):
+    """Base class of the backends whose state lives outside of the process
+
+    Subclasses provide `try_acquire` and `_bucket`, waiting for a token is
+    done by polling the shared state.
+
+    All dates are wall-clock nanoseconds (``time.time_ns()``), the only clock
+    all processes agree on.
+
+    Request priorities are not enforced by these backends.
+
+    Each rate limit bucket other than the default one uses its own shared
+    state, see `_new_bucket_backend`.
+    """
+
+    # maximum time a waiting request sleeps before checking the shared state
+    # again, other processes might have received more lenient information.
+    MAX_POLL_DELAY = 1.0
+
+    def __init__(self) -> None:
+        self._waiting_lock = threading.Lock()
+        # number of threads of this process waiting for tokens
+        self._waiting = 0
+        self._bucket_backends: Dict[str, "_PollingRateLimitBackend"] = {}
+
+    def _reset_after_fork(self) -> None:
+        self._waiting_lock = threading.Lock()
+        self._waiting = 0
+
+    def for_bucket(self, name: str) -> RateLimitBackend:
+        if name == RATE_LIMIT_DEFAULT_BUCKET:
+            return self
+        with self._waiting_lock:
+            backend = self._bucket_backends.get(name)
+            if backend is None:
+                backend = self._new_bucket_backend(name)
+                self._bucket_backends[name] = backend
+            return backend
+
+    @abc.abstractmethod
+    def _new_bucket_backend(self, name: str) -> "_PollingRateLimitBackend":
+        """return a backend for the rate limit bucket called `name`
+
+        It must use a state of its own, shared with the backends of the same
+        bucket in other processes.
+        """
+        raise NotImplementedError()
+
+    def close(self) -> None:
+        for backend in self._bucket_backends.values():
+            backend.close()
+
+    @abc.abstractmethod
+    def try_acquire(self, count: int = 1) -> int:
+        """try to take `count` tokens from the shared budget
+
+        return 0 if the request can be issued, or the number of nanoseconds to
+        wait before trying again.
+        """
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def _bucket(self) -> _TokenBucket:
+        """return a copy of the current state of the shared budget"""
+        raise NotImplementedError()
+
+    def acquire(
+        self,
+        bucket: Optional["_RateLimitBucket"] = None,
+        priority: Optional[str] = None,
+        timeout: Optional[float] = None,
+        count: int = 1,
+    ) -> bool:
+        wait_ns = self.try_acquire(count)
+        if not wait_ns:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._waiting_lock:
+            self._waiting += 1
+        try:
+            while wait_ns:
+                delay = min(wait_ns / _1_SECOND, self.MAX_POLL_DELAY)
+                if deadline is not None:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        return False
+                    delay = min(delay, left)
+                time.sleep(delay)
+                wait_ns = self.try_acquire(count)
+            return True
+        finally:
+            with self._waiting_lock:
+                self._waiting -= 1
+
+    def current_delay(self, bucket: Optional["_RateLimitBucket"] = None) -> float:
+        state = self._bucket()
+        if state.wait_ns <= 1 or not state.active(time.time_ns()):
+            return 0.0
+        return state.wait_ns / _1_SECOND
+
+    def status(self, bucket: Optional["_RateLimitBucket"] = None) -> RateLimitStatus:
+        return self._bucket().status(time.time_ns(), self._waiting)
+
+
+class SharedRateLimitBackend(_PollingRateLimitBackend):
+    """Rate limit budget shared by all processes using the same state file
+
+    The state is a small fixed-size record (see `_STATE`) stored in a
+    memory-mapped file. Every access happens while holding an exclusive
+    ``flock`` on that file, so the token bucket is updated atomically across
+    processes. The token are generated lazily from the elapsed time (see
+    `_TokenBucket`), so no process has to run a background thread.
+
+    This backend relies on ``fcntl`` and is therefore only available on
+    Unix-like systems.
+    """
+
+    # magic, followed by the fields of `_TokenBucket.as_tuple()`
+    _STATE = struct.Struct("<8sqqqqqqq")
+    _MAGIC = b"swhrl\x00\x00\x03"
+
+    def __init__(self, path: str):
+        import fcntl
+
+        self._fcntl = fcntl
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        super().__init__()
+        self._open()
+        _register_for_fork(self)
+
+    def _open(self) -> None:
+        # the file lock is held per open file, so it does not protect
+        # threads of the same process from each others.
+        self._thread_lock = threading.Lock()
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._fcntl.flock(self._fd, self._fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size < self._STATE.size:
+                os.ftruncate(self._fd, self._STATE.size)
+            self._map = mmap.mmap(self._fd, self._STATE.size)
+            if self._map[: len(self._MAGIC)] != self._MAGIC:
+                self._write(_TokenBucket())
+        finally:
+            self._fcntl.flock(self._fd, self._fcntl.LOCK_UN)
+
+    def _reset_after_fork(self) -> None:
+        # The open file is shared with the parent, and so is the file lock
+        # held on it. The child must open the file again to actually compete
+        # with its parent for the lock.
+        super()._reset_after_fork()
+        self._map.close()
+        os.close(self._fd)
+        self._open()
+
+    @classmethod
+    def for_api(
+        cls,
+        api_url: str,
+        bearer_token: Optional[str],
+        directory: str = DEFAULT_STATE_DIR,
+    ) -> "SharedRateLimitBackend":
+        """return the backend shared by all clients of `api_url` using `bearer_token`"""
+        return cls(os.path.join(directory, state_key(api_url, bearer_token)))
+
+    def _new_bucket_backend(self, name: str) -> "SharedRateLimitBackend":
+        return SharedRateLimitBackend(f"{self.path}.{name}")
+
+    def close(self) -> None:
+        super().close()
+        self._map.close()
+        os.close(self._fd)
+
+    def _read(self) -> _TokenBucket:
+        __, *values = self._STATE.unpack_from(self._map)
+        return _TokenBucket(*values)
+
+    def _write(self, bucket: _TokenBucket) -> None:
+        self._STATE.pack_into(self._map, 0, self._MAGIC, *bucket.as_tuple())
+
+    @contextlib.contextmanager
+    def _locked(self) -> Iterator[None]:
+        """context manager holding both the thread and the file lock"""
+        with self._thread_lock:
+            self._fcntl.flock(self._fd, self._fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                self._fcntl.flock(self._fd, self._fcntl.LOCK_UN)
+
+    def _bucket(self) -> _TokenBucket:
+        with self._locked():
+            return self._read()
+
+    def new_info(
+        self, bucket: Optional["_RateLimitBucket"], info: "_RateLimitInfo"
+    ) -> None:
+        now = time.time_ns()
+        with self._locked():
+            state = self._read()
+            if state.merge(info, now):
+                self._write(state)
+
+    def try_acquire(self, count: int = 1) -> int:
+        now = time.time_ns()
+        with self._locked():
+            state = self._read()
+            wait = state.take(now, count)
+            if not wait and state.active(now):
+                self._write(state)
+            return wait
+
+    def release(self, bucket: Optional["_RateLimitBucket"], count: int) -> None:
+        now = time.time_ns()
+        with self._locked():
+            state = self._read()
+            if state.active(now):
+                state.give_back(count)
+                self._write(state)
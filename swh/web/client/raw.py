@@ -0,0 +1,139 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+"""File-like access to raw contents
+
+:meth:`swh.web.client.client.WebAPIClient.content_raw_file` returns a
+:class:`RawContent`, a readable binary file reading the raw content directly
+into the buffers of the caller:
+
+.. code-block:: python
+
+   buffer = bytearray(1024 * 1024)
+   with cli.content_raw_file(swhid) as raw:
+       while n := raw.readinto(buffer):
+           process(memoryview(buffer)[:n])
+
+   # or, to copy it to a file or a socket through a single buffer
+   with cli.content_raw_file(swhid) as raw, open(path, "wb") as f:
+       raw.copy_to(f)
+"""
+
+import functools
+import http.client
+import io
+from typing import Any, Callable, Optional
+
+import requests
+from urllib3.response import HTTPResponse
+
+from swh.web.client.checksums import VerifyingStream
+
+# default size of the buffer of `RawContent.copy_to`
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+class RawContent(io.RawIOBase):
+    """Body of a streamed response to a raw content request, as a file
+
+    When the body is not content-encoded, `readinto` reads from the
+    connection straight into the buffer it is given, without intermediate
+    copies. Otherwise the body is decoded by ``urllib3`` first, and if it
+    was already read (e.g. by a
+    :class:`swh.web.client.recording.RecordingAdapter`), it is read from
+    ``response.content``.
+
+    If a `stream` is given, the data read are hashed with it, and it is
+    verified once the end of the content is reached (see
+    :class:`swh.web.client.checksums.VerifyingStream`).
+    """
+
+    def __init__(
+        self,
+        response: requests.Response,
+        stream: Optional[VerifyingStream] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ):
+        super().__init__()
+        self._response = response
+        self._stream = stream
+        self.chunk_size = chunk_size
+        self._eof = False
+        raw = response.raw
+        fp = getattr(raw, "_fp", None)
+        encoding = response.headers.get("Content-Encoding", "identity")
+        consumed = getattr(response, "_content_consumed", False)
+        # reading from the underlying http.client response bypasses urllib3,
+        # which always reads into an intermediate bytes object
+        self.direct = (
+            encoding == "identity" and hasattr(fp, "readinto") and not consumed
+        )
+        self._fp: Any = fp
+        self._read: Callable[[int], bytes]
+        if consumed:
+            self._read = io.BytesIO(response.content).read
+        elif isinstance(raw, HTTPResponse):
+            self._read = functools.partial(raw.read, decode_content=True)
+        else:
+            # e.g. the file-like body of a replayed response
+            self._read = raw.read
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        if self._eof:
+            return 0
+        view = memoryview(buffer).cast("B")
+        if not view:
+            return 0
+        try:
+            if self.direct:
+                n = self._fp.readinto(view)
+            else:
+                data = self._read(len(view))
+                n = len(data)
+                view[:n] = data
+        except http.client.IncompleteRead as e:
+            raise requests.exceptions.ChunkedEncodingError(e)
+        if n:
+            if self._stream is not None:
+                self._stream.update(view[:n])
+            return n
+        self._eof = True
+        if self.direct:
+            # the body was read entirely, the connection can be reused
+            self._response.raw.release_conn()
+        if self._stream is not None:
+            self._stream.verify()
+        return 0
+
+    def copy_to(self, fileobj: Any) -> int:
+        """write the rest of the content to a file or socket, return its size
+
+        Every chunk goes through the same buffer of `chunk_size` bytes.
+        """
+        view = memoryview(bytearray(self.chunk_size))
+        sendall = getattr(fileobj, "sendall", None)
+        total = 0
+        while True:
+            n = self.readinto(view)
+            if not n:
+                return total
+            total += n
+            data = view[:n]
+            if sendall is not None:
+                sendall(data)
+                continue
+            while data:
+                written = fileobj.write(data)
+                data = data[written:]
+
+    def close(self) -> None:
+        if not self.closed:
+            self._response.close()
+        super().close()
@@ -0,0 +1,257 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+"""Recording of the HTTP exchanges of a client, and their offline replay
+
+A :class:`RecordingAdapter` records every exchange of a
+:class:`swh.web.client.client.WebAPIClient` (request, response with its
+headers and body, and timings) to a gzip-compressed file, holding one
+entry per line in the format of the entries of HTTP Archive (HAR) files. A
+:class:`ReplayAdapter` then serves the responses from such a recording,
+without any network access, waiting for the recorded response times (or a
+fraction of them):
+
+.. code-block:: python
+
+   from swh.web.client.client import WebAPIClient
+   from swh.web.client.recording import RecordingAdapter, ReplayAdapter
+
+   with RecordingAdapter("traffic.jsonl.gz") as recorder:
+       cli = WebAPIClient(adapter=recorder)
+       ...
+
+   # twice as fast as recorded
+   cli = WebAPIClient(adapter=ReplayAdapter("traffic.jsonl.gz", speed=2))
+
+The responses to a given request (same method, URL and body) are replayed
+in the order they were recorded. The rate limit windows announced by the
+recorded responses are shifted to the time of the replay (and scaled with
+its speed), so the client paces its requests as it did while recording.
+
+The bearer token of the client is not recorded.
+"""
+
+import base64
+import collections
+from datetime import datetime, timezone
+import gzip
+import io
+import json
+import threading
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from swh.web.client.clock import SYSTEM_CLOCK, Clock
+
+# request headers not worth recording, or not to be leaked in a recording
+IGNORED_REQUEST_HEADERS = frozenset({"authorization", "cookie"})
+
+# response headers describing the encoding of the body as sent on the wire,
+# the recorded body being the decoded one
+IGNORED_RESPONSE_HEADERS = frozenset({"content-encoding", "transfer-encoding"})
+
+RATE_LIMIT_RESET_HEADER = "X-RateLimit-Reset"
+
+
+class ReplayMiss(requests.exceptions.ConnectionError):
+    """A request has no (more) response in a recording"""
+
+
+def _headers(headers: Any, ignored: frozenset) -> List[Dict[str, str]]:
+    return [
+        {"name": name, "value": value}
+        for name, value in headers.items()
+        if name.lower() not in ignored
+    ]
+
+
+def _encode_body(body: Any) -> Dict[str, Any]:
+    if body is None:
+        return {"size": 0, "text": ""}
+    if isinstance(body, str):
+        body = body.encode()
+    try:
+        return {"size": len(body), "text": body.decode()}
+    except UnicodeDecodeError:
+        text = base64.b64encode(body).decode()
+        return {"size": len(body), "text": text, "encoding": "base64"}
+
+
+def _decode_body(content: Dict[str, Any]) -> bytes:
+    if content.get("encoding") == "base64":
+        return base64.b64decode(content["text"])
+    return content["text"].encode()
+
+
+def _request_key(method: str, url: str, body: Any) -> Tuple[str, str, str]:
+    """key identifying the responses to a request in a recording"""
+    if isinstance(body, bytes):
+        body = body.decode(errors="replace")
+    return (method.upper(), url, body or "")
+
+
+class RecordingAdapter(BaseAdapter):
+    """Transport adapter recording the exchanges it sends to a file
+
+    The exchanges are sent with `adapter` (default to a plain
+    `requests.adapters.HTTPAdapter`). The body of streamed responses is read
+    at once to be recorded.
+
+    The recording file is complete once the adapter is closed (it is closed
+    with the session of the client, or at the end of a ``with`` block).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        adapter: Optional[BaseAdapter] = None,
+        clock: Clock = SYSTEM_CLOCK,
+    ):
+        super().__init__()
+        self.path = path
+        self._adapter = adapter if adapter is not None else HTTPAdapter()
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._file: Optional[io.TextIOBase] = gzip.open(path, "wt", encoding="utf-8")
+
+    def __enter__(self) -> "RecordingAdapter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def send(
+        self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None
+    ) -> requests.Response:
+        started = self._clock.time()
+        start = self._clock.monotonic()
+        response = self._adapter.send(
+            request,
+            stream=stream,
+            timeout=timeout,
+            verify=verify,
+            cert=cert,
+            proxies=proxies,
+        )
+        # read the body, even of a streamed response (kept in `_content`)
+        body = response.content
+        elapsed = self._clock.monotonic() - start
+        entry = {
+            "startedDateTime": datetime.fromtimestamp(
+                started, timezone.utc
+            ).isoformat(),
+            "time": elapsed * 1000,
+            "request": {
+                "method": request.method,
+                "url": request.url,
+                "headers": _headers(request.headers, IGNORED_REQUEST_HEADERS),
+                "postData": _encode_body(request.body),
+            },
+            "response": {
+                "status": response.status_code,
+                "statusText": response.reason,
+                "headers": _headers(response.headers, IGNORED_RESPONSE_HEADERS),
+                "content": _encode_body(body),
+            },
+        }
+        line = json.dumps(entry, separators=(",", ":"))
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line + "\n")
+        return response
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        self._adapter.close()
+
+
+def read_recording(path: str) -> List[Dict[str, Any]]:
+    """return the entries of a recording, in the order they were recorded"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class ReplayAdapter(BaseAdapter):
+    """Transport adapter serving the responses of a recording
+
+    Each response is served after its recorded response time divided by
+    `speed`, or immediately if `speed` is None. Waiting goes through `clock`,
+    so replaying with the :class:`swh.web.client.clock.VirtualClock` of the
+    client takes no actual time.
+
+    Raises :exc:`ReplayMiss` when a request has no recorded response left.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        speed: Optional[float] = 1.0,
+        clock: Clock = SYSTEM_CLOCK,
+    ):
+        super().__init__()
+        if speed is not None and speed <= 0:
+            raise ValueError(f"invalid replay speed: {speed}")
+        self.speed = speed
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, str, str], Deque[Dict[str, Any]]] = (
+            collections.defaultdict(collections.deque)
+        )
+        for entry in read_recording(path):
+            request = entry["request"]
+            body = _decode_body(request["postData"])
+            key = _request_key(request["method"], request["url"], body)
+            self._entries[key].append(entry)
+
+    def send(
+        self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None
+    ) -> requests.Response:
+        key = _request_key(request.method, request.url, request.body)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                raise ReplayMiss(
+                    f"no recorded response to {request.method} {request.url}",
+                    request=request,
+                )
+            entry = entries.popleft()
+        if self.speed is not None:
+            self._clock.sleep(entry["time"] / 1000 / self.speed)
+        return self._build_response(request, entry)
+
+    def _build_response(self, request, entry: Dict[str, Any]) -> requests.Response:
+        recorded = entry["response"]
+        response = requests.Response()
+        response.status_code = recorded["status"]
+        response.reason = recorded.get("statusText", "")
+        response.headers = CaseInsensitiveDict(
+            (header["name"], header["value"]) for header in recorded["headers"]
+        )
+        reset = response.headers.get(RATE_LIMIT_RESET_HEADER)
+        if reset is not None:
+            started = datetime.fromisoformat(entry["startedDateTime"]).timestamp()
+            window = int(reset) - started
+            if self.speed is not None:
+                window /= self.speed
+            response.headers[RATE_LIMIT_RESET_HEADER] = str(
+                int(self._clock.time() + window)
+            )
+        body = _decode_body(recorded["content"])
+        response.headers["Content-Length"] = str(len(body))
+        response.raw = io.BytesIO(body)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self) -> None:
+        pass
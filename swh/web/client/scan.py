@@ -0,0 +1,253 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+"""Hashing of local trees, and their scanning against the archive
+
+:meth:`swh.web.client.client.WebAPIClient.scan` computes the SWHIDs of the
+files and directories of a local tree, and queries their presence in the
+archive from the root down. As a known directory implies that everything
+below it is known, its subtree is not queried: scanning a tree that is
+mostly archived takes a handful of queries per level rather than one SWHID
+per file.
+
+.. code-block:: python
+
+   for path, obj in cli.scan("src", exclude=[".git"]).items():
+       if not obj.known:
+           print(path, obj.swhid)
+
+The files are hashed in a pool of threads, reading them through memory
+maps (``hashlib`` releases the GIL while hashing). :func:`iter_hashes`
+yields the objects of a tree as their SWHIDs are computed, so that they can
+be queried while the rest of the tree is hashed:
+
+.. code-block:: python
+
+   paths = {}
+
+   def swhids():
+       for obj in iter_hashes("src", exclude=[".git"]):
+           paths[obj.swhid] = obj.path
+           yield obj.swhid
+
+   for swhid, info in cli.iter_known(swhids()):
+       print(paths[swhid], info["known"])
+"""
+
+import concurrent.futures
+import hashlib
+import mmap
+import os
+import stat
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import attr
+
+from swh.model import from_disk
+from swh.model.model import Directory, DirectoryEntry
+from swh.model.swhids import CoreSWHID, ObjectType
+
+
+@attr.s(slots=True, frozen=True)
+class ScannedObject:
+    """A file or directory of a local tree scanned by `WebAPIClient.scan`"""
+
+    # SWHID computed from the local file or directory
+    swhid = attr.ib(type=CoreSWHID)
+    # whether the object is in the archive
+    known = attr.ib(type=bool)
+    # whether the archive was queried about the object, rather than it being
+    # in a known directory
+    queried = attr.ib(type=bool, default=True)
+
+
+@attr.s(slots=True, eq=False)
+class LocalObject:
+    """A file or directory of a local tree hashed by `iter_hashes`"""
+
+    # path relative to the root of the tree, with "/" separators ("." for the
+    # root itself)
+    path = attr.ib(type=str)
+    # path on the file system
+    fspath = attr.ib(type=bytes, repr=False)
+    # permissions of its directory entry (see `swh.model.from_disk.DentryPerms`)
+    perms = attr.ib(type=int)
+    # entries of a directory by name, None for the other objects
+    entries = attr.ib(type=Optional[Dict[bytes, "LocalObject"]], default=None)
+    # object id, once computed
+    object_id = attr.ib(type=Optional[bytes], default=None, repr=False)
+    # directory containing the object, if any
+    parent = attr.ib(type=Optional["LocalObject"], default=None, repr=False)
+    # number of entries of a directory not hashed yet
+    pending = attr.ib(type=int, default=0, repr=False)
+
+    @property
+    def swhid(self) -> CoreSWHID:
+        """SWHID of the object, once hashed"""
+        assert self.object_id is not None, f"{self.path} is not hashed yet"
+        object_type = (
+            ObjectType.CONTENT if self.entries is None else ObjectType.DIRECTORY
+        )
+        return CoreSWHID(object_type=object_type, object_id=self.object_id)
+
+
+def child_path(parent: str, name: bytes) -> str:
+    """path of an entry of `parent`, relative to the root of the scan
+
+    >>> child_path(".", b"src")
+    'src'
+    >>> child_path("src", b"main.c")
+    'src/main.c'
+    """
+    name_str = os.fsdecode(name)
+    return name_str if parent == "." else f"{parent}/{name_str}"
+
+
+def iter_subtree(obj: LocalObject) -> Iterator[LocalObject]:
+    """yield the objects below a directory"""
+    stack = [obj]
+    while stack:
+        for child in (stack.pop().entries or {}).values():
+            yield child
+            stack.append(child)
+
+
+def _sha1_git(obj: LocalObject) -> bytes:
+    """compute the object id of a file, as `swh.model.from_disk` does"""
+    mode = os.lstat(obj.fspath).st_mode
+    if stat.S_ISLNK(mode):
+        data = os.readlink(obj.fspath)
+        return hashlib.sha1(b"blob %d\0%s" % (len(data), data)).digest()
+    if not stat.S_ISREG(mode):
+        return hashlib.sha1(b"blob 0\0").digest()
+    with open(obj.fspath, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.sha1(b"blob 0\0").digest()
+        # the size is the one of the mapping, in case the file was modified
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            sha1 = hashlib.sha1(b"blob %d\0" % len(mapped))
+            sha1.update(mapped)
+    return sha1.digest()
+
+
+def _walk(
+    path: Union[str, "os.PathLike[str]"], exclude: Iterable[str]
+) -> Tuple[LocalObject, List[LocalObject]]:
+    """list a local tree, return its root and the objects to hash first
+
+    These are its files, and its directories without entries.
+    """
+    top = os.fsencode(path)
+    path_filter = from_disk.ignore_directories_patterns(
+        top, [os.fsencode(pattern) for pattern in exclude]
+    )
+    root = LocalObject(".", top, from_disk.DentryPerms.directory, {})
+    leaves = []
+    to_visit = [root]
+    while to_visit:
+        directory = to_visit.pop()
+        assert directory.entries is not None
+        with os.scandir(directory.fspath) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+        for entry in entries:
+            if not path_filter(directory.fspath, entry.name, None):
+                continue
+            child = LocalObject(
+                child_path(directory.path, entry.name),
+                entry.path,
+                from_disk.mode_to_perms(entry.stat(follow_symlinks=False).st_mode),
+                parent=directory,
+            )
+            if entry.is_dir(follow_symlinks=False):
+                child.entries = {}
+                to_visit.append(child)
+            else:
+                leaves.append(child)
+            directory.entries[entry.name] = child
+        directory.pending = len(directory.entries)
+        if not directory.entries:
+            leaves.append(directory)
+    return root, leaves
+
+
+def _directory_id(directory: LocalObject) -> bytes:
+    """compute the object id of a directory whose entries are all hashed"""
+    assert directory.entries is not None
+    entries = []
+    for name, child in directory.entries.items():
+        assert child.object_id is not None
+        entry_type = "file" if child.entries is None else "dir"
+        entries.append(
+            DirectoryEntry(
+                name=name, type=entry_type, target=child.object_id, perms=child.perms
+            )
+        )
+    return Directory(entries=tuple(entries)).id
+
+
+def _complete(obj: LocalObject) -> Iterator[LocalObject]:
+    """yield a hashed object, then its parents whose entries are all hashed"""
+    while True:
+        if obj.entries is not None:
+            obj.object_id = _directory_id(obj)
+        yield obj
+        if obj.parent is None:
+            return
+        obj = obj.parent
+        obj.pending -= 1
+        if obj.pending:
+            return
+
+
+def iter_hashes(
+    path: Union[str, "os.PathLike[str]"],
+    exclude: Iterable[str] = (),
+    max_workers: Optional[int] = None,
+) -> Iterator[LocalObject]:
+    """hash the files and directories of a local tree
+
+    Yield the objects of the tree as their SWHIDs are computed: the files in
+    the order their hashing completes, each directory as soon as all its
+    entries are hashed, and the root last. The files are hashed by up to
+    `max_workers` threads (default to the number of processors).
+
+    Files and directories whose path relative to `path` matches one of the
+    `exclude` shell patterns (e.g. ``.git`` or ``*/node_modules``) are
+    skipped, as by `swh.model.from_disk`.
+
+    The files are read through memory maps, they must not be truncated while
+    the tree is hashed.
+    """
+    root, leaves = _walk(path, exclude)
+    files = [obj for obj in leaves if obj.entries is None]
+    for directory in leaves:
+        if directory.entries is not None:
+            yield from _complete(directory)
+    if not files:
+        return
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=max_workers or os.cpu_count()
+    )
+    try:
+        pending = {executor.submit(_sha1_git, obj): obj for obj in files}
+        for future in concurrent.futures.as_completed(pending):
+            obj = pending.pop(future)
+            obj.object_id = future.result()
+            yield from _complete(obj)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def hash_tree(
+    path: Union[str, "os.PathLike[str]"],
+    exclude: Iterable[str] = (),
+    max_workers: Optional[int] = None,
+) -> LocalObject:
+    """hash a local tree, return its root directory (see `iter_hashes`)"""
+    obj = None
+    for obj in iter_hashes(path, exclude, max_workers):
+        pass
+    assert obj is not None and obj.path == "."
+    return obj
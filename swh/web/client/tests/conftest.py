@@ -12,6 +12,7 @@ from swh.web.client.client import KNOWN_QUERY_LIMIT, WebAPIClient
 
 from .api_data import API_DATA, API_URL
 from .api_data_static import API_DATA_STATIC, KNOWN_SWHIDS
+from .server import ArchiveServer
 
 
 @pytest.fixture
@@ -64,6 +65,13 @@ def web_api_client(request):
     return WebAPIClient(api_url=API_URL, **request.param)
 
 
+@pytest.fixture
+def archive_server():
+    """a local HTTP server standing in for the archive (see `ArchiveServer`)"""
+    with ArchiveServer() as server:
+        yield server
+
+
 @pytest.fixture
 def cli_global_config_dict():
     """Define a basic configuration yaml for the cli."""
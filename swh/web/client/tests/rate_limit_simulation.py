@@ -0,0 +1,169 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+"""Simulation of the rate limit enforcer in virtual time
+
+The :class:`Simulation` drives a `_RateLimitEnforcer` in the current thread,
+with a `VirtualClock`: instead of blocking until its next event, the enforcer
+jumps right to it. Rate limit windows of hours are paced in milliseconds,
+which lets the tests check the pacing curve and the benchmarks measure the
+enforcer overhead with thousands of clients and millions of tokens.
+
+The clients are :class:`SimulatedClient` objects, standing in for the
+`_RateLimitBucket` of a `WebAPIClient` that issues its requests as fast as the
+rate limit allows:
+
+.. code-block:: python
+
+   sim = Simulation()
+   client = sim.add_client(demand=100, limit=100, remaining=100, window=60)
+   sim.run()
+   client.duration(50)  # seconds needed to issue 50 requests
+"""
+
+import heapq
+import itertools
+import queue
+import time
+from typing import Any, List, Optional, Tuple
+
+from swh.web.client.client import _1_SECOND, _RateLimitEnforcer, _RateLimitInfo
+from swh.web.client.clock import VirtualClock
+
+# wall-clock date of the start of the simulations (seconds since epoch)
+EPOCH = 1_700_000_000
+
+
+class _VirtualFeed(queue.SimpleQueue):
+    """Feed of a simulated enforcer, waiting in virtual time
+
+    Items can be scheduled for a future date (see `put_at`). Waiting for the
+    next item advances the clock to its date, or to the end of the timeout,
+    as no other thread could feed the queue in the meantime.
+    """
+
+    def __init__(self, clock: VirtualClock):
+        self._clock = clock
+        self._items: List[Tuple[int, int, Any]] = []
+        self._counter = itertools.count()
+
+    def put_at(self, date_ns: int, item: Any) -> None:
+        heapq.heappush(self._items, (date_ns, next(self._counter), item))
+
+    def put(self, item: Any, block: bool = True, timeout: Optional[float] = None):
+        self.put_at(self._clock.monotonic_ns(), item)
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> Any:
+        deadline = None
+        if timeout is not None:
+            deadline = self._clock.monotonic_ns() + max(round(timeout * _1_SECOND), 1)
+        if self._items and (deadline is None or self._items[0][0] <= deadline):
+            date, __, item = heapq.heappop(self._items)
+            self._clock.advance_to_ns(date)
+            return item
+        if deadline is None:
+            raise RuntimeError("the enforcer would wait forever")
+        self._clock.advance_to_ns(deadline)
+        raise queue.Empty()
+
+    def empty(self) -> bool:
+        return not self._items
+
+    def qsize(self) -> int:
+        return len(self._items)
+
+
+class SimulatedClient:
+    """A client issuing `demand` requests as fast as the rate limit allows
+
+    It implements the methods of `_RateLimitBucket` used by the enforcer. It
+    always has a request waiting for a token until its demand is satisfied,
+    or until the rate limit window ends.
+    """
+
+    def __init__(self, clock: VirtualClock, demand: int, record: bool = True):
+        self._clock = clock
+        self.demand = demand
+        # date at which this client received its first rate limit information
+        self.start_ns = 0
+        # number of requests issued
+        self.issued = 0
+        # date of each request, if recorded
+        self.dates: List[int] = []
+        # number of batches of tokens granted by the enforcer
+        self.batches = 0
+        self._record = record
+        self._available = 0
+        self._active = False
+
+    def _issue(self) -> None:
+        count = min(self._available, self.demand - self.issued)
+        self._available -= count
+        self.issued += count
+        if self._record:
+            self.dates.extend([self._clock.monotonic_ns()] * count)
+
+    def _add_rate_limit_tokens(self, count: int) -> None:
+        self.batches += 1
+        self._available += count
+        self._issue()
+
+    def _rate_limit_waiters(self) -> int:
+        return int(self._active and self.issued < self.demand)
+
+    def _clear_rate_limit_tokens(self) -> None:
+        self._active = False
+        self._available = 0
+
+    def _refresh_rate_limit_tokens(self, free_token: int = 0) -> None:
+        self._active = True
+        self._available = free_token
+        self._issue()
+
+    def duration(self, count: int) -> float:
+        """seconds it took to issue `count` requests (recording must be on)"""
+        return (self.dates[count - 1] - self.start_ns) / _1_SECOND
+
+
+class Simulation:
+    """A `_RateLimitEnforcer` pacing `SimulatedClient` in virtual time"""
+
+    def __init__(self) -> None:
+        self.clock = VirtualClock(start=EPOCH)
+        self.feed = _VirtualFeed(self.clock)
+        self.enforcer = _RateLimitEnforcer(self.feed, self.clock)
+        self.clients: List[SimulatedClient] = []
+
+    def add_client(
+        self,
+        demand: int,
+        limit: int,
+        remaining: int,
+        window: float,
+        start: float = 0.0,
+        record: bool = True,
+    ) -> SimulatedClient:
+        """add a client starting at `start` seconds
+
+        It receives the rate limit information of a server allowing `limit`
+        requests per window, `remaining` of which are left for the `window`
+        seconds to come.
+        """
+        client = SimulatedClient(self.clock, demand, record)
+        client.start_ns = int(start * _1_SECOND)
+        date = EPOCH + start
+        info = _RateLimitInfo(date, date, limit, remaining, date + window)
+        self.feed.put_at(client.start_ns, (client, info))
+        self.clients.append(client)
+        return client
+
+    def run(self) -> float:
+        """run until all rate limit windows are over
+
+        return the CPU time used, in seconds.
+        """
+        start = time.process_time()
+        self.enforcer._run()
+        return time.process_time() - start
@@ -0,0 +1,521 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+"""Local stand-in for the Software Heritage archive Web API
+
+``requests_mock`` bypasses sockets, connection pools and latency, so it cannot
+be used to measure the performance of the client. :class:`ArchiveServer` is a
+real HTTP server, listening on localhost, serving:
+
+- the `API_DATA` and `API_DATA_STATIC` fixtures (with the same pagination as
+  the ``web_api_mock`` fixture);
+- the ``known/`` endpoint, knowing the `KNOWN_SWHIDS` and the synthetic
+  objects;
+- synthetic contents, directories and snapshots of any size (see
+  :meth:`ArchiveServer.add_content`, :meth:`ArchiveServer.add_directory`
+  and :meth:`ArchiveServer.add_snapshot`), snapshots being paginated;
+- synthetic trees of directories and contents (see
+  :meth:`ArchiveServer.add_tree`).
+
+Its behavior is controlled by the following attributes, that can be changed
+at any time:
+
+- ``latency``: delay before each response, in seconds;
+- ``jitter``: the delay varies uniformly by up to this many seconds;
+- ``error_rate``: fraction of the requests answered with ``error_status``;
+- ``error_status``: status of these responses (default to 429, which the
+  client retries);
+- ``page_size``: default number of snapshot branches per page;
+- ``rate_limit``: a ``(limit, window)`` pair; if set, responses carry
+  ``X-RateLimit-*`` headers for windows of ``window`` seconds allowing
+  ``limit`` requests, and requests exceeding the budget get a 429;
+- ``truncate_raw``: if set, the connection is closed after sending this many
+  bytes of a raw content (as with a flaky link);
+- ``truncations``: if set, only this many more raw contents are truncated;
+- ``ranges``: whether ``Range`` headers are honoured (the default).
+
+Raw contents can be requested with a single ``Range`` (e.g.
+``Range: bytes=0-1023``).
+
+.. code-block:: python
+
+   with ArchiveServer(latency=0.01, rate_limit=(1000, 60)) as server:
+       client = WebAPIClient(server.api_url)
+       dir_id = server.add_directory(100_000)
+       client.directory(f"swh:1:dir:{dir_id}")
+
+The ``stats`` counter records the number of requests per endpoint (and the
+number of raw content bytes sent, as ``raw_bytes``), and ``max_concurrency``
+the highest number of requests served at once.
+"""
+
+import collections
+import hashlib
+import http.server
+import json
+import random
+import re
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, unquote, urlencode, urlsplit
+
+from swh.model.hashutil import MultiHash
+from swh.model.model import Directory, DirectoryEntry
+from swh.web.client.client import KNOWN_QUERY_LIMIT
+
+from .api_data import API_DATA
+from .api_data_static import API_DATA_STATIC, KNOWN_SWHIDS
+
+API_PATH = "/api/1/"
+
+# pagination of the fixtures, as set up by the `web_api_mock` fixture
+_FIXTURE_NEXT_PAGES = {
+    "snapshot/cabcc7d7bf639bbe1cc3b41989e1806618dd5764/": (
+        "snapshot/cabcc7d7bf639bbe1cc3b41989e1806618dd5764/"
+        "?branches_count=1000&branches_from=refs/tags/v3.0-rc7"
+    ),
+    "origin/https://github.com/NixOS/nixpkgs/visits/?last_visit=50&per_page=10": (
+        "origin/https://github.com/NixOS/nixpkgs/visits/?last_visit=40&per_page=10"
+    ),
+}
+
+_DIRECTORY = re.compile(r"directory/([0-9a-f]{40})/")
+_SNAPSHOT = re.compile(r"snapshot/([0-9a-f]{40})/")
+_CONTENT = re.compile(r"content/sha1_git:([0-9a-f]{40})/(raw/)?")
+_BUNDLE = re.compile(r"vault/([a-z_]+)/(swh:1:[a-z]{3}:[0-9a-f]{40})/raw/?")
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)")
+
+# (status, headers, body)
+_Response = Tuple[int, Dict[str, str], bytes]
+
+
+def _fake_id(*parts: Any) -> str:
+    """return a deterministic fake object id"""
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def _json_response(data: Any, status: int = 200) -> _Response:
+    return status, {"Content-Type": "application/json"}, json.dumps(data).encode()
+
+
+def _not_found(path: str) -> _Response:
+    return _json_response(
+        {"exception": "NotFoundExc", "reason": f"{path} not found"}, 404
+    )
+
+
+class _ArchiveHandler(http.server.BaseHTTPRequestHandler):
+    """Forward the requests to the `ArchiveServer`"""
+
+    # keep connections alive, as the real archive does
+    protocol_version = "HTTP/1.1"
+    server: "ArchiveServer"
+
+    def _respond(self, method: str) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        status, headers, data = self.server.respond(
+            method, self.path, body, self.headers.get("Range")
+        )
+        self.send_response(status)
+        headers.setdefault("Content-Length", str(len(data)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        if method == "head":
+            return
+        self.wfile.write(data)
+        if len(data) < int(headers["Content-Length"]):
+            # truncated response, the client can only notice a closed connection
+            self.close_connection = True
+
+    def do_GET(self) -> None:
+        self._respond("get")
+
+    def do_POST(self) -> None:
+        self._respond("post")
+
+    def do_HEAD(self) -> None:
+        self._respond("head")
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+class ArchiveServer(http.server.ThreadingHTTPServer):
+    """Local HTTP server standing in for the archive Web API"""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 429,
+        page_size: int = 1000,
+        rate_limit: Optional[Tuple[int, float]] = None,
+        truncate_raw: Optional[int] = None,
+        truncations: Optional[int] = None,
+        ranges: bool = True,
+        seed: int = 0,
+    ):
+        super().__init__((host, port), _ArchiveHandler)
+        self._host = host
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.page_size = page_size
+        self.rate_limit = rate_limit
+        self.truncate_raw = truncate_raw
+        self.truncations = truncations
+        self.ranges = ranges
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+        self._data: Dict[str, Dict[str, str]] = {
+            "get": dict(API_DATA, **API_DATA_STATIC["get"]),
+            "post": dict(API_DATA_STATIC["post"]),
+        }
+        self._contents: Dict[str, bytes] = {}
+        self._bundles: Dict[Tuple[str, str], bytes] = {}
+        # serialized listings, large ones are costly to serialize
+        self._directories: Dict[str, bytes] = {}
+        self._snapshots: Dict[str, List[str]] = {}
+        self.known: Set[str] = set(KNOWN_SWHIDS)
+
+        # current rate limit window: (reset date, requests left)
+        self._window: Tuple[float, int] = (0.0, 0)
+
+        self.stats: collections.Counter = collections.Counter()
+        self.max_concurrency = 0
+        self._concurrency = 0
+
+    @property
+    def api_url(self) -> str:
+        """the URL to give to the `WebAPIClient`"""
+        return f"http://{self._host}:{self.server_port}{API_PATH.rstrip('/')}"
+
+    def start(self) -> "ArchiveServer":
+        """serve requests in a daemon thread"""
+        self._thread = threading.Thread(
+            target=self.serve_forever, name=f"{__name__}.ArchiveServer", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        # clients may close their connection in the middle of a response
+        # (e.g. an abandoned download), only report the actual errors
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+    def __enter__(self) -> "ArchiveServer":
+        return self.start()
+
+    def __exit__(self, *args: Any) -> None:
+        self.stop()
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.stats.clear()
+            self.max_concurrency = self._concurrency
+
+    # synthetic objects
+
+    def add_content(self, data: bytes) -> str:
+        """serve a content, return its sha1_git"""
+        sha1_git = MultiHash.from_data(data, {"sha1_git"}).hexdigest()["sha1_git"]
+        self._contents[sha1_git] = data
+        self.known.add(f"swh:1:cnt:{sha1_git}")
+        return sha1_git
+
+    def add_bundle(self, bundle_type: str, swhid: str, data: bytes) -> None:
+        """serve `data` as the cooked bundle of an object"""
+        self._bundles[bundle_type, swhid] = data
+
+    def add_directory(self, size: int, seed: Any = None) -> str:
+        """serve a directory of `size` file entries, return its id
+
+        The entries target contents that are not served.
+        """
+        dir_id = _fake_id("directory", size, seed)
+        entries = []
+        for i in range(size):
+            target = _fake_id("content", dir_id, i)
+            entries.append(
+                {
+                    "dir_id": dir_id,
+                    "type": "file",
+                    "target": target,
+                    "name": f"file-{i:08d}",
+                    "perms": 0o100644,
+                    "status": "visible",
+                    "length": i,
+                    "checksums": {
+                        "sha1_git": target,
+                        "sha1": _fake_id("sha1", target),
+                        "sha256": hashlib.sha256(target.encode()).hexdigest(),
+                    },
+                    "target_url": f"{self.api_url}/content/sha1_git:{target}/",
+                }
+            )
+        self._directories[dir_id] = json.dumps(entries).encode()
+        self.known.add(f"swh:1:dir:{dir_id}")
+        return dir_id
+
+    def add_tree(self, tree: Dict[str, Any]) -> str:
+        """serve a tree of directories and contents, return its root id
+
+        `tree` maps entry names to contents (as bytes), subtrees (as dicts),
+        or ``(perms, value)`` pairs for executable files (``0o100755``),
+        symbolic links (``0o120000``, the value being the target) and
+        submodules (``0o160000``, the value being a revision id).
+        """
+        entries = []
+        for name, value in tree.items():
+            perms = 0o040000 if isinstance(value, dict) else 0o100644
+            if isinstance(value, tuple):
+                perms, value = value
+            if perms == 0o160000:
+                type_, target = "rev", value
+            elif isinstance(value, dict):
+                type_, target = "dir", self.add_tree(value)
+            else:
+                type_, target = "file", self.add_content(value)
+            entries.append((name, type_, target, perms, value))
+        dir_id = Directory(
+            entries=tuple(
+                DirectoryEntry(
+                    name=name.encode(),
+                    type=type_,
+                    target=bytes.fromhex(target),
+                    perms=perms,
+                )
+                for name, type_, target, perms, _ in entries
+            )
+        ).id.hex()
+        listing = []
+        for name, type_, target, perms, value in entries:
+            entry = {
+                "dir_id": dir_id,
+                "type": type_,
+                "target": target,
+                "name": name,
+                "perms": perms,
+            }
+            if type_ == "file":
+                hashes = MultiHash.from_data(value).hexdigest()
+                entry.update(length=len(value), status="visible", checksums=hashes)
+            listing.append(entry)
+        self._directories[dir_id] = json.dumps(listing).encode()
+        self.known.add(f"swh:1:dir:{dir_id}")
+        return dir_id
+
+    def add_snapshot(self, size: int, seed: Any = None) -> str:
+        """serve a snapshot of `size` branches, return its id"""
+        snp_id = _fake_id("snapshot", size, seed)
+        self._snapshots[snp_id] = [f"refs/heads/branch-{i:08d}" for i in range(size)]
+        self.known.add(f"swh:1:snp:{snp_id}")
+        return snp_id
+
+    # request processing
+
+    def respond(
+        self,
+        method: str,
+        raw_path: str,
+        body: bytes,
+        range_header: Optional[str] = None,
+    ) -> _Response:
+        """return the response to a request"""
+        with self._lock:
+            self._concurrency += 1
+            self.max_concurrency = max(self.max_concurrency, self._concurrency)
+            delay = self.latency
+            if self.jitter:
+                delay += self._random.uniform(-self.jitter, self.jitter)
+            error = self.error_rate and self._random.random() < self.error_rate
+            rate_headers, limited = self._rate_limit()
+        try:
+            if delay > 0:
+                time.sleep(delay)
+            if not raw_path.startswith(API_PATH):
+                status, headers, data = _not_found(raw_path)
+            elif limited or error:
+                status, headers, data = _json_response(
+                    {"exception": "Throttled"},
+                    429 if limited else self.error_status,
+                )
+            else:
+                status, headers, data = self._route(
+                    method, raw_path[len(API_PATH) :], body, range_header
+                )
+            headers.update(rate_headers)
+            with self._lock:
+                self.stats[self._endpoint(raw_path)] += 1
+            return status, headers, data
+        finally:
+            with self._lock:
+                self._concurrency -= 1
+
+    @staticmethod
+    def _endpoint(raw_path: str) -> str:
+        """name of the endpoint of a request, for the stats"""
+        path = raw_path[len(API_PATH) :]
+        return path.split("/", 1)[0]
+
+    def _rate_limit(self) -> Tuple[Dict[str, str], bool]:
+        """consume the budget of the current window (lock must be held)
+
+        return the rate limit headers, and whether the request exceeds the
+        budget.
+        """
+        if self.rate_limit is None:
+            return {}, False
+        limit, window = self.rate_limit
+        now = time.time()
+        reset, left = self._window
+        if now >= reset:
+            reset, left = now + window, limit
+        limited = left <= 0
+        if not limited:
+            left -= 1
+        self._window = (reset, left)
+        headers = {
+            "X-RateLimit-Limit": str(limit),
+            "X-RateLimit-Remaining": str(left),
+            "X-RateLimit-Reset": str(int(reset)),
+        }
+        if limited:
+            headers["Retry-After"] = str(max(int(reset - now), 1))
+        return headers, limited
+
+    def _route(
+        self, method: str, path: str, body: bytes, range_header: Optional[str] = None
+    ) -> _Response:
+        data_method = "get" if method == "head" else method
+        for key in (path, unquote(path)):
+            text = self._data[data_method].get(key)
+            if text is not None:
+                headers = {"Content-Type": "application/json"}
+                next_page = _FIXTURE_NEXT_PAGES.get(key)
+                if next_page is not None:
+                    headers["Link"] = f'<{self.api_url}/{next_page}>; rel="next"'
+                return 200, headers, text.encode()
+
+        split = urlsplit(path)
+        query = parse_qs(split.query)
+        if method == "post" and split.path == "known/":
+            return self._known(body)
+        match = _DIRECTORY.fullmatch(split.path)
+        if match and match.group(1) in self._directories:
+            listing = self._directories[match.group(1)]
+            return 200, {"Content-Type": "application/json"}, listing
+        match = _SNAPSHOT.fullmatch(split.path)
+        if match and match.group(1) in self._snapshots:
+            return self._snapshot(match.group(1), query)
+        match = _CONTENT.fullmatch(split.path)
+        if match and match.group(1) in self._contents:
+            if match.group(2):
+                return self._raw(self._contents[match.group(1)], range_header, method)
+            return self._content(match.group(1))
+        match = _BUNDLE.fullmatch(split.path)
+        if match and (match.group(1), match.group(2)) in self._bundles:
+            bundle = self._bundles[match.group(1), match.group(2)]
+            status, headers, data = self._raw(bundle, range_header, method)
+            headers["ETag"] = f'"{_fake_id("bundle", bundle)}"'
+            return status, headers, data
+        return _not_found(path)
+
+    def _known(self, body: bytes) -> _Response:
+        swhids = json.loads(body)
+        if len(swhids) > KNOWN_QUERY_LIMIT:
+            return _json_response(
+                {"exception": "LargePayloadExc", "reason": "Too many swhids"}, 413
+            )
+        return _json_response({s: {"known": s in self.known} for s in swhids})
+
+    def _snapshot(self, snp_id: str, query: Dict[str, List[str]]) -> _Response:
+        branches = self._snapshots[snp_id]
+        count = int(query.get("branches_count", [self.page_size])[0])
+        start = 0
+        if "branches_from" in query:
+            start = branches.index(query["branches_from"][0])
+        page = branches[start : start + count]
+        data = {
+            "id": snp_id,
+            "branches": {
+                name: {
+                    "target": target,
+                    "target_type": "revision",
+                    "target_url": f"{self.api_url}/revision/{target}/",
+                }
+                for name, target in (
+                    (name, _fake_id("revision", snp_id, name)) for name in page
+                )
+            },
+        }
+        status, headers, body = _json_response(data)
+        if start + count < len(branches):
+            next_query = urlencode(
+                {"branches_count": count, "branches_from": branches[start + count]}
+            )
+            next_url = f"{self.api_url}/snapshot/{snp_id}/?{next_query}"
+            headers["Link"] = f'<{next_url}>; rel="next"'
+        return status, headers, body
+
+    def _raw(
+        self, data: bytes, range_header: Optional[str], method: str = "get"
+    ) -> _Response:
+        status = 200
+        headers = {"Content-Type": "application/octet-stream"}
+        match = _RANGE.fullmatch(range_header or "")
+        if self.ranges and match and any(match.groups()):
+            first, last = match.groups()
+            if first:
+                start, end = int(first), min(int(last or len(data) - 1), len(data) - 1)
+            else:
+                start, end = max(len(data) - int(last), 0), len(data) - 1
+            if start >= len(data) or start > end:
+                return 416, {"Content-Range": f"bytes */{len(data)}"}, b""
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+            data = data[start : end + 1]
+        headers["Content-Length"] = str(len(data))
+        if method != "head" and self.truncate_raw is not None:
+            with self._lock:
+                truncate = self.truncations != 0
+                if truncate and self.truncations is not None:
+                    self.truncations -= 1
+            if truncate:
+                data = data[: self.truncate_raw]
+        if method != "head":
+            with self._lock:
+                self.stats["raw_bytes"] += len(data)
+        return status, headers, data
+
+    def _content(self, sha1_git: str) -> _Response:
+        data = self._contents[sha1_git]
+        hashes = MultiHash.from_data(data).hexdigest()
+        return _json_response(
+            {
+                "length": len(data),
+                "status": "visible",
+                "checksums": hashes,
+                "data_url": f"{self.api_url}/content/sha1_git:{sha1_git}/raw/",
+            }
+        )
@@ -7,6 +7,7 @@ import json
 import os
 
 from click.testing import CliRunner
+import yaml
 
 from swh.web.client.cli import auth_cli, auth_generate_token, auth_revoke_token, web
 
@@ -97,3 +98,33 @@ def test_save_code_now_through_cli(mocker, web_api_mock, tmp_path, cli_config_pa
     ]
     for actual_save_request in actual_save_requests:
         assert actual_save_request in expected_save_requests
+
+
+def test_rate_limit_coordinator(mocker, cli_config_path):
+    serve = mocker.patch("swh.web.client.coordinator.serve")
+    result = runner.invoke(
+        web,
+        ["--config-file", cli_config_path, "rate-limit-coordinator", "--port", "4242"],
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0, result.output
+    serve.assert_called_once_with("localhost", 4242)
+
+
+def test_rate_limit_config(mocker, tmp_path, cli_global_config_dict):
+    mocker.patch("swh.web.client.coordinator.serve")
+    client_cls = mocker.patch("swh.web.client.client.WebAPIClient")
+    config_path = str(tmp_path / "config.yml")
+    with open(config_path, "w") as f:
+        cli_global_config_dict["persist_rate_limit"] = True
+        cli_global_config_dict["static_rate_limit"] = [100, 60]
+        yaml.dump(cli_global_config_dict, f)
+    result = runner.invoke(
+        web,
+        ["--config-file", config_path, "rate-limit-coordinator"],
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0, result.output
+    kwargs = client_cls.call_args[1]
+    assert kwargs["static_rate_limit"] == (100, 60.0)
+    assert kwargs["rate_limit_store"].path.endswith(".json")
@@ -0,0 +1,111 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+import socket
+import time
+
+import pytest
+
+from swh.model.swhids import CoreSWHID
+from swh.web.client.client import WebAPIClient, _RateLimitInfo
+from swh.web.client.coordinator import RateLimitCoordinator, TCPRateLimitBackend
+
+from .api_data import API_URL
+from .test_web_api_client import rate_headers
+
+
+@pytest.fixture
+def coordinator():
+    server = RateLimitCoordinator("localhost", 0)
+    server.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _backend(coordinator, key="test"):
+    host, port = coordinator.server_address[:2]
+    return TCPRateLimitBackend(host, port, key=key)
+
+
+def _info(remaining, limit, window):
+    now = time.time()
+    return _RateLimitInfo(now, now, limit, remaining, now + window)
+
+
+def test_coordinator_shared_budget(coordinator):
+    first = _backend(coordinator)
+    second = _backend(coordinator)
+    other = _backend(coordinator, key="other")
+
+    # a fresh window with a large budget: 10% of it is available right away
+    first.new_info(None, _info(100, 100, 60))
+    for i in range(5):
+        assert first.try_acquire() == 0
+        assert second.try_acquire() == 0
+    assert first.try_acquire() > 0
+    assert not second.acquire(timeout=0.01)
+    assert second.current_delay() == pytest.approx(60 / 90, rel=0.01)
+
+    # budgets are independent from each others
+    assert other.try_acquire() == 0
+    assert other.current_delay() == 0
+
+    first.close()
+    second.close()
+    other.close()
+
+
+def test_coordinator_reserve(coordinator):
+    backend = _backend(coordinator)
+    backend.new_info(None, _info(100, 100, 60))
+    assert backend.status().free_tokens == 10
+    assert not backend.acquire(count=11, timeout=0.01)
+    assert backend.acquire(count=10, timeout=0.01)
+    backend.release(None, 4)
+    status = backend.status()
+    assert status.free_tokens == 4
+    assert status.limit == 100
+    backend.close()
+
+
+def test_coordinator_unreachable():
+    # find a port nobody listens on
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        port = sock.getsockname()[1]
+    backend = TCPRateLimitBackend("localhost", port)
+    # requests are not blocked by a missing coordinator
+    assert backend.acquire(timeout=1)
+    backend.new_info(None, _info(1, 100, 60))
+    assert backend.current_delay() == 0
+
+
+def test_coordinator_no_reply():
+    # a coordinator accepting connections, but never replying
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        sock.listen()
+        backend = TCPRateLimitBackend("localhost", sock.getsockname()[1], timeout=0.1)
+        start = time.monotonic()
+        assert backend.acquire(timeout=None)
+        backend.new_info(None, _info(1, 100, 60))
+        assert backend.current_delay() == 0
+        assert time.monotonic() - start < 5
+        backend.close()
+
+
+def test_coordinator_client(coordinator, web_api_mock):
+    swhid = CoreSWHID.from_string("swh:1:cnt:fe95a46679d128ff167b7c55df5d02356c5a1ae1")
+    url = f"{API_URL}/content/sha1_git:{swhid.object_id.hex()}/"
+    web_api_mock.get(url, json={}, headers=rate_headers(10, 100, int(time.time()) + 60))
+    clients = [
+        WebAPIClient(api_url=API_URL, rate_limit_backend=_backend(coordinator))
+        for i in range(2)
+    ]
+    clients[0].content(swhid)
+    # the information received by one client paces the other one
+    assert clients[1].rate_limit_delay > 1
+    assert coordinator.process({"op": "status", "key": "test"})["limit"] == 100
@@ -0,0 +1,493 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+import gzip
+import io
+import os
+import random
+import shutil
+import tarfile
+
+import pytest
+import requests
+
+from swh.model.hashutil import MultiHash
+from swh.web.client import client as client_module
+from swh.web.client.client import ChecksumMismatch, WebAPIClient
+
+from .api_data import API_URL
+
+
+def _random_bytes(size, seed=0):
+    return random.Random(seed).randbytes(size)
+
+
+def test_download_content(archive_server, tmp_path):
+    data = _random_bytes(3 * 1024 * 1024 + 17)
+    swhid = "swh:1:cnt:" + archive_server.add_content(data)
+    client = WebAPIClient(archive_server.api_url)
+    dest = tmp_path / "blob"
+    metadata = client.download_content(swhid, dest, parts=4)
+    assert metadata["length"] == len(data)
+    assert dest.read_bytes() == data
+    assert sorted(os.listdir(tmp_path)) == ["blob"]
+    # the metadata, then one request per segment
+    assert archive_server.stats["content"] == 5
+    assert archive_server.stats["raw_bytes"] == len(data)
+
+    empty = "swh:1:cnt:" + archive_server.add_content(b"")
+    client.download_content(empty, tmp_path / "empty")
+    assert (tmp_path / "empty").read_bytes() == b""
+
+
+def test_download_content_resume(archive_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(client_module, "DOWNLOAD_CHUNK_SIZE", 100)
+    data = _random_bytes(10_000)
+    swhid = "swh:1:cnt:" + archive_server.add_content(data)
+    client = WebAPIClient(archive_server.api_url, request_retry=2)
+    dest = tmp_path / "blob"
+
+    # each request is cut after 1000 bytes, and each segment resumed once
+    archive_server.truncate_raw = 1000
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        client.download_content(swhid, dest, parts=2)
+    assert not dest.exists()
+    assert archive_server.stats["raw_bytes"] == 4000
+
+    # the next call picks up where the download stopped
+    archive_server.truncate_raw = None
+    client.download_content(swhid, dest, parts=8)
+    assert dest.read_bytes() == data
+    assert archive_server.stats["raw_bytes"] == len(data)
+    assert sorted(os.listdir(tmp_path)) == ["blob"]
+
+
+def test_download_content_no_range_resume(archive_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(client_module, "DOWNLOAD_CHUNK_SIZE", 100)
+    data = _random_bytes(10_000)
+    swhid = "swh:1:cnt:" + archive_server.add_content(data)
+    client = WebAPIClient(archive_server.api_url)
+    # the Range is ignored, and the whole content sent is cut once
+    archive_server.ranges = False
+    archive_server.truncate_raw = 3000
+    archive_server.truncations = 2
+    dest = tmp_path / "blob"
+    client.download_content(swhid, dest, parts=1)
+    assert dest.read_bytes() == data
+    assert archive_server.truncations == 0
+    assert sorted(os.listdir(tmp_path)) == ["blob"]
+
+
+def _mock_content(requests_mock, data, checksums=None):
+    sha1_git = MultiHash.from_data(data, {"sha1_git"}).hexdigest()["sha1_git"]
+    if checksums is None:
+        checksums = MultiHash.from_data(data).hexdigest()
+    url = f"{API_URL}/content/sha1_git:{sha1_git}/"
+    requests_mock.get(url, json={"length": len(data), "checksums": checksums})
+    requests_mock.get(f"{url}raw/", content=data)
+    return f"swh:1:cnt:{sha1_git}"
+
+
+def test_download_content_no_range(requests_mock, tmp_path):
+    data = _random_bytes(1000)
+    swhid = _mock_content(requests_mock, data)
+    client = WebAPIClient(API_URL)
+    client.download_content(swhid, tmp_path / "blob", parts=4)
+    assert (tmp_path / "blob").read_bytes() == data
+
+
+def test_download_content_mismatch(requests_mock, tmp_path):
+    data = _random_bytes(1000)
+    checksums = MultiHash.from_data(data).hexdigest()
+    checksums["sha256"] = "0" * 64
+    swhid = _mock_content(requests_mock, data, checksums)
+    client = WebAPIClient(API_URL)
+    with pytest.raises(ChecksumMismatch, match="sha256"):
+        client.download_content(swhid, tmp_path / "blob")
+    assert os.listdir(tmp_path) == []
+
+
+def test_download_content_single_segment(archive_server, tmp_path, monkeypatch):
+    def no_reread(path, checksums):
+        raise AssertionError("the file should be verified while written")
+
+    monkeypatch.setattr(client_module, "_verify_file", no_reread)
+    data = _random_bytes(100_000)
+    swhid = "swh:1:cnt:" + archive_server.add_content(data)
+    client = WebAPIClient(archive_server.api_url)
+    client.download_content(swhid, tmp_path / "blob", parts=1)
+    assert (tmp_path / "blob").read_bytes() == data
+
+
+def test_content_raw_verify(archive_server):
+    data = _random_bytes(100_000)
+    swhid = "swh:1:cnt:" + archive_server.add_content(data)
+    client = WebAPIClient(archive_server.api_url)
+    assert b"".join(client.content_raw(swhid)) == data
+    assert archive_server.stats["content"] == 1
+
+
+def test_content_raw_mismatch(requests_mock):
+    data = _random_bytes(1000)
+    swhid = _mock_content(requests_mock, data)
+    raw_url = f"{API_URL}/content/sha1_git:{swhid[10:]}/raw/"
+    corrupted = data[:-1] + b"\x00"
+    requests_mock.get(raw_url, content=corrupted, headers={"Content-Length": "1000"})
+    client = WebAPIClient(API_URL)
+    chunks = client.content_raw(swhid)
+    with pytest.raises(ChecksumMismatch, match="sha1_git"):
+        list(chunks)
+    assert b"".join(client.content_raw(swhid, check_checksums=False)) == corrupted
+    # the TLS verification argument of requests is not taken for this one
+    with pytest.raises(ChecksumMismatch):
+        list(client.content_raw(swhid, verify=False))
+    assert requests_mock.last_request.verify is False
+
+    # without a Content-Length, the checksums of the archive are used
+    requests_mock.get(raw_url, content=corrupted, headers={"Content-Length": "x"})
+    with pytest.raises(ChecksumMismatch, match="sha1, sha1_git, sha256"):
+        list(client.content_raw(swhid, headers={"X-Test": "1"}))
+    # including the request of the metadata
+    assert requests_mock.request_history[-1].url.endswith(f"{swhid[10:]}/")
+    assert requests_mock.request_history[-1].headers["X-Test"] == "1"
+
+
+def test_download_contents(archive_server, tmp_path):
+    contents = {}
+    for i in range(50):
+        data = _random_bytes(i * 100, seed=i)
+        contents[archive_server.add_content(data)] = data
+    missing = "swh:1:cnt:" + "0" * 40
+    swhids = [f"swh:1:cnt:{sha1_git}" for sha1_git in contents]
+    client = WebAPIClient(archive_server.api_url)
+    reports = []
+
+    report = client.download_contents(
+        iter([*swhids, swhids[0], missing]),
+        tmp_path,
+        max_concurrency=4,
+        progress=lambda report: reports.append(report.downloaded),
+    )
+    assert report.downloaded == 50
+    assert report.skipped == 1
+    assert list(report.failed) == [missing]
+    assert isinstance(report.failed[missing], requests.HTTPError)
+    assert report.bytes == sum(map(len, contents.values()))
+    assert report.throughput > 0
+    assert len(reports) == 51
+    for sha1_git, data in contents.items():
+        path = tmp_path / sha1_git[:2] / sha1_git[2:4] / sha1_git
+        assert path.read_bytes() == data
+    assert not [p for p in tmp_path.glob("**/.*")]
+    assert archive_server.stats["content"] == 51
+
+    # the contents already present are not downloaded again
+    report = client.download_contents(swhids, tmp_path)
+    assert (report.downloaded, report.skipped) == (0, 50)
+    assert archive_server.stats["content"] == 51
+
+
+def test_download_contents_tar(archive_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(client_module, "TAR_SPOOL_SIZE", 1000)
+    contents = {}
+    for i in range(10):
+        data = _random_bytes(i * 300, seed=i)
+        contents[archive_server.add_content(data)] = data
+    client = WebAPIClient(archive_server.api_url)
+    path = str(tmp_path / "contents.tar.gz")
+    with tarfile.open(path, "w|gz") as tar:
+        report = client.download_contents(
+            [f"swh:1:cnt:{sha1_git}" for sha1_git in contents], tar
+        )
+    assert report.downloaded == 10
+    with tarfile.open(path) as tar:
+        members = {
+            member.name: tar.extractfile(member).read() for member in tar.getmembers()
+        }
+    assert members == {
+        client_module.content_path(sha1_git): data
+        for sha1_git, data in contents.items()
+    }
+
+
+def test_content_raw_file(archive_server):
+    data = _random_bytes(300_000)
+    swhid = "swh:1:cnt:" + archive_server.add_content(data)
+    client = WebAPIClient(archive_server.api_url)
+
+    buffer = bytearray(65536)
+    received = bytearray()
+    with client.content_raw_file(swhid) as raw:
+        assert raw.direct
+        while n := raw.readinto(buffer):
+            received += buffer[:n]
+    assert received == data
+
+    with client.content_raw_file(swhid, chunk_size=1000) as raw:
+        out = io.BytesIO()
+        assert raw.copy_to(out) == len(data)
+    assert out.getvalue() == data
+
+    with client.content_raw_file(swhid) as raw:
+        out = io.BytesIO()
+        shutil.copyfileobj(io.BufferedReader(raw), out)
+    assert out.getvalue() == data
+
+
+def test_content_raw_file_encoded(requests_mock):
+    data = _random_bytes(1000) * 10
+    swhid = _mock_content(requests_mock, data)
+    raw_url = f"{API_URL}/content/sha1_git:{swhid[10:]}/raw/"
+    requests_mock.get(
+        raw_url, content=gzip.compress(data), headers={"Content-Encoding": "gzip"}
+    )
+    client = WebAPIClient(API_URL)
+    with client.content_raw_file(swhid, headers={"X-Test": "1"}) as raw:
+        assert not raw.direct
+        assert raw.read() == data
+    # the length of the content is the one of its metadata
+    assert requests_mock.request_history[-1].url.endswith(f"{swhid[10:]}/")
+    assert requests_mock.request_history[-1].headers["X-Test"] == "1"
+
+    requests_mock.get(raw_url, content=data[:-1] + b"\x00")
+    with client.content_raw_file(swhid, verify=False) as raw:
+        with pytest.raises(ChecksumMismatch):
+            raw.read()
+    assert requests_mock.last_request.verify is False
+    with client.content_raw_file(swhid, check_checksums=False) as raw:
+        assert raw.read() == data[:-1] + b"\x00"
+
+
+TREE = {
+    "README": b"hello\n",
+    "bin": {
+        "run": (0o100755, b"#!/bin/sh\n"),
+        "same": b"hello\n",
+        "run-copy": b"#!/bin/sh\n",
+    },
+    "link": (0o120000, b"README"),
+    "module": (0o160000, "0" * 40),
+    "empty": {},
+}
+
+
+def test_checkout(archive_server, tmp_path):
+    dir_id = archive_server.add_tree(TREE)
+    client = WebAPIClient(archive_server.api_url)
+    dest = tmp_path / "tree"
+    report = client.checkout(f"swh:1:dir:{dir_id}", dest)
+    assert (report.downloaded, report.skipped, report.failed) == (3, 2, {})
+
+    assert (dest / "README").read_bytes() == b"hello\n"
+    assert (dest / "bin" / "run").read_bytes() == b"#!/bin/sh\n"
+    assert os.readlink(dest / "link") == "README"
+    assert os.listdir(dest / "module") == []
+    assert os.listdir(dest / "empty") == []
+    assert (dest / "bin" / "run").stat().st_mode & 0o777 == 0o755
+    assert (dest / "bin" / "run-copy").stat().st_mode & 0o777 == 0o644
+    # contents are downloaded once, hard linked if their modes match
+    assert (dest / "README").stat().st_ino == (dest / "bin" / "same").stat().st_ino
+    assert (dest / "bin" / "run").stat().st_ino != (
+        dest / "bin" / "run-copy"
+    ).stat().st_ino
+    assert archive_server.stats["content"] == 3
+    assert not list(dest.glob("**/.*"))
+
+    # resume an interrupted checkout
+    (dest / "bin" / "run").unlink()
+    (dest / "README").unlink()
+    (dest / "link").unlink()
+    (dest / "bin" / "same").write_bytes(b"hel")
+    archive_server.reset_stats()
+    report = client.checkout(f"swh:1:dir:{dir_id}", dest, link=False)
+    assert (report.downloaded, report.skipped) == (3, 2)
+    assert archive_server.stats["content"] == 3
+    assert (dest / "bin" / "same").read_bytes() == b"hello\n"
+    assert (dest / "README").stat().st_ino != (dest / "bin" / "same").stat().st_ino
+    assert (dest / "bin" / "run").stat().st_mode & 0o777 == 0o755
+    assert os.readlink(dest / "link") == "README"
+
+
+def test_fetch_bundle(archive_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(client_module, "DOWNLOAD_CHUNK_SIZE", 100)
+    swhid = "swh:1:dir:" + "1" * 40
+    data = _random_bytes(10_000)
+    archive_server.add_bundle("flat", swhid, data)
+    client = WebAPIClient(archive_server.api_url, request_retry=2)
+    dest = tmp_path / "bundle.tar.gz"
+
+    archive_server.truncate_raw = 1000
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        client.fetch_bundle("flat", swhid, dest, parts=2)
+    assert not dest.exists()
+    assert archive_server.stats["raw_bytes"] == 4000
+
+    archive_server.truncate_raw = None
+    reports = []
+    report = client.fetch_bundle(
+        "flat", swhid, dest, parts=3, progress=lambda r: reports.append(r.done)
+    )
+    assert dest.read_bytes() == data
+    assert sorted(os.listdir(tmp_path)) == ["bundle.tar.gz"]
+    assert (report.length, report.resumed, report.bytes) == (10_000, 4000, 6000)
+    assert report.done == 10_000
+    assert report.throughput > 0
+    assert len(reports) == 60 and reports == sorted(reports)
+    assert archive_server.stats["raw_bytes"] == len(data)
+
+
+def test_fetch_bundle_changed(archive_server, tmp_path):
+    swhid = "swh:1:rev:" + "2" * 40
+    archive_server.add_bundle("git_bare", swhid, _random_bytes(5000))
+    client = WebAPIClient(archive_server.api_url, request_retry=1)
+    dest = tmp_path / "bundle.git.tar"
+    archive_server.truncate_raw = 1000
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        client.fetch_bundle("git_bare", swhid, dest)
+
+    # the bundle was cooked again in the meantime, the download restarts
+    data = _random_bytes(5000, seed=1)
+    archive_server.add_bundle("git_bare", swhid, data)
+    archive_server.truncate_raw = None
+    report = client.fetch_bundle("git_bare", swhid, dest)
+    assert (report.resumed, report.bytes) == (0, 5000)
+    assert dest.read_bytes() == data
+
+
+def test_fetch_bundle_no_range_resume(archive_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(client_module, "DOWNLOAD_CHUNK_SIZE", 100)
+    swhid = "swh:1:dir:" + "5" * 40
+    data = _random_bytes(5000)
+    archive_server.add_bundle("flat", swhid, data)
+    archive_server.ranges = False
+    archive_server.truncate_raw = 3000
+    archive_server.truncations = 2
+    client = WebAPIClient(archive_server.api_url, request_retry=3)
+    dest = tmp_path / "bundle.tar.gz"
+    # every retry gets the bundle from its start, what was already written
+    # is skipped
+    report = client.fetch_bundle("flat", swhid, dest, parts=1)
+    assert dest.read_bytes() == data
+    assert (report.resumed, report.bytes) == (0, 5000)
+    assert archive_server.stats["raw_bytes"] == 3000 + 3000 + 5000
+
+
+def test_fetch_bundle_changed_during_download(archive_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(client_module, "DOWNLOAD_CHUNK_SIZE", 100)
+    swhid = "swh:1:dir:" + "6" * 40
+    archive_server.add_bundle("flat", swhid, _random_bytes(5000))
+    archive_server.truncate_raw = 1000
+    archive_server.truncations = 1
+    client = WebAPIClient(archive_server.api_url, request_retry=2)
+    dest = tmp_path / "bundle.tar.gz"
+
+    def recook(report):
+        # a bundle of the same size, with another ETag
+        archive_server.add_bundle("flat", swhid, _random_bytes(5000, seed=1))
+
+    with pytest.raises(ChecksumMismatch, match="ETag changed"):
+        client.fetch_bundle("flat", swhid, dest, progress=recook)
+    assert os.listdir(tmp_path) == []
+
+
+def test_cook_many_resume(archive_server, tmp_path, mocker):
+    swhid = "swh:1:dir:" + "7" * 40
+    data = _random_bytes(5000)
+    archive_server.add_bundle("flat", swhid, data)
+    archive_server.truncate_raw = 1000
+    archive_server.truncations = 1
+    client = WebAPIClient(archive_server.api_url)
+    # the test server does not cook bundles
+    done = {"swhid": swhid, "status": "done"}
+    mocker.patch.object(client, "cooking_request", return_value=done)
+    (bundle,) = client.cook_many("flat", [swhid], tmp_path)
+    # the bundles are downloaded by fetch_bundle, resuming interrupted ones
+    assert bundle.path == str(tmp_path / f"{swhid}.tar.gz")
+    assert (tmp_path / f"{swhid}.tar.gz").read_bytes() == data
+    assert os.listdir(tmp_path) == [f"{swhid}.tar.gz"]
+
+
+def test_fetch_bundle_unknown_length(requests_mock, tmp_path):
+    swhid = "swh:1:dir:" + "3" * 40
+    url = f"{API_URL}/vault/flat/{swhid}/raw"
+    data = _random_bytes(1000) * 10
+    requests_mock.head(url, headers={"Content-Encoding": "gzip"})
+    requests_mock.get(
+        url, content=gzip.compress(data), headers={"Content-Encoding": "gzip"}
+    )
+    client = WebAPIClient(API_URL)
+    report = client.fetch_bundle("flat", swhid, tmp_path / "bundle")
+    assert (tmp_path / "bundle").read_bytes() == data
+    assert (report.length, report.bytes) == (len(data), len(data))
+
+
+def _tarball(members, mode="w:gz"):
+    """build a tarball from (TarInfo, data) pairs"""
+    out = io.BytesIO()
+    with tarfile.open(fileobj=out, mode=mode) as tar:
+        for info, data in members:
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data) if data else None)
+    return out.getvalue()
+
+
+def _member(name, type=tarfile.REGTYPE, mode=0o644, linkname=""):
+    info = tarfile.TarInfo(name)
+    info.type, info.mode, info.linkname = type, mode, linkname
+    return info
+
+
+def test_extract_bundle(archive_server, tmp_path):
+    swhid = "swh:1:dir:" + "4" * 40
+    big = _random_bytes(3 * 1024 * 1024)
+    archive_server.add_bundle(
+        "flat",
+        swhid,
+        _tarball(
+            [
+                (_member(swhid, tarfile.DIRTYPE, 0o755), b""),
+                (_member(f"{swhid}/big.bin"), big),
+                (_member(f"{swhid}/bin", tarfile.DIRTYPE, 0o755), b""),
+                (_member(f"{swhid}/bin/run", mode=0o755), b"#!/bin/sh\n"),
+                (_member(f"{swhid}/link", tarfile.SYMTYPE, linkname="big.bin"), b""),
+            ]
+        ),
+    )
+    client = WebAPIClient(archive_server.api_url)
+    client.extract_bundle("flat", swhid, tmp_path / "out")
+    root = tmp_path / "out" / swhid
+    assert (root / "big.bin").read_bytes() == big
+    assert (root / "bin" / "run").read_bytes() == b"#!/bin/sh\n"
+    assert (root / "bin" / "run").stat().st_mode & 0o777 == 0o755
+    assert os.readlink(root / "link") == "big.bin"
+
+    files = {path: f.read() for path, f in client.bundle_files("flat", swhid)}
+    assert files == {f"{swhid}/big.bin": big, f"{swhid}/bin/run": b"#!/bin/sh\n"}
+
+    with pytest.raises(ValueError):
+        client.extract_bundle("gitfast", swhid, tmp_path / "out")
+
+
+@pytest.mark.parametrize("name", ["../evil", "link", "{tmp_path}/evil"])
+@pytest.mark.parametrize("data_filter", [True, False], ids=["filter", "no-filter"])
+def test_extract_bundle_unsafe(
+    archive_server, tmp_path, monkeypatch, name, data_filter
+):
+    if not data_filter:
+        monkeypatch.delattr(tarfile, "data_filter")
+    if name == "link":
+        member, data = _member(name, tarfile.SYMTYPE, linkname="../evil"), b""
+    else:
+        member, data = _member(name.format(tmp_path=tmp_path)), b"evil\n"
+    swhid = "swh:1:rev:" + "5" * 40
+    archive_server.add_bundle("git_bare", swhid, _tarball([(member, data)], mode="w"))
+    client = WebAPIClient(archive_server.api_url)
+    if data_filter and member.name.startswith("/"):
+        # the "data" filter extracts absolute paths relatively to `dest`
+        client.extract_bundle("git_bare", swhid, tmp_path / "out")
+    else:
+        with pytest.raises(tarfile.TarError):
+            client.extract_bundle("git_bare", swhid, tmp_path / "out")
+    assert not (tmp_path / "evil").exists()
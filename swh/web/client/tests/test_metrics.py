@@ -0,0 +1,102 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+import collections
+from unittest import mock
+
+import pytest
+import requests
+
+from swh.web.client.client import WebAPIClient
+from swh.web.client.metrics import (
+    RATE_LIMIT_WAIT_METRIC,
+    REQUEST_DURATION_METRIC,
+    REQUESTS_METRIC,
+    RESPONSE_BYTES_METRIC,
+    RETRIES_METRIC,
+    MetricsSink,
+    StatsdMetricsSink,
+)
+
+from .api_data import API_DATA, API_URL
+
+CONTENT_SWHID = "swh:1:cnt:fe95a46679d128ff167b7c55df5d02356c5a1ae1"
+CONTENT_KEY = "content/sha1_git:fe95a46679d128ff167b7c55df5d02356c5a1ae1/"
+
+
+class RecordingSink(MetricsSink):
+    def __init__(self):
+        self.counters = collections.Counter()
+        self.timings = collections.defaultdict(list)
+
+    def increment(self, metric, value=1, tags=None):
+        self.counters[metric, tuple(sorted((tags or {}).items()))] += value
+
+    def timing(self, metric, seconds, tags=None):
+        self.timings[metric, tuple(sorted((tags or {}).items()))].append(seconds)
+
+
+def test_metrics(web_api_mock):
+    sink = RecordingSink()
+    client = WebAPIClient(api_url=API_URL, metrics=sink)
+    client.content(CONTENT_SWHID)
+    client.known([CONTENT_SWHID])
+    ok = (("endpoint", "content"), ("method", "get"), ("status", "200"))
+    assert sink.counters[REQUESTS_METRIC, ok] == 1
+    assert len(sink.timings[REQUEST_DURATION_METRIC, ok]) == 1
+    known = (("endpoint", "known"), ("method", "post"), ("status", "200"))
+    assert sink.counters[REQUESTS_METRIC, known] == 1
+    size = len(API_DATA[CONTENT_KEY].encode())
+    assert sink.counters[RESPONSE_BYTES_METRIC, (("endpoint", "content"),)] == size
+    waits = sink.timings[
+        RATE_LIMIT_WAIT_METRIC, (("bucket", "api"), ("endpoint", "content"))
+    ]
+    assert waits == [pytest.approx(0, abs=0.1)]
+
+    # retries, and requests that failed
+    web_api_mock.get(
+        f"{API_URL}/{CONTENT_KEY}",
+        [{"status_code": 429}] * 2 + [{"exc": requests.exceptions.ConnectTimeout}],
+    )
+    with pytest.raises(requests.exceptions.ConnectTimeout):
+        client.content(CONTENT_SWHID)
+    throttled = (("endpoint", "content"), ("method", "get"), ("status", "429"))
+    assert sink.counters[REQUESTS_METRIC, throttled] == 2
+    retries = (("endpoint", "content"), ("status", "429"))
+    assert sink.counters[RETRIES_METRIC, retries] == 2
+    error = (("endpoint", "content"), ("method", "get"), ("status", "error"))
+    assert sink.counters[REQUESTS_METRIC, error] == 1
+
+
+def test_statsd_metrics():
+    statsd = mock.Mock()
+    sink = StatsdMetricsSink(statsd)
+    sink.increment(REQUESTS_METRIC, tags={"endpoint": "content"})
+    statsd.increment.assert_called_once_with(
+        REQUESTS_METRIC, 1, tags={"endpoint": "content"}
+    )
+    sink.timing(REQUEST_DURATION_METRIC, 0.25, tags={"endpoint": "content"})
+    statsd.timing.assert_called_once_with(
+        REQUEST_DURATION_METRIC, 250, tags={"endpoint": "content"}
+    )
+
+
+def test_prometheus_metrics():
+    prometheus_client = pytest.importorskip("prometheus_client")
+    from swh.web.client.metrics import PrometheusMetricsSink
+
+    registry = prometheus_client.CollectorRegistry()
+    sink = PrometheusMetricsSink(registry)
+    tags = {"endpoint": "content", "method": "get", "status": "200"}
+    sink.increment(REQUESTS_METRIC, tags=tags)
+    sink.increment(REQUESTS_METRIC, tags=tags)
+    sink.timing(REQUEST_DURATION_METRIC, 0.2, tags=tags)
+    assert registry.get_sample_value(REQUESTS_METRIC, tags) == 2
+    assert (
+        registry.get_sample_value(
+            f"{REQUEST_DURATION_METRIC}_bucket", {**tags, "le": "0.25"}
+        )
+        == 1
+    )
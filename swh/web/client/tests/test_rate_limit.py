@@ -0,0 +1,247 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+import multiprocessing
+import time
+
+import pytest
+
+from swh.model.hashutil import hash_to_hex
+from swh.model.swhids import CoreSWHID
+from swh.web.client.client import WebAPIClient, _RateLimitInfo
+from swh.web.client.clock import VirtualClock
+from swh.web.client.rate_limit import (
+    RateLimitBackend,
+    RateLimitInfoStore,
+    SharedRateLimitBackend,
+)
+
+from .api_data import API_DATA, API_URL
+from .test_web_api_client import _wait_until, rate_headers
+
+
+@pytest.fixture
+def state_path(tmp_path):
+    return str(tmp_path / "rate-limit-state")
+
+
+def _info(remaining, limit, window):
+    now = time.time()
+    return _RateLimitInfo(now, now, limit, remaining, now + window)
+
+
+def test_backend_incomplete():
+    class IncompleteBackend(RateLimitBackend):
+        def new_info(self, bucket, info):
+            pass
+
+    # fails right away rather than on the first request
+    with pytest.raises(TypeError, match="abstract"):
+        IncompleteBackend()
+
+
+def test_shared_backend_free_tokens(state_path):
+    backend = SharedRateLimitBackend(state_path)
+    # no information yet, nothing is paced
+    assert backend.try_acquire() == 0
+    assert backend.current_delay() == 0
+
+    # a fresh window with a large budget: 10% of it is available right away
+    backend.new_info(None, _info(100, 100, 60))
+    for i in range(10):
+        assert backend.try_acquire() == 0
+    assert backend.try_acquire() > 0
+    assert backend.current_delay() == pytest.approx(60 / 90, rel=0.01)
+
+
+def test_shared_backend_state_is_shared(state_path):
+    first = SharedRateLimitBackend(state_path)
+    second = SharedRateLimitBackend(state_path)
+    # low budget, no free token
+    first.new_info(None, _info(10, 100, 60))
+    assert second.current_delay() == pytest.approx(6, rel=0.01)
+    assert second.try_acquire() > 0
+    assert not second.acquire(timeout=0.01)
+
+    # outdated information are ignored
+    second.new_info(None, _info(100, 100, 30))
+    assert first.current_delay() == pytest.approx(6, rel=0.01)
+
+
+def test_shared_backend_seeded(state_path):
+    backend = SharedRateLimitBackend(state_path)
+    now = time.time()
+    # a seeded window, ending after the window of the server
+    backend.new_info(None, _RateLimitInfo(now, now, 100, 100, now + 120, seeded=True))
+    assert backend.current_delay() == pytest.approx(120 / 90, rel=0.01)
+
+    # server information replaces it, even about an earlier window
+    backend.new_info(None, _info(10, 1000, 60))
+    assert backend.current_delay() == pytest.approx(6, rel=0.01)
+    # and is never replaced by seeded information
+    backend.new_info(None, _RateLimitInfo(now, now, 100, 100, now + 300, seeded=True))
+    assert backend.current_delay() == pytest.approx(6, rel=0.01)
+
+
+def test_shared_backend_reserve(state_path):
+    backend = SharedRateLimitBackend(state_path)
+    backend.new_info(None, _info(100, 100, 60))
+    status = backend.status()
+    assert status.active
+    assert status.free_tokens == 10
+    # the tokens are taken all at once, or not at all
+    assert not backend.acquire(count=11, timeout=0.01)
+    assert backend.status().free_tokens == 10
+    assert backend.acquire(count=8, timeout=0.01)
+    assert backend.status().projected_wait(3) == pytest.approx(60 / 90, rel=0.01)
+    backend.release(None, 5)
+    assert backend.status().free_tokens == 7
+
+
+def test_shared_backend_buckets(state_path):
+    backend = SharedRateLimitBackend(state_path)
+    vault = backend.for_bucket("vault")
+    assert backend.for_bucket("api") is backend
+    assert backend.for_bucket("vault") is vault
+    assert vault.path == f"{state_path}.vault"
+    # the buckets are paced independently
+    vault.new_info(None, _info(10, 100, 60))
+    assert vault.current_delay() > 1
+    assert backend.current_delay() == 0
+    backend.close()
+
+
+def _consume(path, count):
+    backend = SharedRateLimitBackend(path)
+    for i in range(count):
+        backend.acquire()
+
+
+def test_shared_backend_multi_process(state_path):
+    backend = SharedRateLimitBackend(state_path)
+    # 100 requests over 2 seconds, without free token: one every 20ms
+    backend.new_info(None, _info(100, 1000, 2))
+
+    workers, per_worker = 4, 5
+    ctx = multiprocessing.get_context("fork")
+    start = time.monotonic()
+    procs = [
+        ctx.Process(target=_consume, args=(state_path, per_worker))
+        for i in range(workers)
+    ]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(10)
+        assert p.exitcode == 0
+    duration = time.monotonic() - start
+    # the processes paced against a single budget
+    assert duration >= (workers * per_worker - 1) * 0.02
+
+
+def test_shared_backend_client(web_api_mock, state_path):
+    swhid = CoreSWHID.from_string("swh:1:cnt:fe95a46679d128ff167b7c55df5d02356c5a1ae1")
+    content_key = f"content/sha1_git:{hash_to_hex(swhid.object_id)}/"
+    web_api_mock.get(
+        f"{API_URL}/{content_key}",
+        text=API_DATA[content_key],
+        headers=rate_headers(10, 100, int(time.time()) + 60),
+    )
+    clients = [
+        WebAPIClient(
+            api_url=API_URL, rate_limit_backend=SharedRateLimitBackend(state_path)
+        )
+        for i in range(2)
+    ]
+    clients[0].content(swhid)
+    # the information received by one client paces the other one
+    assert clients[1].rate_limit_delay > 1
+    assert SharedRateLimitBackend(state_path).try_acquire() > 0
+
+
+def test_shared_backend_fork(state_path):
+    backend = SharedRateLimitBackend(state_path)
+    backend.new_info(None, _info(10, 100, 60))
+    ctx = multiprocessing.get_context("fork")
+    proc = ctx.Process(target=backend.try_acquire)
+    with backend._locked():
+        # the child re-opened the state file, so it does not share our lock
+        # and must wait for it.
+        proc.start()
+        proc.join(0.5)
+        assert proc.exitcode is None
+    proc.join(5)
+    assert proc.exitcode == 0
+
+
+def test_info_store(tmp_path):
+    store = RateLimitInfoStore.for_api(API_URL, "token", directory=str(tmp_path))
+    assert store.load() is None
+    reset = time.time() + 60
+    store.save(_RateLimitInfo(0, 0, 1000, 100, reset))
+    # saving is throttled within a window
+    store.save(_RateLimitInfo(0, 0, 1000, 50, reset))
+    info = RateLimitInfoStore.for_api(API_URL, "token", str(tmp_path)).load()
+    assert info.seeded
+    assert (info.limit, info.remaining, info.reset_date) == (1000, 100, reset)
+    # but not across windows
+    store.save(_RateLimitInfo(0, 0, 1000, 50, reset + 60))
+    assert store.load().remaining == 50
+    # other budgets are stored separately
+    assert RateLimitInfoStore.for_api(API_URL, None, str(tmp_path)).load() is None
+
+    # the window is over
+    store.MIN_SAVE_INTERVAL = 0
+    store.save(_RateLimitInfo(0, 0, 1000, 50, time.time() - 1))
+    assert store.load() is None
+    with open(store.path, "w") as f:
+        f.write("{garbage")
+    assert store.load() is None
+
+
+def test_info_store_clock(tmp_path):
+    store = RateLimitInfoStore.for_api(API_URL, "token", directory=str(tmp_path))
+    clock = VirtualClock(start=1_000_000)
+    store.save(_RateLimitInfo(0, 0, 1000, 100, 1_000_060), clock)
+    # the window is judged by the date of the clock, not the system one
+    info = store.load(clock)
+    assert info.start == 1_000_000
+    assert info.reset_date == 1_000_060
+    clock.sleep(60)
+    assert store.load(clock) is None
+
+
+def test_info_store_seeds_client(web_api_mock, tmp_path):
+    swhid = CoreSWHID.from_string("swh:1:cnt:fe95a46679d128ff167b7c55df5d02356c5a1ae1")
+    content_key = f"content/sha1_git:{hash_to_hex(swhid.object_id)}/"
+    web_api_mock.get(
+        f"{API_URL}/{content_key}",
+        text=API_DATA[content_key],
+        headers=rate_headers(10, 100, int(time.time()) + 60),
+    )
+    store = RateLimitInfoStore.for_api(API_URL, None, str(tmp_path))
+    first = WebAPIClient(api_url=API_URL, rate_limit_store=store)
+    assert not first.rate_limit_status().active
+    first.content(swhid)
+    # the next client is paced from its first request
+    second = WebAPIClient(api_url=API_URL, rate_limit_store=store)
+    _wait_until(lambda: second.rate_limit_status().active)
+    status = second.rate_limit_status()
+    assert status.limit == 100
+    assert status.delay > 1
+
+
+def test_info_store_replaces_static_rate_limit(web_api_mock, tmp_path):
+    swhid = "swh:1:cnt:fe95a46679d128ff167b7c55df5d02356c5a1ae1"
+    store = RateLimitInfoStore.for_api(API_URL, None, str(tmp_path))
+    store.save(_RateLimitInfo(0, 0, 1000, 500, time.time() + 60))
+    client = WebAPIClient(
+        api_url=API_URL, rate_limit_store=store, static_rate_limit=(10, 60)
+    )
+    _wait_until(lambda: client.rate_limit_status().active)
+    client.content(swhid)
+    # the persisted window is still used, rather than a static one
+    time.sleep(0.1)
+    assert client.rate_limit_status().limit == 1000
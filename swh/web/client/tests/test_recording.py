@@ -0,0 +1,94 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+import pytest
+
+from swh.web.client.client import WebAPIClient
+from swh.web.client.clock import VirtualClock
+from swh.web.client.recording import (
+    RecordingAdapter,
+    ReplayAdapter,
+    ReplayMiss,
+    read_recording,
+)
+
+from .server import ArchiveServer
+
+CONTENT_SWHID = "swh:1:cnt:fe95a46679d128ff167b7c55df5d02356c5a1ae1"
+SNAPSHOT_SWHID = "swh:1:snp:cabcc7d7bf639bbe1cc3b41989e1806618dd5764"
+
+
+def _exercise(client, raw_swhid):
+    return (
+        client.content(CONTENT_SWHID),
+        list(client.snapshot(SNAPSHOT_SWHID)),
+        client.known([CONTENT_SWHID, raw_swhid]),
+        b"".join(client.content_raw(raw_swhid)),
+        _read_raw_file(client, raw_swhid),
+    )
+
+
+def _read_raw_file(client, swhid):
+    with client.content_raw_file(swhid) as raw:
+        # the body was read by the recorder, or is replayed from memory
+        assert not raw.direct
+        return raw.read()
+
+
+def test_record_replay(tmp_path):
+    path = str(tmp_path / "traffic.jsonl.gz")
+    with ArchiveServer(latency=0.05, rate_limit=(1000, 60)) as server:
+        raw_swhid = "swh:1:cnt:" + server.add_content(b"\x00\xffbinary\n")
+        with RecordingAdapter(path) as recorder:
+            client = WebAPIClient(
+                server.api_url, bearer_token="secret-token", adapter=recorder
+            )
+            recorded = _exercise(client, raw_swhid)
+        api_url = server.api_url
+
+    entries = read_recording(path)
+    assert len(entries) == 6
+    assert all(entry["time"] >= 50 for entry in entries)
+    with open(path, "rb") as f:
+        assert b"secret-token" not in f.read()
+
+    # the server is gone, the replay takes no actual time
+    clock = VirtualClock()
+    replay = ReplayAdapter(path, speed=2, clock=clock)
+    client = WebAPIClient(api_url, adapter=replay, clock=clock, use_rate_limit=False)
+    assert _exercise(client, raw_swhid) == recorded
+    total = sum(entry["time"] for entry in entries) / 1000
+    assert clock.monotonic() == pytest.approx(total / 2)
+
+    # every recorded response was served
+    with pytest.raises(ReplayMiss):
+        client.content(CONTENT_SWHID)
+
+
+def test_replay_rate_limit(tmp_path):
+    path = str(tmp_path / "traffic.jsonl.gz")
+    with ArchiveServer(rate_limit=(100, 600)) as server:
+        with RecordingAdapter(path) as recorder:
+            WebAPIClient(server.api_url, adapter=recorder).content(CONTENT_SWHID)
+        api_url = server.api_url
+    (entry,) = read_recording(path)
+    headers = {h["name"]: h["value"] for h in entry["response"]["headers"]}
+    assert headers["X-RateLimit-Remaining"] == "99"
+
+    # the window announced is shifted to the time of the replay, and scaled
+    clock = VirtualClock(start=2_000_000_000)
+    client = WebAPIClient(
+        api_url, adapter=ReplayAdapter(path, speed=10, clock=clock), clock=clock
+    )
+    client.content(CONTENT_SWHID)
+    status = client.rate_limit_status()
+    assert status.limit == 100
+    assert status.remaining == 99
+    assert status.reset_date.timestamp() == pytest.approx(2_000_000_060, abs=1)
+
+
+def test_replay_speed():
+    with pytest.raises(ValueError):
+        ReplayAdapter("unused.jsonl.gz", speed=0)
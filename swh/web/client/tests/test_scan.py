@@ -0,0 +1,152 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+import os
+
+from swh.model import from_disk
+from swh.web.client import client as client_module
+from swh.web.client.client import WebAPIClient
+from swh.web.client.scan import hash_tree, iter_hashes, iter_subtree
+
+ARCHIVED = {
+    "README": b"hello\n",
+    "src": {"main.c": b"int main() {}\n", "util.c": b"void util() {}\n"},
+}
+
+
+def _write_tree(path, tree):
+    path.mkdir()
+    for name, value in tree.items():
+        if isinstance(value, dict):
+            _write_tree(path / name, value)
+        else:
+            (path / name).write_bytes(value)
+
+
+def test_scan(archive_server, tmp_path):
+    dir_id = archive_server.add_tree(ARCHIVED)
+    known_id = archive_server.add_content(b"known\n")
+    root = tmp_path / "tree"
+    _write_tree(
+        root,
+        {
+            "archived": ARCHIVED,
+            "new.txt": b"new\n",
+            "lib": {"known.c": b"known\n", "new.c": b"new\n"},
+            ".git": {"HEAD": b"ref: refs/heads/main\n"},
+        },
+    )
+    client = WebAPIClient(archive_server.api_url)
+    scanned = client.scan(root, exclude=[".git"])
+
+    assert sorted(scanned) == [
+        ".",
+        "archived",
+        "archived/README",
+        "archived/src",
+        "archived/src/main.c",
+        "archived/src/util.c",
+        "lib",
+        "lib/known.c",
+        "lib/new.c",
+        "new.txt",
+    ]
+    assert str(scanned["archived"].swhid) == f"swh:1:dir:{dir_id}"
+    assert str(scanned["lib/known.c"].swhid) == f"swh:1:cnt:{known_id}"
+    assert {path for path, obj in scanned.items() if not obj.known} == {
+        ".",
+        "lib",
+        "lib/new.c",
+        "new.txt",
+    }
+    assert {path for path, obj in scanned.items() if not obj.queried} == {
+        "archived/README",
+        "archived/src",
+        "archived/src/main.c",
+        "archived/src/util.c",
+    }
+    # one query per level, the known directory is not explored
+    assert archive_server.stats["known"] == 3
+
+
+def test_scan_concurrent_queries(archive_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(client_module, "KNOWN_QUERY_LIMIT", 10)
+    archive_server.latency = 0.05
+    root = tmp_path / "tree"
+    _write_tree(root, {f"file-{i}": b"%d\n" % i for i in range(40)})
+    client = WebAPIClient(archive_server.api_url)
+    scanned = client.scan(root)
+    assert len(scanned) == 41
+    assert not any(obj.known for obj in scanned.values())
+    # the root, then the 4 batches of its entries, queried in parallel
+    assert archive_server.stats["known"] == 5
+    assert archive_server.max_concurrency > 1
+
+
+def _local_tree(root):
+    _write_tree(
+        root,
+        {
+            "README": b"hello\n",
+            "empty": b"",
+            "src": {"main.c": b"int main() {}\n" * 1000, "sub": {}, "a": {"b": {}}},
+            "node_modules": {"dep.js": b"dep\n"},
+        },
+    )
+    (root / "run.sh").write_bytes(b"#!/bin/sh\n")
+    (root / "run.sh").chmod(0o755)
+    (root / "link").symlink_to("src/main.c")
+    (root / "src" / "dangling").symlink_to("../missing")
+
+
+def test_hash_tree(tmp_path):
+    root = tmp_path / "tree"
+    _local_tree(root)
+    exclude = ["node_modules"]
+    expected = from_disk.Directory.from_disk(
+        path=os.fsencode(root),
+        path_filter=from_disk.ignore_directories_patterns(
+            os.fsencode(root), [b"node_modules"]
+        ),
+        max_content_length=None,
+    )
+    tree = hash_tree(root, exclude, max_workers=4)
+    assert tree.swhid == expected.swhid()
+    for obj in iter_subtree(tree):
+        assert obj.swhid == expected[os.fsencode(obj.path)].swhid(), obj.path
+    assert "node_modules" not in {obj.path for obj in iter_subtree(tree)}
+
+
+def test_iter_hashes_order(tmp_path):
+    root = tmp_path / "tree"
+    _local_tree(root)
+    seen = set()
+    for obj in iter_hashes(root):
+        for child in (obj.entries or {}).values():
+            assert child.path in seen
+        seen.add(obj.path)
+    assert obj.path == "."
+    assert len(seen) == 1 + sum(1 for _ in iter_subtree(obj))
+
+
+def test_iter_known(archive_server, monkeypatch):
+    monkeypatch.setattr(client_module, "KNOWN_QUERY_LIMIT", 10)
+    known = ["swh:1:cnt:" + archive_server.add_content(b"%d" % i) for i in range(25)]
+    unknown = ["swh:1:cnt:%040x" % i for i in range(20)]
+    client = WebAPIClient(archive_server.api_url)
+    consumed = []
+
+    def swhids():
+        for swhid in known + unknown:
+            consumed.append(swhid)
+            yield swhid
+
+    results = client.iter_known(swhids(), max_concurrency=1)
+    swhid, info = next(results)
+    # the first batches are queried before the end of the input
+    assert len(consumed) < len(known + unknown)
+    statuses = {str(swhid): info["known"], **{str(s): i["known"] for s, i in results}}
+    assert statuses == {**dict.fromkeys(known, True), **dict.fromkeys(unknown, False)}
+    assert archive_server.stats["known"] == 5
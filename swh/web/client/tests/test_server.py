@@ -0,0 +1,100 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+import time
+
+import pytest
+from requests.exceptions import HTTPError
+
+from swh.model.swhids import CoreSWHID
+from swh.web.client.client import KNOWN_QUERY_LIMIT, WebAPIClient
+
+from .api_data_static import KNOWN_SWHIDS
+
+
+def test_server_fixtures(archive_server):
+    client = WebAPIClient(archive_server.api_url)
+    content = client.content("swh:1:cnt:fe95a46679d128ff167b7c55df5d02356c5a1ae1")
+    assert content["length"] == 151810
+    # the fixtures are paginated like with `web_api_mock`
+    snapshot = "swh:1:snp:cabcc7d7bf639bbe1cc3b41989e1806618dd5764"
+    assert len(list(client.snapshot(snapshot))) == 2
+    assert client.content_exists("swh:1:cnt:fe95a46679d128ff167b7c55df5d02356c5a1ae1")
+    with pytest.raises(HTTPError):
+        client.directory("swh:1:dir:0000000000000000000000000000000000000000")
+    assert archive_server.stats["content"] == 2
+
+
+def test_server_synthetic(archive_server):
+    client = WebAPIClient(archive_server.api_url)
+    dir_id = archive_server.add_directory(5000)
+    entries = client.directory(f"swh:1:dir:{dir_id}")
+    assert len(entries) == 5000
+    assert entries[-1]["name"] == "file-00004999"
+
+    archive_server.page_size = 100
+    snp_id = archive_server.add_snapshot(250)
+    pages = list(client.snapshot(f"swh:1:snp:{snp_id}"))
+    assert [len(p) for p in pages] == [100, 100, 50]
+    assert archive_server.stats["snapshot"] == 3
+
+    sha1_git = archive_server.add_content(b"hello\n")
+    swhid = f"swh:1:cnt:{sha1_git}"
+    assert b"".join(client.content_raw(swhid)) == b"hello\n"
+    assert client.content(swhid)["length"] == 6
+
+
+def test_server_known(archive_server):
+    client = WebAPIClient(archive_server.api_url)
+    dir_id = archive_server.add_directory(1)
+    known = sorted(KNOWN_SWHIDS)[: KNOWN_QUERY_LIMIT + 10]
+    unknown = "swh:1:cnt:" + "0" * 40
+    swhids = [
+        CoreSWHID.from_string(s) for s in [*known, unknown, f"swh:1:dir:{dir_id}"]
+    ]
+    result = client.known(swhids)
+    assert sum(r["known"] for r in result.values()) == len(known) + 1
+    assert not result[CoreSWHID.from_string(unknown)]["known"]
+    assert archive_server.stats["known"] == 2
+
+
+def test_server_behavior(archive_server):
+    client = WebAPIClient(archive_server.api_url)
+    swhid = "swh:1:cnt:fe95a46679d128ff167b7c55df5d02356c5a1ae1"
+
+    archive_server.latency = 0.05
+    start = time.monotonic()
+    client.content(swhid)
+    assert time.monotonic() - start >= 0.05
+    archive_server.latency = 0
+
+    # injected errors are retried by the client
+    archive_server.error_rate = 0.5
+    for i in range(10):
+        client.content(swhid)
+    assert archive_server.stats["content"] > 11
+    archive_server.error_rate = 0
+
+    # the client paces itself according to the rate limit headers
+    archive_server.rate_limit = (100, 60)
+    client.content(swhid)
+    deadline = time.monotonic() + 5
+    while client.rate_limit_status().limit != 100:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert client.rate_limit_status().remaining == 99
+
+
+@pytest.mark.parametrize(
+    "error,reported",
+    [(ConnectionResetError, False), (BrokenPipeError, False), (ValueError, True)],
+)
+def test_server_errors(archive_server, capsys, error, reported):
+    try:
+        raise error()
+    except error:
+        archive_server.handle_error(None, ("127.0.0.1", 12345))
+    # clients closing their connections are not errors of the server
+    assert ("Traceback" in capsys.readouterr().err) == reported
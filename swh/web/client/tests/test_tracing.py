@@ -0,0 +1,155 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+import contextlib
+
+import pytest
+
+from swh.web.client.client import WebAPIClient
+from swh.web.client.tracing import NOOP_TRACER, Span, Tracer, default_tracer, traced
+
+from .api_data import API_URL
+
+CONTENT_SWHID = "swh:1:cnt:fe95a46679d128ff167b7c55df5d02356c5a1ae1"
+SNAPSHOT_SWHID = "swh:1:snp:cabcc7d7bf639bbe1cc3b41989e1806618dd5764"
+
+
+class RecordedSpan(Span):
+    def __init__(self, name, parent, attributes):
+        self.name = name
+        self.parent = parent
+        self.attributes = dict(attributes or {})
+        self.ended = False
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def end(self):
+        self.ended = True
+
+
+class RecordingTracer(Tracer):
+    def __init__(self):
+        self.spans = []
+        self.current = None
+
+    def start_span(self, name, attributes=None):
+        span = RecordedSpan(name, self.current, attributes)
+        self.spans.append(span)
+        return span
+
+    @contextlib.contextmanager
+    def use_span(self, span):
+        previous, self.current = self.current, span
+        try:
+            yield span
+        finally:
+            self.current = previous
+
+    @contextlib.contextmanager
+    def span(self, name, attributes=None):
+        span = self.start_span(name, attributes)
+        try:
+            with self.use_span(span):
+                yield span
+        finally:
+            span.end()
+
+    def tree(self, parent=None):
+        return [
+            (s.name.rsplit(".", 1)[1], self.tree(s))
+            for s in self.spans
+            if s.parent is parent
+        ]
+
+
+def test_tracing(web_api_mock):
+    tracer = RecordingTracer()
+    client = WebAPIClient(api_url=API_URL, tracer=tracer)
+    client.get(CONTENT_SWHID)
+    http = ("http", [])
+    decode = ("json_decode", [])
+    typify = ("typify", [])
+    wait = ("rate_limit_wait", [])
+    assert tracer.tree() == [
+        ("get", [("content", [wait, http, decode, typify])]),
+    ]
+    http_span = tracer.spans[3]
+    assert http_span.attributes == {
+        "http.request.method": "GET",
+        "url.full": f"{API_URL}/content/sha1_git:{CONTENT_SWHID[10:]}/",
+        "swh.endpoint": "content",
+        "http.response.status_code": 200,
+    }
+    assert all(span.ended for span in tracer.spans)
+
+    # the span of an iteration only covers the code of the generator
+    tracer.spans.clear()
+    snapshot = client.snapshot(SNAPSHOT_SWHID)
+    next(snapshot)
+    assert tracer.current is None
+    assert not tracer.spans[0].ended
+    list(snapshot)
+    ((name, children),) = tracer.tree()
+    assert name == "snapshot"
+    assert children == [wait, http, decode, typify] * 2
+    assert tracer.spans[0].ended
+
+
+def test_tracing_generator_closed():
+    class Client:
+        tracer = RecordingTracer()
+        closed_in = None
+
+        @traced
+        def items(self):
+            try:
+                yield from range(10)
+            finally:
+                self.closed_in = self.tracer.current
+
+    client = Client()
+    items = client.items()
+    assert next(items) == 0
+    # the wrapped generator is closed along with the traced one, in its span
+    items.close()
+    (span,) = client.tracer.spans
+    assert client.closed_in is span
+    assert span.ended
+
+
+def test_default_tracer():
+    client = WebAPIClient(api_url=API_URL)
+    try:
+        import opentelemetry  # noqa: F401
+    except ImportError:
+        assert client.tracer is NOOP_TRACER
+    else:
+        assert client.tracer is not NOOP_TRACER
+
+
+def test_opentelemetry_tracing(web_api_mock):
+    pytest.importorskip("opentelemetry.sdk")
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+        InMemorySpanExporter,
+    )
+
+    from swh.web.client.tracing import OpenTelemetryTracer
+
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    tracer = OpenTelemetryTracer(provider.get_tracer("swh.web.client"))
+    client = WebAPIClient(api_url=API_URL, tracer=tracer)
+    list(client.snapshot(SNAPSHOT_SWHID))
+    spans = {span.context.span_id: span for span in exporter.get_finished_spans()}
+    (root,) = [span for span in spans.values() if span.parent is None]
+    assert root.name == "swh.web.client.snapshot"
+    http = [span for span in spans.values() if span.name == "swh.web.client.http"]
+    assert len(http) == 2
+    assert all(span.parent.span_id == root.context.span_id for span in http)
+    assert default_tracer() is not NOOP_TRACER
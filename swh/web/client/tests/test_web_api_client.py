@@ -3,9 +3,16 @@
 # License: GNU General Public License version 3, or any later version
 # See top-level LICENSE file for more information
 
+import collections
+import gc
 import json
+import os
 import random
+import signal
+import threading
 import time
+import traceback
+from unittest import mock
 
 from dateutil.parser import parse as parse_date
 import pytest
@@ -13,10 +20,26 @@ from requests.exceptions import HTTPError
 
 from swh.model.hashutil import hash_to_hex
 from swh.model.swhids import CoreSWHID
-from swh.web.client.client import KNOWN_QUERY_LIMIT, typify_json
+from swh.web.client.client import (
+    _1_SECOND,
+    _MIN_GRANT_INTERVAL_NS,
+    KNOWN_QUERY_LIMIT,
+    PRIORITY_BULK,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_NORMAL,
+    WebAPIClient,
+    _BucketPacing,
+    _PrioritySemaphore,
+    _RateLimitEnforcer,
+    _RateLimitInfo,
+    typify_json,
+)
+from swh.web.client.clock import VirtualClock
+from swh.web.client.rate_limit import RateLimitTimeout
 
 from .api_data import API_DATA, API_URL
 from .api_data_static import KNOWN_SWHIDS
+from .rate_limit_simulation import Simulation
 
 
 def test_get_content(web_api_client, web_api_mock):
@@ -542,3 +565,553 @@ def test_cooking_fetch(web_api_client, web_api_mock):
     dir_swhid = "swh:1:dir:977fc4b98c0e85816348cebd3b12026407c368b6"
     obj = web_api_client.cooking_fetch("flat", dir_swhid)
     assert obj.content.find(b"OCTET_STREAM_MOCK") != -1
+
+
+def test_cook_many(requests_mock, tmp_path):
+    swhids = [f"swh:1:dir:{i:040x}" for i in range(3)]
+
+    def vault_info(swhid, status):
+        return {"json": {"swhid": swhid, "status": status}}
+
+    for i, swhid in enumerate(swhids):
+        url = f"{API_URL}/vault/flat/{swhid}/"
+        requests_mock.post(url, **vault_info(swhid, "new"))
+        statuses = ["pending"] * i + ["failed" if i == 1 else "done"]
+        requests_mock.get(url, [vault_info(swhid, status) for status in statuses])
+        # downloaded as by fetch_bundle
+        bundle = f"bundle {i}".encode()
+        requests_mock.head(f"{url}raw", headers={"Content-Length": str(len(bundle))})
+        requests_mock.get(f"{url}raw", content=bundle)
+
+    client = WebAPIClient(API_URL)
+    bundles = list(
+        client.cook_many(
+            "flat", swhids + swhids[:1], tmp_path, poll_delay=0.01, max_poll_delay=0.02
+        )
+    )
+    # bundles are yielded as they are done, polled with backoff
+    bundles.sort(key=lambda bundle: bundle.swhid)
+    assert [(b.swhid, b.status) for b in bundles] == [
+        (swhids[0], "done"),
+        (swhids[1], "failed"),
+        (swhids[2], "done"),
+    ]
+    assert bundles[0].path == str(tmp_path / f"{swhids[0]}.tar.gz")
+    assert bundles[1].path is None
+    assert sorted(os.listdir(tmp_path)) == [
+        f"{swhids[0]}.tar.gz",
+        f"{swhids[2]}.tar.gz",
+    ]
+    assert (tmp_path / f"{swhids[2]}.tar.gz").read_bytes() == b"bundle 2"
+    checks = [r.url for r in requests_mock.request_history if r.method == "GET"]
+    assert checks.count(f"{API_URL}/vault/flat/{swhids[2]}/") == 3
+
+    # without a destination, bundles are not downloaded
+    requests_mock.get(
+        f"{API_URL}/vault/flat/{swhids[0]}/", **vault_info(swhids[0], "done")
+    )
+    (bundle,) = client.cook_many("flat", swhids[:1])
+    assert bundle.status == "done" and bundle.path is None
+    assert bundle.info == {"swhid": swhids[0], "status": "done"}
+
+
+def _wait_for_waiters(sem, count):
+    """busy wait until `count` threads are waiting on `sem`"""
+    deadline = time.monotonic() + 5
+    while sem.waiting < count:
+        assert time.monotonic() < deadline, "waiters did not show up"
+        time.sleep(0.001)
+
+
+def _start_waiters(sem, priorities, granted):
+    threads = []
+    for idx, priority in enumerate(priorities):
+
+        def wait(idx=idx, priority=priority):
+            sem.acquire(priority)
+            granted.append(idx)
+
+        t = threading.Thread(target=wait)
+        t.start()
+        threads.append(t)
+        # make sure arrival order is deterministic
+        _wait_for_waiters(sem, idx + 1)
+    return threads
+
+
+def _release_one_by_one(sem, granted, threads):
+    """release tokens one at a time, waiting for each to be granted"""
+    for i in range(len(threads)):
+        sem.release()
+        deadline = time.monotonic() + 5
+        while len(granted) <= i:
+            assert time.monotonic() < deadline
+            time.sleep(0.001)
+    for t in threads:
+        t.join()
+
+
+def test_priority_semaphore_order():
+    sem = _PrioritySemaphore()
+    granted = []
+    priorities = [PRIORITY_BULK, PRIORITY_NORMAL, PRIORITY_BULK, PRIORITY_INTERACTIVE]
+    threads = _start_waiters(sem, priorities, granted)
+    _release_one_by_one(sem, granted, threads)
+    assert granted == [3, 1, 0, 2]
+
+
+def test_priority_semaphore_starvation(mocker):
+    mocker.patch.object(_PrioritySemaphore, "STARVATION_LIMIT", 2)
+    sem = _PrioritySemaphore()
+    granted = []
+    priorities = [PRIORITY_BULK] + [PRIORITY_INTERACTIVE] * 4
+    threads = _start_waiters(sem, priorities, granted)
+    _release_one_by_one(sem, granted, threads)
+    # the bulk request only let two more urgent requests pass before it
+    assert granted.index(0) == 2
+
+
+def test_priority_semaphore_timeout():
+    sem = _PrioritySemaphore()
+    assert not sem.acquire(PRIORITY_INTERACTIVE, timeout=0.01)
+    assert sem.waiting == 0
+    sem.release()
+    assert sem.acquire(PRIORITY_INTERACTIVE, timeout=0.01)
+
+
+def test_priority_semaphore_count():
+    sem = _PrioritySemaphore()
+    granted = []
+    threads = []
+    for idx, count in enumerate([3, 1]):
+
+        def wait(idx=idx, count=count):
+            sem.acquire(PRIORITY_NORMAL, count=count)
+            granted.append(idx)
+
+        threads.append(threading.Thread(target=wait))
+        threads[-1].start()
+        _wait_for_waiters(sem, idx + 1)
+    # the first waiter needs three tokens, the next one passes it
+    sem.release(2)
+    _wait_until(lambda: granted == [1])
+    assert sem.value == 1
+    sem.release(2)
+    for t in threads:
+        t.join(5)
+    assert granted == [1, 0]
+    assert sem.value == 0
+
+
+def test_priority_semaphore_count_starvation(mocker):
+    mocker.patch.object(_PrioritySemaphore, "STARVATION_LIMIT", 2)
+    sem = _PrioritySemaphore()
+    bulk = threading.Thread(
+        target=sem.acquire, args=(PRIORITY_NORMAL, True, None, 3), daemon=True
+    )
+    bulk.start()
+    _wait_for_waiters(sem, 1)
+    # the waiter short of tokens lets two smaller ones pass, then keeps the
+    # tokens released until it has enough of them
+    sem.release(2)
+    assert sem.acquire(PRIORITY_NORMAL, timeout=1)
+    assert sem.acquire(PRIORITY_BULK, timeout=1)
+    assert not sem.acquire(PRIORITY_INTERACTIVE, timeout=0.01)
+    sem.release(3)
+    bulk.join(5)
+    assert not bulk.is_alive()
+    assert sem.value == 0
+
+
+def test_priority_semaphore_open():
+    sem = _PrioritySemaphore(1)
+    waiter = threading.Thread(target=sem.acquire, kwargs={"count": 50}, daemon=True)
+    waiter.start()
+    _wait_for_waiters(sem, 1)
+    sem.open()
+    waiter.join(5)
+    assert not waiter.is_alive()
+    assert sem.acquire(count=1000, timeout=0)
+
+
+def test_priority_semaphore_available_tokens():
+    sem = _PrioritySemaphore()
+    bulk = threading.Thread(
+        target=sem.acquire, args=(PRIORITY_BULK, True, None, 3), daemon=True
+    )
+    bulk.start()
+    _wait_for_waiters(sem, 1)
+    # not enough tokens for the bulk waiter, enough for an urgent request
+    sem.release(2)
+    assert sem.acquire(PRIORITY_INTERACTIVE, timeout=1)
+    assert sem.value == 1
+    sem.release(2)
+    bulk.join(5)
+    assert not bulk.is_alive()
+    assert sem.value == 0
+
+
+def test_priority_invalid(web_api_client, web_api_mock):
+    swhid = "swh:1:cnt:fe95a46679d128ff167b7c55df5d02356c5a1ae1"
+    with pytest.raises(ValueError):
+        web_api_client.content(swhid, priority="urgent")
+    with pytest.raises(ValueError):
+        with web_api_client.priority("urgent"):
+            pass
+    with pytest.raises(ValueError):
+        WebAPIClient(api_url=API_URL, default_priority="urgent")
+
+
+def test_priority_selection(web_api_client, web_api_mock, mocker):
+    one_call = mocker.spy(web_api_client, "_one_call")
+    swhid = "swh:1:cnt:fe95a46679d128ff167b7c55df5d02356c5a1ae1"
+
+    def last_priority():
+        return one_call.call_args[0][4]
+
+    web_api_client.content(swhid)
+    assert last_priority() == PRIORITY_NORMAL
+    with web_api_client.priority(PRIORITY_BULK):
+        web_api_client.content(swhid)
+        assert last_priority() == PRIORITY_BULK
+        web_api_client.content(swhid, priority=PRIORITY_INTERACTIVE)
+        assert last_priority() == PRIORITY_INTERACTIVE
+        web_api_client.get(swhid, priority=PRIORITY_INTERACTIVE)
+        assert last_priority() == PRIORITY_INTERACTIVE
+        # the priority propagates to requests issued in parallel
+        _query_known(web_api_client, KNOWN_QUERY_LIMIT * 2)
+        assert {c[0][4] for c in one_call.call_args_list[-2:]} == {PRIORITY_BULK}
+    web_api_client.content(swhid)
+    assert last_priority() == PRIORITY_NORMAL
+
+
+def _wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached in time"
+        time.sleep(0.01)
+
+
+def test_reserve(web_api_client, web_api_mock):
+    swhid = "swh:1:cnt:fe95a46679d128ff167b7c55df5d02356c5a1ae1"
+    assert not web_api_client.rate_limit_status().active
+    # nothing is paced yet, the reservation always succeeds
+    with web_api_client.reserve(1000, timeout=0) as reservation:
+        web_api_client.content(swhid)
+    assert reservation.remaining == 0
+
+    content_key = f"content/sha1_git:{swhid[10:]}/"
+    reset = int(time.time()) + 60
+    web_api_mock.get(
+        f"{API_URL}/{content_key}",
+        text=API_DATA[content_key],
+        headers=rate_headers(1000, 1000, reset),
+    )
+    web_api_client.content(swhid)
+    _wait_until(lambda: web_api_client.rate_limit_status().active)
+    status = web_api_client.rate_limit_status()
+    assert (status.limit, status.remaining) == (1000, 1000)
+    assert status.reset_date.timestamp() == reset
+    assert status.waiting == 0
+    # 10% of the budget is available right away
+    assert status.free_tokens >= 100
+    assert status.projected_wait(status.free_tokens) == 0
+
+    with web_api_client.reserve(50, timeout=0) as reservation:
+        assert web_api_client.rate_limit_status().free_tokens < status.free_tokens
+        web_api_client.content(swhid)
+        web_api_client.content(swhid)
+        assert reservation.remaining == 48
+    # the unused tokens are given back
+    assert web_api_client.rate_limit_status().free_tokens >= status.free_tokens - 2
+
+    # more than what is available
+    with pytest.raises(RateLimitTimeout) as exc_info:
+        with web_api_client.reserve(500, timeout=0):
+            pass
+    assert exc_info.value.projected_wait > 10
+    with pytest.raises(ValueError):
+        with web_api_client.reserve(0):
+            pass
+
+
+def test_reserve_more_than_window(web_api_client, web_api_mock):
+    swhid = "swh:1:cnt:fe95a46679d128ff167b7c55df5d02356c5a1ae1"
+    content_key = f"content/sha1_git:{swhid[10:]}/"
+    web_api_mock.get(
+        f"{API_URL}/{content_key}",
+        text=API_DATA[content_key],
+        headers=rate_headers(10, 1000, int(time.time()) + 2),
+    )
+    web_api_client.content(swhid)
+    _wait_until(lambda: web_api_client.rate_limit_status().active)
+    reserved = []
+
+    def reserve():
+        with web_api_client.reserve(50) as reservation:
+            reserved.append(reservation)
+
+    # more than what the window can still grant: the reservation waits for
+    # the end of the window, as with a virtual clock
+    waiter = threading.Thread(target=reserve, daemon=True)
+    waiter.start()
+    waiter.join(6)
+    assert not waiter.is_alive()
+    assert reserved[0].count == 50
+    assert not web_api_client.rate_limit_status().active
+
+
+def test_static_rate_limit(web_api_mock):
+    swhid = "swh:1:cnt:fe95a46679d128ff167b7c55df5d02356c5a1ae1"
+    client = WebAPIClient(api_url=API_URL, static_rate_limit=(100, 1))
+    # paced right away
+    _wait_until(lambda: client.rate_limit_status().active)
+    assert client.rate_limit_status().limit == 100
+    # the static windows are renewed
+    _wait_until(lambda: not client.rate_limit_status().active)
+    client.content(swhid)
+    _wait_until(lambda: client.rate_limit_status().active)
+
+    # until the server provides information, which takes precedence
+    content_key = f"content/sha1_git:{swhid[10:]}/"
+    web_api_mock.get(
+        f"{API_URL}/{content_key}",
+        text=API_DATA[content_key],
+        headers=rate_headers(500, 1000, int(time.time()) + 60),
+    )
+    client.content(swhid)
+    _wait_until(lambda: client.rate_limit_status().limit == 1000)
+    assert client._default_bucket.server_rate_limited
+
+
+def test_rate_limit_buckets(web_api_client, web_api_mock, mocker):
+    default = web_api_client._default_bucket
+    vault = web_api_client._rate_limit_buckets["vault"]
+    assert web_api_client._rate_limit_bucket("content/sha1_git:1/") is default
+    assert web_api_client._rate_limit_bucket("vault/flat/swh:1:dir:1/") is vault
+    save = web_api_client._rate_limit_bucket("origin/save/git/url/https://x/")
+    assert save.name == "save"
+    assert web_api_client._rate_limit_bucket("https://example.org/vault/") is default
+
+    one_call = mocker.spy(web_api_client, "_one_call")
+    dir_swhid = "swh:1:dir:977fc4b98c0e85816348cebd3b12026407c368b6"
+    url = f"{API_URL}/vault/flat/{dir_swhid}/"
+    web_api_mock.get(
+        url,
+        json={},
+        headers=rate_headers(1, 100, int(time.time()) + 60),
+    )
+    web_api_client.cooking_check("flat", dir_swhid)
+    assert one_call.call_args[0][5] is vault
+    # the vault budget is low, but the other requests are not slowed down
+    _wait_until(lambda: web_api_client.rate_limit_status("vault").active)
+    assert web_api_client.rate_limit_status("vault").delay > 1
+    assert not web_api_client.rate_limit_status().active
+    assert web_api_client.rate_limit_delay == 0
+    with pytest.raises(ValueError):
+        web_api_client.rate_limit_status("unknown")
+
+    # a single bucket for everything
+    client = WebAPIClient(api_url=API_URL, rate_limit_buckets=())
+    assert client._rate_limit_bucket("vault/flat/") is client._default_bucket
+
+
+def test_rate_limit_pacing_batches():
+    client = mock.Mock()
+    pacing = _BucketPacing(
+        bucket_ref=None,
+        rate_limit=_RateLimitInfo(0, 0, 1000, 1000, 1),
+        reset_date=10 * _1_SECOND,
+        last_grant=0,
+    )
+    wait_ns = pacing.rate_limit.wait_ns
+    # all the tokens due are granted at once
+    pacing.grant_due_tokens(client, 10 * wait_ns + 1)
+    client._add_rate_limit_tokens.assert_called_once_with(10)
+    assert pacing.last_grant == 10 * wait_ns
+
+    current = pacing.last_grant
+    # nobody waits for tokens: nothing to do until the end of the window
+    client._rate_limit_waiters.return_value = 0
+    assert pacing.next_date(client, current) == pacing.reset_date
+    # somebody waits: wake up for the next token, but not too often
+    client._rate_limit_waiters.return_value = 1
+    assert pacing.next_date(client, current) == current + _MIN_GRANT_INTERVAL_NS
+    pacing.rate_limit = _RateLimitInfo(0, 0, 1000, 10, 1)
+    assert pacing.next_date(client, current) == current + pacing.rate_limit.wait_ns
+
+
+def test_rate_limit_pacing_curve():
+    """the pacing matches the example of `_RateLimitInfo.setup_free_token`"""
+    sim = Simulation()
+    client = sim.add_client(demand=100, limit=100, remaining=100, window=60)
+    # a low budget left: no free tokens
+    late = sim.add_client(demand=100, limit=100, remaining=20, window=60, start=30)
+    sim.run()
+    assert sim.clock.monotonic_ns() == 90 * _1_SECOND
+    assert client.issued == 100
+    for count, duration in [
+        (1, 0.0),
+        (10, 0.0),
+        (11, 0.66),
+        (15, 3.33),
+        (20, 6.66),
+        (50, 26.66),
+        (100, 60.0),
+    ]:
+        assert client.duration(count) == pytest.approx(duration, abs=0.01)
+    # one token every 3 seconds, the last one being due at the window end,
+    # when the next window starts.
+    assert late.issued == 19
+    assert late.duration(1) == pytest.approx(3.0)
+    assert late.duration(19) == pytest.approx(57.0)
+
+
+def test_rate_limit_enforcer_idle(web_api_client, web_api_mock):
+    """the enforcer does not wake up when nobody waits, and stops when done"""
+    swhid = CoreSWHID.from_string("swh:1:cnt:fe95a46679d128ff167b7c55df5d02356c5a1ae1")
+    content_key = f"content/sha1_git:{hash_to_hex(swhid.object_id)}/"
+    now = int(time.time())
+    web_api_mock.get(
+        f"{API_URL}/{content_key}",
+        text=API_DATA[content_key],
+        headers=rate_headers(999, 1000, now + 2),
+    )
+    web_api_client.content(swhid)
+
+    def paced():
+        limiter = _RateLimitEnforcer._limiter
+        return (
+            limiter is not None
+            and web_api_client._default_bucket in limiter._all_buckets
+        )
+
+    _wait_until(paced)
+    limiter = _RateLimitEnforcer._limiter
+    thread = _RateLimitEnforcer._limiter_thread
+    pacing = limiter._all_buckets[web_api_client._default_bucket]
+    # the only scheduled event is the end of the window
+    assert [e.date for e in limiter._events if e.pacing is pacing] == [
+        pacing.reset_date
+    ]
+    # once the window is over, the enforcer shuts down (the clients of other
+    # tests might still be around, make sure they are collected)
+    gc.collect()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert web_api_client._default_bucket._rate_tokens is None
+    # and is started again when needed
+    web_api_mock.get(
+        f"{API_URL}/{content_key}",
+        text=API_DATA[content_key],
+        headers=rate_headers(999, 1000, int(time.time()) + 2),
+    )
+    web_api_client.content(swhid)
+    _wait_until(paced)
+
+
+def test_virtual_clock(web_api_mock):
+    """a virtual clock paces requests in virtual time, deterministically"""
+    swhid = CoreSWHID.from_string("swh:1:cnt:fe95a46679d128ff167b7c55df5d02356c5a1ae1")
+    content_key = f"content/sha1_git:{hash_to_hex(swhid.object_id)}/"
+    epoch = 1_700_000_000
+    clock = VirtualClock(start=epoch)
+    client = WebAPIClient(api_url=API_URL, clock=clock)
+    used = collections.Counter()
+
+    # 1000 requests per window of an hour
+    def reply(request, context):
+        window = int(clock.time() - epoch) // 3600
+        used[window] += 1
+        reset_date = epoch + (window + 1) * 3600
+        context.headers.update(rate_headers(1000 - used[window], 1000, reset_date))
+        return API_DATA[content_key]
+
+    web_api_mock.get(f"{API_URL}/{content_key}", text=reply)
+    start = time.monotonic()
+    # one unpaced request, 99 free tokens, then one request every 4 seconds
+    for i in range(200):
+        client.content(swhid)
+    assert clock.monotonic() == pytest.approx(400, abs=0.01)
+    assert client.rate_limit_delay == pytest.approx(4.0)
+    status = client.rate_limit_status()
+    assert status.active and status.free_tokens == 0
+
+    # the reservation waits in virtual time as well
+    with pytest.raises(RateLimitTimeout):
+        with client.reserve(10, timeout=10):
+            pass
+    assert clock.monotonic() == pytest.approx(410, abs=0.01)
+    with client.reserve(10):
+        pass
+    assert clock.monotonic() == pytest.approx(440, abs=0.01)
+
+    # the pacing restarts with the next window
+    clock.sleep(3600)
+    client.content(swhid)
+    assert clock.monotonic() == pytest.approx(4040, abs=0.01)
+    status = client.rate_limit_status()
+    assert status.active and status.remaining == 999
+    # all of this took little actual time
+    assert time.monotonic() - start < 10
+
+    # retries back off in virtual time too
+    web_api_mock.get(
+        f"{API_URL}/{content_key}",
+        [{"status_code": 429}] * 3 + [{"text": API_DATA[content_key]}],
+    )
+    client = WebAPIClient(api_url=API_URL, clock=clock, use_rate_limit=False)
+    client.content(swhid)
+    assert clock.monotonic() == pytest.approx(4040.7, abs=0.01)
+
+
+def _run_in_child(func, timeout=10):
+    """run `func` in a forked child process, return its exit code"""
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            func()
+            code = 0
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            os._exit(code)
+    deadline = time.monotonic() + timeout
+    while True:
+        done, status = os.waitpid(pid, os.WNOHANG)
+        if done:
+            return os.waitstatus_to_exitcode(status)
+        if time.monotonic() > deadline:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            pytest.fail("child process hung")
+        time.sleep(0.01)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_fork_under_rate_limit(web_api_client, web_api_mock):
+    swhid = CoreSWHID.from_string("swh:1:cnt:fe95a46679d128ff167b7c55df5d02356c5a1ae1")
+    content_key = f"content/sha1_git:{hash_to_hex(swhid.object_id)}/"
+    # a tight budget without free tokens: one request every 100ms
+    web_api_mock.get(
+        f"{API_URL}/{content_key}",
+        text=API_DATA[content_key],
+        headers=rate_headers(20, 1000, int(time.time()) + 2),
+    )
+    web_api_client.content(swhid)
+    _wait_until(lambda: web_api_client._default_bucket._rate_tokens is not None)
+    parent_session = web_api_client._session
+
+    def child():
+        assert web_api_client._default_bucket._rate_tokens is None
+        assert web_api_client._session is not parent_session
+        # the child paces its requests with its own enforcer
+        for i in range(3):
+            web_api_client.content(swhid)
+        _wait_until(lambda: web_api_client._default_bucket._rate_tokens is not None)
+
+    assert _run_in_child(child) == 0
+    # the parent is not affected
+    assert web_api_client._session is parent_session
+    web_api_client.content(swhid)
@@ -0,0 +1,152 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+"""Tracing of the client calls
+
+A :class:`swh.web.client.client.WebAPIClient` opens a span for each call of
+its public methods (``swh.web.client.<method>``, covering the whole iteration
+of the methods returning an iterator), with child spans for:
+
+- each HTTP request attempt (``swh.web.client.http``), retries included;
+- the wait for a rate limiting token (``swh.web.client.rate_limit_wait``);
+- the decoding of JSON responses (``swh.web.client.json_decode``);
+- the conversion of the results to Python types (``swh.web.client.typify``).
+
+When OpenTelemetry (the ``opentelemetry-api`` package) is installed, the
+spans are OpenTelemetry spans of the ``swh.web.client`` tracer, so they show
+up in the distributed traces of the application once the OpenTelemetry SDK
+is configured. Otherwise, tracing is a no-op.
+
+A custom :class:`Tracer` can be passed to the client as well (see the
+``tracer`` argument of :class:`swh.web.client.client.WebAPIClient`).
+"""
+
+import contextlib
+import functools
+import inspect
+from typing import Any, Callable, ContextManager, Dict, Iterator, Optional, TypeVar
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+TRACER_NAME = "swh.web.client"
+
+HTTP_SPAN = f"{TRACER_NAME}.http"
+RATE_LIMIT_WAIT_SPAN = f"{TRACER_NAME}.rate_limit_wait"
+JSON_DECODE_SPAN = f"{TRACER_NAME}.json_decode"
+TYPIFY_SPAN = f"{TRACER_NAME}.typify"
+
+Attributes = Dict[str, Any]
+
+
+class Span:
+    """A span of the no-op tracer, also the interface of the spans"""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+
+_NOOP_SPAN = Span()
+
+
+class Tracer:
+    """The no-op tracer, also the interface of the tracers"""
+
+    def span(
+        self, name: str, attributes: Optional[Attributes] = None
+    ) -> ContextManager[Span]:
+        """open a span, current within the block and ended when it exits"""
+        return contextlib.nullcontext(_NOOP_SPAN)
+
+    def start_span(self, name: str, attributes: Optional[Attributes] = None) -> Span:
+        """start a span, without making it current"""
+        return _NOOP_SPAN
+
+    def use_span(self, span: Span) -> ContextManager[Any]:
+        """make `span` the current span within the block, without ending it"""
+        return contextlib.nullcontext()
+
+
+class OpenTelemetryTracer(Tracer):
+    """Tracer producing OpenTelemetry spans"""
+
+    def __init__(self, tracer: Any = None):
+        if otel_trace is None:
+            raise ImportError("opentelemetry-api is not installed")
+        if tracer is None:
+            tracer = otel_trace.get_tracer(TRACER_NAME)
+        self.tracer = tracer
+
+    def span(
+        self, name: str, attributes: Optional[Attributes] = None
+    ) -> ContextManager[Span]:
+        return self.tracer.start_as_current_span(name, attributes=attributes)
+
+    def start_span(self, name: str, attributes: Optional[Attributes] = None) -> Span:
+        return self.tracer.start_span(name, attributes=attributes)
+
+    def use_span(self, span: Span) -> ContextManager[Any]:
+        assert otel_trace is not None
+        return otel_trace.use_span(span, end_on_exit=False)
+
+
+NOOP_TRACER = Tracer()
+
+
+def default_tracer() -> Tracer:
+    """return an OpenTelemetry tracer if available, the no-op one otherwise"""
+    if otel_trace is None:
+        return NOOP_TRACER
+    return OpenTelemetryTracer()
+
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def traced(func: F) -> F:
+    """trace each call of a `WebAPIClient` method in a span named after it
+
+    The span of a generator function covers the whole iteration, and is the
+    current span while the generator runs only (not while the caller does
+    something else with the items it yielded).
+    """
+    name = f"{TRACER_NAME}.{func.__name__}"
+
+    if inspect.isgeneratorfunction(func):
+
+        @functools.wraps(func)
+        def traced_generator(self, *args, **kwargs) -> Iterator[Any]:
+            tracer = self.tracer
+            # creating the generator runs none of its code
+            iterator = func(self, *args, **kwargs)
+            span = tracer.start_span(name)
+            try:
+                while True:
+                    with tracer.use_span(span):
+                        try:
+                            item = next(iterator)
+                        except StopIteration:
+                            return
+                    yield item
+            finally:
+                # if the iteration is abandoned, run the cleanup of the
+                # generator now rather than when it is garbage collected
+                with tracer.use_span(span):
+                    iterator.close()
+                span.end()
+
+        return traced_generator  # type: ignore[return-value]
+
+    @functools.wraps(func)
+    def traced_function(self, *args, **kwargs) -> Any:
+        with self.tracer.span(name):
+            return func(self, *args, **kwargs)
+
+    return traced_function  # type: ignore[return-value]